@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up. The event stream is a plain ASGI app as
+# Django 4.1 cannot stream responses asynchronously.
+from sales.events import STREAM_PATH, vehicle_state_stream  # pylint: disable=wrong-import-position
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        await vehicle_state_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,204 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _generation_key(name):
+    return f'generation:{name}'
+
+
+def get_generation(name):
+    """Return the current generation number for ``name``.
+
+    Generations are the building block for invalidation: anything cached
+    under a generation is dropped by bumping it. A missing generation is
+    seeded from the clock so it never repeats one that has been evicted.
+    """
+    return cache.get_or_set(
+        _generation_key(name),
+        time.time_ns,
+        settings.GENERATION_TIMEOUT
+    )
+
+
+def bump_generation(name):
+    try:
+        cache.incr(_generation_key(name))
+    except ValueError:
+        cache.set(
+            _generation_key(name),
+            time.time_ns(),
+            settings.GENERATION_TIMEOUT
+        )
+
+
+class GenerationCache:
+    """Per-process copy of data kept until the ``generation_name``
+    generation moves.
+
+    Subclasses read the data in ``load``. ``refresh`` returns the copy,
+    loading it again first if another process bumped the generation, so
+    every process sharing the cache sees a change on its next use.
+    """
+    generation_name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._value = None
+
+    def load(self):
+        raise NotImplementedError
+
+    def refresh(self):
+        generation = get_generation(self.generation_name)
+        if generation != self._generation:
+            with self._lock:
+                if generation != self._generation:
+                    self._value = self.load()
+                    self._generation = generation
+        return self._value
+
+    def invalidate(self):
+        bump_generation(self.generation_name)
+
+    def changed(self):
+        """Invalidate every copy for a change made in the current
+        transaction.
+
+        A process reloading before the commit would keep the old data, so
+        the generation moves again once the change is visible to all.
+        """
+        self.invalidate()
+        transaction.on_commit(self.invalidate)
+
+
+def invalidate_responses(namespace, *lookups):
+    """Drop every cached list response of ``namespace`` and the detail
+    responses of the given lookups.
+
+    The generations are bumped straight away and again once the current
+    transaction commits, so a request served in between cannot cache the
+    data as it was before the change.
+    """
+    names = [f'{namespace}:list'] + [
+        f'{namespace}:{lookup}' for lookup in lookups if lookup
+    ]
+
+    def bump():
+        for name in names:
+            bump_generation(name)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+class CachedResponseMixin:
+    """Serve successful GET responses from the cache.
+
+    Responses are keyed on the absolute path and the normalised query
+    parameters. List and detail responses are cached under separate
+    generations of ``cache_namespace``, see ``invalidate_responses``.
+
+    Responses carry a strong ETag and Last-Modified derived from the
+    ``updated_at`` column of the model, and conditional requests are
+    answered with a 304 from the cached validators or, on a cold cache,
+    from a single lookup of ``updated_at`` without serializing anything.
+    """
+    cache_namespace = None
+    last_modified_field = 'updated_at'
+
+    def get_response_cache_key(self, request, **kwargs):
+        lookup = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        scope = 'list' if lookup is None else lookup
+        generation = get_generation(f'{self.cache_namespace}:{scope}')
+        params = sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+        )
+        url = f'{request.build_absolute_uri(request.path)}?{params}'
+        digest = hashlib.md5(
+            f'{scope}:{generation}:{url}'.encode('utf-8')).hexdigest()
+        return f'response:{self.cache_namespace}:{digest}'
+
+    def get_validators(self, request, **kwargs):
+        """Return the ETag and Last-Modified timestamp of the response, or
+        None when the object being looked up does not exist."""
+        queryset = self.get_queryset().prefetch_related(None)
+        lookup = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if lookup is None:
+            # Any saved row moves the newest timestamp of the whole table,
+            # which the index answers without counting the list. Deletions
+            # are caught by the list generation.
+            state = queryset.model._default_manager.aggregate(
+                last_modified=Max(self.last_modified_field)
+            )
+            state['generation'] = get_generation(
+                f'{self.cache_namespace}:list')
+        else:
+            state = queryset.filter(**{self.lookup_field: lookup}).values(
+                'pk',
+                last_modified=F(self.last_modified_field)
+            ).first()
+            if state is None:
+                return None
+        last_modified = state['last_modified']
+        digest = hashlib.md5(
+            f'{request.get_full_path()}:{request.accepted_media_type}:'
+            f'{sorted(state.items())}'.encode('utf-8')
+        ).hexdigest()
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+        return quote_etag(digest), last_modified
+
+    def not_modified(self, request, etag, last_modified):
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified
+        )
+        if response is not None:
+            self.set_validator_headers(response, etag, last_modified)
+        return response
+
+    def set_validator_headers(self, response, etag, last_modified):
+        response.headers['ETag'] = etag
+        if last_modified is not None:
+            response.headers['Last-Modified'] = http_date(last_modified)
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_response_cache_key(request, **kwargs)
+        entry = cache.get(key)
+        if entry is not None:
+            etag, last_modified = entry['validators']
+            not_modified = self.not_modified(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+            response = Response(entry['data'])
+        else:
+            validators = self.get_validators(request, **kwargs)
+            if validators is not None:
+                etag, last_modified = validators
+                not_modified = self.not_modified(request, etag, last_modified)
+                if not_modified is not None:
+                    return not_modified
+            response = super().get(request, *args, **kwargs)
+            if (response.status_code != status.HTTP_200_OK or
+                    validators is None):
+                return response
+            cache.set(
+                key,
+                {'data': response.data, 'validators': validators},
+                settings.RESPONSE_CACHE_TIMEOUT
+            )
+        self.set_validator_headers(response, etag, last_modified)
+        return response
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register  # pylint: disable=redefined-builtin
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when the default cache is private to each process.
+
+    Cache generations carry invalidation between processes: the cached
+    responses, the vehicle status map, the similarity index and the
+    reservation amount of every other worker would go stale. Development
+    servers run a single process, so DEBUG skips the check.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend not in LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f'The default cache, {backend}, is not shared between '
+            'processes, so changes made in one worker are not seen by '
+            'the others.',
+            hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared cache '
+                 'such as memcached or Redis, or silence backend.W001 if '
+                 'only one process serves the API.',
+            id='backend.W001',
+        )
+    ]
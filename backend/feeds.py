@@ -0,0 +1,276 @@
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+
+from gallery.models import GalleryItem
+from sales.models import FeedUpdate, Vehicle, VehicleImages
+
+from .media import serve_file
+
+# Published documents, and the entries they are assembled from.
+DOCUMENTS = ('sitemap.xml', 'stock.xml', 'stock.json')
+ENTRIES_NAME = 'entries.json'
+LOCK_NAME = '.lock'
+# Queued updates applied with each rewrite of the documents.
+BATCH_SIZE = 1000
+# Website pages of vehicles and gallery items.
+VEHICLE_PATH = '/vehicles/{slug}/'
+GALLERY_PATH = '/gallery/{slug}/'
+# Vehicles listed in the stock feed, as on the website.
+LISTED_STATES = (Vehicle.Reserve.FOR_SALE, Vehicle.Reserve.RESERVED)
+FEED_FIELDS = (
+    'make',
+    'model',
+    'trim',
+    'year',
+    'fuel',
+    'body_type',
+    'mileage',
+    'engine_size',
+    'mot_expiry',
+    'price',
+    'reserved',
+)
+CHOICE_FIELDS = ('fuel', 'body_type', 'reserved')
+
+SITEMAP_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+)
+
+
+def sitemap_url(location, updated_at):
+    return (
+        f'<url><loc>{escape(location)}</loc>'
+        f'<lastmod>{updated_at.date().isoformat()}</lastmod></url>'
+    )
+
+
+def feed_item_xml(item):
+    elements = ''.join(
+        f'<{name}>{escape(str(value))}</{name}>'
+        for name, value in item.items() if name != 'images'
+    )
+    images = ''.join(
+        f'<image>{escape(url)}</image>' for url in item['images'])
+    return f'<vehicle>{elements}<images>{images}</images></vehicle>'
+
+
+def vehicle_entries(pks=None):
+    """Yield ``(key, entry)`` for published vehicles, all of them or those
+    in ``pks``, and ``(key, None)`` for the ``pks`` that are not."""
+    vehicles = Vehicle.objects.filter(published=True).order_by('pk')
+    if pks is not None:
+        vehicles = vehicles.filter(pk__in=pks)
+    storage = VehicleImages._meta.get_field('image').storage  # pylint: disable=protected-access
+    images = {}
+    for vehicle_id, name in VehicleImages.objects.filter(
+        vehicle__in=vehicles
+    ).order_by('pk').values_list('vehicle_id', 'image'):
+        images.setdefault(vehicle_id, []).append(
+            settings.API_URL + storage.url(name))
+    labels = {
+        name: {
+            value: str(label).strip()
+            for value, label in Vehicle._meta.get_field(name).choices  # pylint: disable=protected-access
+        }
+        for name in CHOICE_FIELDS
+    }
+
+    found = set()
+    for row in vehicles.values('pk', 'slug', 'updated_at', *FEED_FIELDS):
+        found.add(row['pk'])
+        url = settings.SITE_URL + VEHICLE_PATH.format(slug=row['slug'])
+        entry = {'sitemap': sitemap_url(url, row['updated_at'])}
+        if row['reserved'] in LISTED_STATES:
+            item = {'id': row['pk'], 'url': url}
+            for name in FEED_FIELDS:
+                value = row[name]
+                if name in labels:
+                    value = labels[name].get(value, value)
+                elif name in ('mot_expiry', 'price'):
+                    value = str(value)
+                item[name] = value
+            item['updated_at'] = row['updated_at'].isoformat()
+            item['images'] = images.get(row['pk'], [])
+            entry['json'] = item
+            entry['xml'] = feed_item_xml(item)
+        yield f'vehicle:{row["pk"]}', entry
+    for pk in set(pks or ()) - found:
+        yield f'vehicle:{pk}', None
+
+
+def gallery_entries(pks=None):
+    items = GalleryItem.objects.filter(published=True).order_by('pk')
+    if pks is not None:
+        items = items.filter(pk__in=pks)
+    found = set()
+    for pk, slug, updated_at in items.values_list('pk', 'slug', 'updated_at'):
+        found.add(pk)
+        url = settings.SITE_URL + GALLERY_PATH.format(slug=slug)
+        yield f'gallery:{pk}', {'sitemap': sitemap_url(url, updated_at)}
+    for pk in set(pks or ()) - found:
+        yield f'gallery:{pk}', None
+
+
+SOURCES = {
+    Vehicle: vehicle_entries,
+    GalleryItem: gallery_entries,
+}
+
+
+def entry_order(key):
+    source, pk = key.split(':')
+    return source, int(pk)
+
+
+@contextlib.contextmanager
+def locked():
+    """Hold the lock that serializes every process writing the feeds."""
+    os.makedirs(settings.FEEDS_ROOT, exist_ok=True)
+    with open(os.path.join(settings.FEEDS_ROOT, LOCK_NAME), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def write_file(name, content):
+    # Readers see the previous file until the new one is complete.
+    with tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', dir=settings.FEEDS_ROOT, delete=False
+    ) as file:
+        file.write(content)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, os.path.join(settings.FEEDS_ROOT, name))
+
+
+def load_entries():
+    try:
+        with open(
+            os.path.join(settings.FEEDS_ROOT, ENTRIES_NAME), encoding='utf-8'
+        ) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def write_documents(entries):
+    """Save ``entries`` and assemble the documents from them, which takes
+    no database queries."""
+    write_file(ENTRIES_NAME, json.dumps(entries))
+    entries = [entries[key] for key in sorted(entries, key=entry_order)]
+    listed = [entry for entry in entries if 'json' in entry]
+    updated_at = timezone.now().isoformat()
+    write_file('sitemap.xml', '\n'.join([
+        SITEMAP_HEADER,
+        *(entry['sitemap'] for entry in entries),
+        '</urlset>\n',
+    ]))
+    write_file('stock.xml', '\n'.join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<stock updated_at="{updated_at}">',
+        *(entry['xml'] for entry in listed),
+        '</stock>\n',
+    ]))
+    write_file('stock.json', json.dumps({
+        'updated_at': updated_at,
+        'vehicles': [entry['json'] for entry in listed],
+    }))
+
+
+def build_entries():
+    entries = {}
+    for source in SOURCES.values():
+        entries.update(source())
+    return entries
+
+
+def rebuild():
+    """Build the sitemap and stock feeds from every row."""
+    with locked():
+        write_documents(build_entries())
+
+
+def update(changes):
+    """Render the entries of the rows in ``changes``, ``{model: pks}``,
+    again and rewrite the documents once. Nothing is done until the feeds
+    have been built."""
+    if load_entries() is None:
+        return
+    with locked():
+        entries = load_entries()
+        if entries is None:
+            return
+        for model, pks in changes.items():
+            for key, entry in SOURCES[model](pks):
+                if entry is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = entry
+        write_documents(entries)
+
+
+def schedule_update(model, *pks):
+    """Queue the entries of ``pks`` for the update_feeds worker, in the
+    transaction changing the rows."""
+    if model not in SOURCES:
+        return
+    FeedUpdate.objects.bulk_create([
+        FeedUpdate(model=model._meta.label, object_id=pk)  # pylint: disable=protected-access
+        for pk in pks if pk is not None
+    ])
+
+
+def update_batch(batch_size=BATCH_SIZE):
+    """Apply up to ``batch_size`` queued updates with a single rewrite of
+    the documents and return how many were applied.
+
+    The queued rows stay locked until the documents are written and are
+    deleted in the same transaction, so a batch another worker has taken
+    is skipped and a failed batch is applied again.
+    """
+    with transaction.atomic():
+        queued = list(FeedUpdate.objects.select_for_update(
+            skip_locked=True)[:batch_size])
+        changes = {}
+        for change in queued:
+            changes.setdefault(
+                apps.get_model(change.model), set()).add(change.object_id)
+        if changes:
+            update({model: sorted(pks) for model, pks in changes.items()})
+        FeedUpdate.objects.filter(
+            pk__in=[change.pk for change in queued]).delete()
+    return len(queued)
+
+
+def update_pending(batch_size=BATCH_SIZE):
+    """Apply every queued update and return how many there were."""
+    count = 0
+    while True:
+        applied = update_batch(batch_size)
+        count += applied
+        if applied < batch_size:
+            return count
+
+
+@require_safe
+def serve_feed(request, name):
+    """Serve a document from FEEDS_ROOT, building the feeds first if this
+    is the first request since they were deployed."""
+    if name not in DOCUMENTS:
+        raise Http404('No such feed.')
+    path = os.path.join(settings.FEEDS_ROOT, name)
+    if not os.path.exists(path):
+        with locked():
+            if not os.path.exists(path):
+                write_documents(load_entries() or build_entries())
+    return serve_file(request, settings.FEEDS_ROOT, name)
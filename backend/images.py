@@ -0,0 +1,339 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import invalidate_responses
+from .storage import ContentAddressedStorage
+
+# Rendition sizes by name and the width they are scaled down to.
+RENDITIONS = (
+    ('thumbnail', 320),
+    ('medium', 800),
+    ('large', 1600),
+)
+# Output formats as (key, Pillow format, file extension).
+FORMATS = (
+    ('jpeg', 'JPEG', 'jpg'),
+    ('webp', 'WEBP', 'webp'),
+)
+QUALITY = 80
+# Quality uploads are re-encoded at.
+UPLOAD_QUALITY = 90
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class InvalidImage(ValueError):
+    """Raised for an uploaded file Pillow cannot read as an image."""
+
+
+def rendition_name(name, size, extension):
+    stem, _ = os.path.splitext(name)
+    return f'renditions/{stem}-{size}.{extension}'
+
+
+def render_renditions(image):
+    """Encode scaled down copies of an RGB ``image``.
+
+    Returns ``{size: {'width': ..., 'jpeg': bytes, 'webp': bytes}}``.
+    Images are never scaled up, so a size that would come out as wide as
+    the one before it is left out.
+    """
+    renditions = {}
+    previous_width = None
+    for size, width in RENDITIONS:
+        width = min(width, image.width)
+        if width == previous_width:
+            continue
+        previous_width = width
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        renditions[size] = {'width': width}
+        for key, image_format, _ in FORMATS:
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=QUALITY)
+            renditions[size][key] = buffer.getvalue()
+    return renditions
+
+
+def save_renditions(storage, name, rendered):
+    """Save the output of ``render_renditions`` for the image ``name`` and
+    return the renditions with file names in place of the data."""
+    renditions = {}
+    for size, rendition in rendered.items():
+        renditions[size] = {'width': rendition['width']}
+        for key, _, extension in FORMATS:
+            renditions[size][key] = storage.save(
+                rendition_name(name, size, extension),
+                ContentFile(rendition[key])
+            )
+    return renditions
+
+
+def generate_renditions(storage, name):
+    """Write the renditions of the image ``name`` to ``storage`` and return
+    them as ``{size: {'width': ..., 'jpeg': name, 'webp': name}}``. Files
+    Pillow cannot read get no renditions."""
+    largest = RENDITIONS[-1][1]
+    try:
+        with storage.open(name) as file, Image.open(file) as original:
+            # Lets the JPEG decoder skip detail the largest size drops.
+            original.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(original).convert('RGB')
+    except OSError:
+        return {}
+    return save_renditions(storage, name, render_renditions(image))
+
+
+def delete_renditions(storage, renditions):
+    for rendition in renditions.values():
+        for key, _, _ in FORMATS:
+            if key in rendition:
+                storage.delete(rendition[key])
+
+
+def regenerate_renditions(model_label, field_name, name, renditions):
+    """Replace ``renditions`` of an image of ``model_label``. Takes plain
+    values so it can run in a worker process."""
+    model = apps.get_model(model_label)
+    storage = model._meta.get_field(field_name).storage  # pylint: disable=protected-access
+    generated = generate_renditions(storage, name)
+    # A content addressed storage gives the new renditions the same names.
+    kept = {
+        rendition[key] for rendition in generated.values()
+        for key, _, _ in FORMATS
+    }
+    delete_renditions(storage, {
+        size: {key: value for key, value in rendition.items()
+               if key != 'width' and value not in kept}
+        for size, rendition in renditions.items()
+    })
+    return generated
+
+
+def remember_file(instance, field_name='image'):
+    """Record the file and renditions an image has before it is saved, so
+    ``store_renditions`` can tell when the file is replaced."""
+    instance.previous_file = None
+    instance.previous_renditions = {}
+    if instance.pk:
+        row = type(instance).objects.filter(pk=instance.pk).values_list(
+            field_name, 'renditions').first()
+        if row is not None:
+            instance.previous_file, instance.previous_renditions = row
+
+
+def file_replaced(instance, field_name='image'):
+    previous = getattr(instance, 'previous_file', None)
+    return previous is not None and \
+        previous != getattr(instance, field_name).name
+
+
+def store_renditions(instance, field_name='image'):
+    """Generate the renditions of a saved image and record them without
+    sending another save signal. Those of a file the image was saved in
+    place of are discarded."""
+    file = getattr(instance, field_name)
+    if file_replaced(instance, field_name):
+        discard_unused_renditions(
+            file.storage, instance.previous_file,
+            instance.previous_renditions
+        )
+        instance.previous_file = file.name
+        instance.renditions = {}
+    if file:
+        # Images sharing a content addressed file share its renditions.
+        instance.renditions = type(instance).objects.filter(
+            **{field_name: file.name}
+        ).exclude(pk=instance.pk).exclude(renditions={}).values_list(
+            'renditions', flat=True
+        ).first() or generate_renditions(file.storage, file.name)
+    type(instance).objects.filter(pk=instance.pk).update(
+        renditions=instance.renditions
+    )
+
+
+def discard_files(storage, name, renditions):
+    """Delete the image ``name`` and its ``renditions`` unless a row refers
+    to the image."""
+    if not isinstance(storage, ContentAddressedStorage):
+        storage.delete(name)
+        delete_renditions(storage, renditions)
+        return
+    with transaction.atomic():
+        storage.lock(name)
+        if not storage.is_referenced(name):
+            storage.delete(name)
+            delete_renditions(storage, renditions)
+
+
+def discard_unused_renditions(storage, name, renditions):
+    """Delete the ``renditions`` of the file ``name`` once the transaction
+    commits, unless an image still refers to the file."""
+
+    def delete():
+        # Renditions of a file another image still refers to are its too.
+        if not isinstance(storage, ContentAddressedStorage):
+            delete_renditions(storage, renditions)
+            return
+        with transaction.atomic():
+            storage.lock(name)
+            if not storage.is_referenced(name):
+                delete_renditions(storage, renditions)
+
+    transaction.on_commit(delete)
+
+
+def discard_renditions(instance, field_name='image'):
+    """Delete the renditions of a deleted image once the deletion is
+    committed, as django_cleanup does for the original."""
+    file = getattr(instance, field_name)
+    discard_unused_renditions(file.storage, file.name, instance.renditions)
+
+
+def process_upload(source):
+    """Verify an uploaded image, apply its EXIF orientation and re-encode it
+    as a JPEG without metadata, then render its renditions.
+
+    ``source`` is the upload's bytes or the path of its temporary file.
+    This runs in a worker process, so it only takes and returns plain
+    values: the JPEG data and the output of ``render_renditions``.
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    try:
+        with Image.open(source) as image:
+            image.verify()
+        if isinstance(source, BytesIO):
+            source.seek(0)
+        # verify() leaves the image unusable, so it is opened again.
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original).convert('RGB')
+    except (OSError, SyntaxError, ValueError,
+            Image.DecompressionBombError) as error:
+        raise InvalidImage(str(error)) from error
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=UPLOAD_QUALITY)
+    return buffer.getvalue(), render_renditions(image)
+
+
+def get_pool():
+    """Return the pool uploads are processed in, started on first use.
+
+    Workers are spawned rather than forked, as forking a threaded web
+    server process is unsafe.
+    """
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def process_uploads(files):
+    """Process uploaded files in parallel with ``process_upload``.
+
+    Returns ``[(file name, data, rendered)]`` in the order of ``files`` and
+    raises InvalidImage naming the first file that is not an image.
+    """
+    if not files:
+        return []
+    pool = get_pool()
+    futures = []
+    for file in files:
+        if hasattr(file, 'temporary_file_path'):
+            source = file.temporary_file_path()
+        else:
+            file.seek(0)
+            source = file.read()
+        futures.append(pool.submit(process_upload, source))
+    uploads = []
+    for file, future in zip(files, futures):
+        try:
+            data, rendered = future.result()
+        except InvalidImage as error:
+            raise InvalidImage(f'{file.name} is not a valid image.') from error
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+        uploads.append((file.name, data, rendered))
+    return uploads
+
+
+def create_images(model, parent, uploads, namespace, field_name='image'):
+    """Save the output of ``process_uploads`` as images of ``parent``,
+    inserting their rows with a single ``bulk_create``.
+
+    bulk_create sends no signals, so the audit log entries of the images,
+    the parent's ``updated_at``, its cached responses under ``namespace``
+    and its feed entries are written here. Files stored for images that
+    fail to insert are deleted again.
+    """
+    if not uploads:
+        return []
+    field = model._meta.get_field(field_name)  # pylint: disable=protected-access
+    parent_field = next(
+        relation for relation in model._meta.concrete_fields  # pylint: disable=protected-access
+        if relation.is_relation and isinstance(parent, relation.related_model)
+    )
+    # Upload workers import this module without loading the apps, which
+    # the audit log and the feeds need.
+    from auditlog.receivers import log_create  # pylint: disable=import-outside-toplevel
+    from auditlog.registry import auditlog  # pylint: disable=import-outside-toplevel
+    from .feeds import schedule_update  # pylint: disable=import-outside-toplevel
+    images = []
+    stored = []
+    try:
+        # The files are saved in the transaction inserting the rows, which
+        # keeps a concurrent delete of the same content from removing them.
+        with transaction.atomic():
+            for filename, data, rendered in uploads:
+                stem, _ = os.path.splitext(os.path.basename(filename))
+                name = field.storage.save(
+                    field.generate_filename(None, f'{stem}.jpg'),
+                    ContentFile(data)
+                )
+                stored.append((name, {}))
+                renditions = save_renditions(field.storage, name, rendered)
+                stored[-1] = (name, renditions)
+                images.append(model(**{
+                    parent_field.name: parent,
+                    field_name: name,
+                    'renditions': renditions,
+                }))
+            images = model.objects.bulk_create(images)
+            if auditlog.contains(model):
+                for image in images:
+                    log_create(model, image, created=True)
+    except Exception:
+        for name, renditions in stored:
+            discard_files(field.storage, name, renditions)
+        raise
+    type(parent).objects.filter(pk=parent.pk).update(
+        updated_at=timezone.now()
+    )
+    invalidate_responses(namespace, parent.slug)
+    schedule_update(type(parent), parent.pk)
+    return images
@@ -0,0 +1,154 @@
+import datetime
+import logging
+import smtplib
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.mail.message import sanitize_address
+from django.db import transaction
+from django.utils import timezone
+
+from mail.models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+# A failed email is retried after a minute, doubling up to an hour, and
+# given up on after MAX_ATTEMPTS.
+MAX_ATTEMPTS = 10
+RETRY_DELAY = datetime.timedelta(minutes=1)
+MAX_RETRY_DELAY = datetime.timedelta(hours=1)
+BATCH_SIZE = 100
+# How long a worker has to send the emails it claimed before another may.
+LEASE = datetime.timedelta(minutes=10)
+
+
+class OutboxBackend(BaseEmailBackend):
+    """Email backend that stores messages in the outbox.
+
+    Nothing is sent in the request: the messages are rows written in the
+    caller's transaction, so they are only sent if it commits. The
+    send_emails worker delivers them with ``send_outbox``.
+    """
+
+    def send_messages(self, email_messages):
+        emails = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            encoding = message.encoding or settings.DEFAULT_CHARSET
+            emails.append(OutgoingEmail(
+                from_email=sanitize_address(message.from_email, encoding),
+                recipients=[
+                    sanitize_address(address, encoding)
+                    for address in message.recipients()
+                ],
+                subject=message.subject[:255],
+                message=message.message().as_bytes(linesep='\r\n')
+            ))
+        OutgoingEmail.objects.bulk_create(emails)
+        return len(emails)
+
+
+class SMTPSender(EmailBackend):
+    """The SMTP backend, sending stored messages as they are."""
+
+    def send_email(self, email):
+        self.open()
+        self.connection.sendmail(
+            email.from_email, email.recipients, bytes(email.message))
+
+
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def claim_batch(batch_size):
+    """Lease up to ``batch_size`` due emails to this worker for LEASE.
+
+    The rows are only locked while the lease is taken, so no transaction
+    stays open while talking to the SMTP server. Emails a crashed worker
+    leased are sent again once the lease runs out.
+    """
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            next_attempt_at__lte=timezone.now()
+        ).order_by('id')[:batch_size])
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]) \
+            .update(next_attempt_at=timezone.now() + LEASE)
+    return emails
+
+
+def record(email, error=None, counted=True):
+    """Save the outcome of sending ``email``. An email that could not be
+    tried because the server was unreachable keeps its attempts."""
+    if counted:
+        email.attempts += 1
+    if error is None:
+        email.sent_at = timezone.now()
+        email.next_attempt_at = None
+        email.last_error = ''
+    else:
+        email.last_error = f'{type(error).__name__}: {error}'
+        email.next_attempt_at = None
+        if email.attempts < MAX_ATTEMPTS:
+            email.next_attempt_at = timezone.now() + \
+                retry_delay(max(email.attempts, 1))
+    email.save(update_fields=[
+        'attempts', 'sent_at', 'next_attempt_at', 'last_error'])
+
+
+def send_batch(batch_size=BATCH_SIZE):
+    """Send up to ``batch_size`` due emails over a single SMTP connection
+    and return how many were claimed.
+
+    An email the server rejects is retried later. Once the connection
+    fails, the rest of the batch is put off without using up attempts,
+    so an outage never makes emails be given up on.
+    """
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0
+    sender = SMTPSender()
+    connection_error = None
+    try:
+        sender.open()
+    except OSError as error:
+        logger.exception('Could not connect to the SMTP server.')
+        connection_error = error
+    try:
+        for email in emails:
+            if connection_error is not None:
+                record(email, connection_error, counted=False)
+                continue
+            try:
+                sender.send_email(email)
+            except (smtplib.SMTPResponseException,
+                    smtplib.SMTPRecipientsRefused) as error:
+                logger.warning('The SMTP server rejected email %s: %s',
+                               email.pk, error)
+                record(email, error)
+            except OSError as error:
+                logger.exception('Could not send email %s.', email.pk)
+                connection_error = error
+                record(email, error)
+            else:
+                record(email)
+    finally:
+        try:
+            sender.close()
+        except OSError:
+            pass
+    return len(emails)
+
+
+def send_outbox(batch_size=BATCH_SIZE):
+    """Send every email that is due and return how many were attempted."""
+    count = 0
+    while True:
+        sent = send_batch(batch_size)
+        count += sent
+        if sent < batch_size:
+            return count
@@ -0,0 +1,154 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .storage import image_storage
+
+# Content addressed files never change, so clients may keep them for a
+# year without asking again. Other files are revalidated on every use.
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+BYTE_RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+class FileRange:
+    """Read ``length`` bytes of ``file`` from ``start``.
+
+    It keeps the file's ``fileno()``, so a WSGI server's file wrapper can
+    still send the range with ``os.sendfile``, using the current position
+    and the response's Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` of a single byte range in a Range header,
+    or None to send the whole file. Raises ValueError for a range that is
+    outside the file."""
+    match = BYTE_RANGE.fullmatch(header or '')
+    if match is None:
+        # Missing, malformed and multiple ranges get the whole file.
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        length = int(end)
+        if not length or not size:
+            raise ValueError('An empty suffix range is not satisfiable.')
+        return max(0, size - length), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise ValueError('The range starts after the end of the file.')
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+def send_file(request, full_path, size, validators, accel_path=None):
+    content_type, _ = mimetypes.guess_type(full_path)
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == 'x-accel-redirect' and accel_path:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_path
+        return response
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or if_range in validators:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    start, end = byte_range or (0, size - 1)
+    response = FileResponse(
+        FileRange(open(full_path, 'rb'), start, end - start + 1),  # pylint: disable=consider-using-with
+        content_type=content_type or 'application/octet-stream'
+    )
+    response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def serve_file(request, root, path, accel_prefix=None):
+    """Serve the file ``path`` under the directory ``root``.
+
+    Depending on ``MEDIA_SERVE_MODE`` the file is handed to nginx with
+    X-Accel-Redirect, when ``root`` has an internal location at
+    ``accel_prefix``, to Apache or lighttpd with X-Sendfile, or sent by
+    Django with support for a single byte range.
+    """
+    try:
+        full_path = safe_join(root, path)
+        status = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError) as error:
+        raise Http404('The file does not exist.') from error
+    if not stat.S_ISREG(status.st_mode):
+        raise Http404('The file does not exist.')
+
+    etag = quote_etag(f'{status.st_mtime_ns:x}-{status.st_size:x}')
+    last_modified = int(status.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = send_file(
+            request,
+            full_path,
+            status.st_size,
+            (etag, http_date(last_modified)),
+            accel_prefix and accel_prefix + quote(path)
+        )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = REVALIDATE
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve a file under MEDIA_ROOT, see ``serve_file``."""
+    response = serve_file(
+        request,
+        settings.MEDIA_ROOT,
+        path,
+        settings.MEDIA_ACCEL_REDIRECT_PREFIX
+    )
+    if image_storage.is_content_name(path):
+        response['Cache-Control'] = IMMUTABLE
+    return response
@@ -0,0 +1,244 @@
+# pylint: disable=protected-access
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class SrcsetField(serializers.ReadOnlyField):
+    """The renditions of an image as ``srcset`` strings by format, e.g.
+    ``{'webp': '.../a-thumbnail.webp 320w, .../a-medium.webp 800w'}``."""
+
+    def __init__(self, image_field='image', **kwargs):
+        self.image_field = image_field
+        kwargs.setdefault('source', 'renditions')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        storage = self.parent.Meta.model._meta.get_field(
+            self.image_field).storage
+        request = self.context.get('request')
+        srcset = {}
+        # jsonb does not keep the order of keys.
+        for rendition in sorted(value.values(), key=lambda r: r['width']):
+            for key, name in rendition.items():
+                if key == 'width':
+                    continue
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                srcset.setdefault(key, []).append(
+                    f'{url} {rendition["width"]}w')
+        return {key: ', '.join(urls) for key, urls in srcset.items()}
+
+
+class SparseFieldsetMixin:
+    """Let read requests choose the fields they get back.
+
+    ``?fields=id,slug,make`` limits the representation to the named
+    fields, and ``?expand=images`` adds back relations listed in
+    ``expandable_fields``, which are left out whenever ``fields`` is given.
+    Without ``fields`` the full representation is returned.
+    """
+    # Maps an expandable field to the lookup used to prefetch it.
+    expandable_fields = {}
+
+    def get_requested_fields(self):
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        fields = request.query_params.get('fields')
+        if not fields:
+            return None
+        requested = {name.strip() for name in fields.split(',')}
+        expand = {
+            name.strip() for name
+            in request.query_params.get('expand', '').split(',')
+        }
+        return requested | (expand & set(self.expandable_fields))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.get_requested_fields()
+        if requested is None:
+            return fields
+        return OrderedDict(
+            (name, field) for name, field in fields.items()
+            if name in requested
+        )
+
+    def restrict_queryset(self, queryset):
+        """Load only the columns and relations the requested fields use."""
+        if self.get_requested_fields() is None:
+            return queryset
+        model = self.Meta.model
+        columns = {model._meta.pk.name}
+        prefetches = []
+        for name, field in self.fields.items():
+            if name in self.expandable_fields:
+                prefetches.append(self.expandable_fields[name])
+                continue
+            source = field.source
+            if source.startswith('get_') and source.endswith('_display'):
+                source = source[len('get_'):-len('_display')]
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete:
+                columns.add(model_field.name)
+        return queryset.prefetch_related(None).prefetch_related(
+            *prefetches).only(*columns)
+
+
+class SparseFieldsetViewMixin:
+    """Narrow the queryset to what a ``SparseFieldsetMixin`` serializer
+    will read for this request."""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return self.get_serializer().restrict_queryset(queryset)
+
+
+class ValuesSerializerMixin:
+    """Read-only serialization straight from ``values()`` rows.
+
+    The serializer's fields are compiled once into a plan of database
+    columns and converters: choice labels come from lookup tables built
+    from the model field choices, files are turned into URLs from their
+    names, and everything else goes through the field's
+    ``to_representation``. Relations listed in ``expandable_fields`` are
+    loaded with one ``values()`` query per page. The output is the same as
+    ``serializer.data`` without creating model instances.
+    """
+    expandable_fields = {}
+    # Serializers to use for expandable fields that are not nested
+    # serializers, such as a SerializerMethodField.
+    expanded_serializers = {}
+
+    def get_values_plan(self):
+        if getattr(self, '_values_plan', None) is None:
+            model = self.Meta.model
+            columns = {model._meta.pk.attname}
+            plan = []
+            for name, field in self.fields.items():
+                if field.write_only:
+                    continue
+                if name in self.expandable_fields:
+                    plan.append((name, None, self._compile_relation(
+                        model, name, field)))
+                    continue
+                column, convert = self._compile_field(model, field)
+                columns.add(column)
+                plan.append((name, column, convert))
+            self._values_plan = columns, plan
+        return self._values_plan
+
+    def _compile_field(self, model, field):
+        source = field.source
+        if source.startswith('get_') and source.endswith('_display'):
+            model_field = model._meta.get_field(
+                source[len('get_'):-len('_display')])
+            labels = {
+                value: str(label) for value, label in model_field.flatchoices
+            }
+
+            def convert_choice(value):
+                label = labels.get(value, value)
+                if label is None:
+                    return None
+                return field.to_representation(label)
+            return model_field.attname, convert_choice
+
+        model_field = model._meta.get_field(source)
+        if isinstance(field, serializers.RelatedField):
+            return model_field.attname, lambda value: value
+        if isinstance(field, serializers.FileField):
+            return model_field.attname, self._compile_file(field, model_field)
+        return model_field.attname, field.to_representation
+
+    def _compile_file(self, field, model_field):
+        if not getattr(field, 'use_url',
+                       api_settings.UPLOADED_FILES_USE_URL):
+            return lambda name: name
+        storage = model_field.storage
+        request = field.context.get('request')
+
+        def convert_file(name):
+            if not name:
+                return None
+            url = storage.url(name)
+            if request is not None:
+                return request.build_absolute_uri(url)
+            return url
+        return convert_file
+
+    def _compile_relation(self, model, name, field):
+        accessor = self.expandable_fields[name]
+        relation = next(
+            related for related in model._meta.related_objects
+            if related.get_accessor_name() == accessor
+        )
+        if name in self.expanded_serializers:
+            child = self.expanded_serializers[name]()
+        else:
+            child = field.child
+        return relation, child
+
+    def get_values_queryset(self, queryset):
+        columns, _ = self.get_values_plan()
+        return queryset.prefetch_related(None).values(*columns)
+
+    def serialize_values(self, rows):
+        """Return the representation of ``rows`` from
+        ``get_values_queryset``."""
+        _, plan = self.get_values_plan()
+        rows = list(rows)
+        pk_name = self.Meta.model._meta.pk.attname
+        pks = [row[pk_name] for row in rows]
+        related = {
+            name: self._fetch_related(*convert, pks)
+            for name, column, convert in plan if column is None
+        }
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert in plan:
+                if column is None:
+                    item[name] = related[name].get(row[pk_name], [])
+                    continue
+                value = row[column]
+                item[name] = None if value is None else convert(value)
+            data.append(item)
+        return data
+
+    def _fetch_related(self, relation, child, pks):
+        if not pks:
+            return {}
+        foreign_key = relation.field.attname
+        columns, _ = child.get_values_plan()
+        rows = list(relation.related_model._default_manager.filter(
+            **{f'{relation.field.name}__in': pks}
+        ).values(*columns, foreign_key))
+        grouped = {}
+        for row, item in zip(rows, child.serialize_values(rows)):
+            grouped.setdefault(row[foreign_key], []).append(item)
+        return grouped
+
+
+class ValuesListMixin:
+    """List view serializing pages with a ``ValuesSerializerMixin``
+    serializer."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        rows = serializer.get_values_queryset(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                serializer.serialize_values(page))
+        return Response(serializer.serialize_values(rows))
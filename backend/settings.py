@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'phonenumber_field',
     'rest_framework',
     'django_filters',
@@ -53,6 +54,7 @@ INSTALLED_APPS = [
     'business_admin',
     'sales',
     'gallery',
+    'mail',
     'rest_framework_simplejwt.token_blacklist',
     'drf_yasg',
     'django_cleanup.apps.CleanupConfig',
@@ -147,12 +149,60 @@ STATIC_URL = 'static/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+# How backend.media.serve_media sends files: 'django' streams them itself,
+# through os.sendfile where the WSGI server supports it, 'x-accel-redirect'
+# hands them to nginx and 'x-sendfile' to Apache or lighttpd.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+# The internal nginx location aliasing MEDIA_ROOT.
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get(
+    'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+# Public addresses of the website and of this API, for the absolute URLs
+# of documents built outside a request.
+SITE_URL = os.environ.get(
+    'SITE_URL', 'https://www.cheshirewestvehicles.co.uk')
+API_URL = os.environ.get('API_URL', 'http://localhost:8000')
+
+# The sitemap and stock feeds, see backend.feeds.
+FEEDS_ROOT = os.path.join(BASE_DIR, 'feeds')
+
+# Chunked photo uploads are assembled here before being attached.
+CHUNKED_UPLOAD_ROOT = os.path.join(BASE_DIR, 'uploads')
+CHUNKED_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+# Uploads not finalized this long after they started are deleted by the
+# expire_uploads command.
+CHUNKED_UPLOAD_EXPIRY = timedelta(days=1)
+
+# Processes used to verify and re-encode uploaded photos.
+IMAGE_PROCESS_WORKERS = int(
+    os.environ.get('IMAGE_PROCESS_WORKERS', os.cpu_count() or 1)
+)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Invalidation reaches other worker processes through this cache, so it
+# must be shared when more than one serves the API, see backend.checks.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+GENERATION_TIMEOUT = 60 * 60 * 24
+
+# How long a vehicle is kept for a buyer who has started paying to reserve
+# it before anyone else may try.
+CHECKOUT_HOLD = timedelta(
+    minutes=int(os.environ.get('CHECKOUT_HOLD_MINUTES', 15)))
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 10,
@@ -193,12 +243,16 @@ DJOSER = {
 
 CORS_ALLOW_ALL_ORIGINS = True
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Emails are stored in an outbox with the changes they are about and sent
+# by the send_emails worker, over SMTP with the settings below.
+EMAIL_BACKEND = 'backend.mail.OutboxBackend'
 EMAIL_HOST = os.environ.get("EMAIL_HOST")
 EMAIL_HOST_USER = os.environ.get("EMAIL_USERNAME")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_PASSWORD")
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
+# Seconds before an unresponsive SMTP server is given up on.
+EMAIL_TIMEOUT = 30
 
 PHONENUMBER_DB_FORMAT = "NATIONAL"
 PHONENUMBER_DEFAULT_REGION = "GB"
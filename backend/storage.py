@@ -0,0 +1,119 @@
+# pylint: disable=protected-access
+import hashlib
+import os
+import re
+import tempfile
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.db.models import FileField
+
+HASH_READ_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that names files by the SHA-256 of their content.
+
+    Saving bytes that are already stored returns the existing name, so a
+    photo uploaded to several vehicles and gallery items is kept once and
+    its URL never changes content. Files are reference counted through the
+    file fields that use this storage: ``delete()`` leaves a file in place
+    while any row still refers to it, which lets django_cleanup delete
+    files as usual.
+
+    Saving and deleting a name take an advisory lock on it, shared by saves
+    and held until the saving transaction commits. A delete therefore waits
+    for the rows being saved with the content to become visible instead of
+    removing a file they are about to refer to. Outside a transaction the
+    lock is released at once, so files should be saved in the transaction
+    that inserts the rows referring to them.
+    """
+    directory = 'images'
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(HASH_READ_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return f'{self.directory}/{digest[:2]}/{digest}{extension}'
+
+    def is_content_name(self, name):
+        """Return whether ``name`` is one this storage gave a file."""
+        return re.fullmatch(
+            rf'{self.directory}/([0-9a-f]{{2}})/\1[0-9a-f]{{62}}(\.\w+)?',
+            name
+        ) is not None
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(
+            self.content_name(name, content), content, max_length)
+
+    def lock(self, name, shared=False):
+        """Take the advisory lock on ``name`` until the transaction ends."""
+        key = int(hashlib.sha256(name.encode()).hexdigest()[:15], 16)
+        function = 'pg_advisory_xact_lock_shared' if shared \
+            else 'pg_advisory_xact_lock'
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {function}(%s)', [key])
+
+    def get_available_name(self, name, max_length=None):
+        # A file stored under the name already has the same content.
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # The content is written under a temporary name and linked into
+        # place, so a file is never seen half written and concurrent saves
+        # of the same content leave the first one.
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+            for chunk in content.chunks():
+                file.write(chunk)
+        self.lock(name, shared=True)
+        try:
+            if self.file_permissions_mode is not None:
+                os.chmod(file.name, self.file_permissions_mode)
+            os.link(file.name, full_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(file.name)
+        return name
+
+    def referencing_fields(self):
+        """Yield ``(model, field)`` for the file fields that store files in
+        the same location as this storage."""
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if isinstance(field, FileField) and isinstance(
+                    field.storage, FileSystemStorage
+                ) and field.storage.location == self.location:
+                    yield model, field
+
+    def is_referenced(self, name):
+        return any(
+            model._base_manager.filter(**{field.name: name}).exists()
+            for model, field in self.referencing_fields()
+        )
+
+    def delete(self, name):
+        with transaction.atomic():
+            self.lock(name)
+            if not self.is_referenced(name):
+                super().delete(name)
+
+
+image_storage = ContentAddressedStorage()
+
+
+def get_image_storage():
+    return image_storage
@@ -1,11 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from .feeds import serve_feed
+from .media import serve_media
+
 SchemaView = get_schema_view(
     openapi.Info(
         title="Cheshire West Vehicle API",
@@ -22,5 +24,9 @@ urlpatterns = [
     path('api/sales/', include('sales.urls'), name="sales_urls"),
     path('api/gallery/', include('gallery.urls'), name="gallery_urls"),
     path('api/admin/', include('business_admin.urls'), name="admin_urls"),
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media,
+         name='media'),
+    path('sitemap.xml', serve_feed, {'name': 'sitemap.xml'}, name='sitemap'),
+    path('feeds/<str:name>', serve_feed, name='feeds'),
     path("", SchemaView.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
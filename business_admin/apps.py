@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BusinessAdminConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'business_admin'
+
+    def ready(self):
+        from . import signals  # pylint: disable=import-outside-toplevel,unused-import
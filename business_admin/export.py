@@ -0,0 +1,80 @@
+import csv
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from sales.models import Vehicle, VehicleImages
+
+from .stock import FIELDS
+
+# Columns of an export. It can be imported again, which ignores the
+# columns it does not know.
+EXPORT_FIELDS = ['slug', *FIELDS, 'reserved', 'updated_at']
+CHOICE_FIELDS = ('fuel', 'body_type', 'car_state', 'reserved')
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """A file-like object whose write() returns the value written, so
+    csv.writer can hand each line to a streaming response."""
+
+    def write(self, value):
+        return value
+
+
+def vehicle_rows(request, chunk_size=CHUNK_SIZE):
+    """Yield every vehicle as a dict of ``EXPORT_FIELDS`` with choices as
+    their labels and an ``images`` list of absolute image URLs.
+
+    Vehicles are read through a server-side cursor ``chunk_size`` rows at a
+    time and the images of each chunk are fetched with one query.
+    """
+    labels = {
+        name: {
+            value: str(label).strip()
+            for value, label in Vehicle._meta.get_field(name).choices  # pylint: disable=protected-access
+        }
+        for name in CHOICE_FIELDS
+    }
+    storage = VehicleImages._meta.get_field('image').storage  # pylint: disable=protected-access
+    vehicles = Vehicle.objects.order_by('pk').values(
+        'pk', *EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(vehicles, chunk_size))
+        if not chunk:
+            return
+        images = {}
+        for vehicle_id, name in VehicleImages.objects.filter(
+            vehicle_id__in=[vehicle['pk'] for vehicle in chunk]
+        ).order_by('pk').values_list('vehicle_id', 'image'):
+            images.setdefault(vehicle_id, []).append(
+                request.build_absolute_uri(storage.url(name)))
+        for vehicle in chunk:
+            for name, choices in labels.items():
+                vehicle[name] = choices.get(vehicle[name], vehicle[name])
+            vehicle['images'] = images.get(vehicle.pop('pk'), [])
+            yield vehicle
+
+
+def stream_csv(rows):
+    """Yield CSV lines for ``rows``, with the image URLs of a vehicle
+    separated by spaces."""
+    writer = csv.writer(Echo())
+    yield writer.writerow([*EXPORT_FIELDS, 'images'])
+    for row in rows:
+        yield writer.writerow(
+            [row[name] for name in EXPORT_FIELDS] + [' '.join(row['images'])]
+        )
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+# Export formats as (stream, content type, file extension).
+EXPORTERS = {
+    'csv': (stream_csv, 'text/csv', 'csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson', 'ndjson'),
+}
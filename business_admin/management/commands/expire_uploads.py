@@ -0,0 +1,49 @@
+import os
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from business_admin.models import UploadSession
+
+PART_NAME = re.compile(r'([0-9a-f-]{36})\.part')
+
+
+class Command(BaseCommand):
+    help = ('Delete chunked uploads that were not finalized within '
+            'CHUNKED_UPLOAD_EXPIRY, with their partial files, and partial '
+            'files left without an upload. Meant to be run periodically.')
+
+    def handle(self, *args, **options):
+        expired = timezone.now() - settings.CHUNKED_UPLOAD_EXPIRY
+        # Deleting them one at a time sends the signal removing their files.
+        sessions = 0
+        for session in UploadSession.objects.filter(
+            created_date__lt=expired
+        ).iterator():
+            session.delete()
+            sessions += 1
+
+        files = 0
+        try:
+            names = os.listdir(settings.CHUNKED_UPLOAD_ROOT)
+        except FileNotFoundError:
+            names = []
+        pending = {
+            str(upload_id) for upload_id in
+            UploadSession.objects.values_list('upload_id', flat=True)
+        }
+        for name in names:
+            match = PART_NAME.fullmatch(name)
+            path = os.path.join(settings.CHUNKED_UPLOAD_ROOT, name)
+            if match is None or match.group(1) in pending or \
+                    os.path.getmtime(path) >= expired.timestamp():
+                continue
+            os.remove(path)
+            files += 1
+        if sessions or files:
+            self.stdout.write(
+                f'Deleted {sessions} expired uploads and {files} stray '
+                f'partial files.'
+            )
@@ -0,0 +1,37 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from business_admin.stock import PARSERS, import_stock
+
+
+class Command(BaseCommand):
+    help = 'Import vehicles from a CSV or JSON stock feed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format',
+            choices=sorted(PARSERS),
+            help='Feed format, taken from the file extension by default.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        feed_format = options['format'] or \
+            os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if feed_format not in PARSERS:
+            raise CommandError(
+                'Could not tell the feed format, use --format.')
+        try:
+            with open(options['path'], 'rb') as file:
+                report = import_stock(
+                    PARSERS[feed_format](file),
+                    batch_size=options['batch_size']
+                )
+        except OSError as error:
+            raise CommandError(f'Could not read the feed: {error}') from error
+        self.stdout.write(json.dumps(report, indent=2))
+        if 'error' in report:
+            raise CommandError(report['error'])
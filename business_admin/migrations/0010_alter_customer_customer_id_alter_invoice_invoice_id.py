@@ -0,0 +1,47 @@
+# Generated by Django 4.1.4 on 2026-10-18 09:53
+
+import datetime
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    """Start each day's counters after the IDs already given out."""
+    counter = apps.get_model('sales', 'DailyCounter')
+    for model_name, field, kind in (
+        ('Customer', 'customer_id', 1),
+        ('Invoice', 'invoice_id', 2),
+    ):
+        model = apps.get_model('business_admin', model_name)
+        last = {}
+        for value in model.objects.filter(
+            **{f'{field}__regex': r'^[0-9]{7}'}
+        ).values_list(field, flat=True):
+            day = datetime.datetime.strptime(value[:6], '%y%m%d').date()
+            last[day] = max(last.get(day, 0), int(value[7:]))
+        counter.objects.bulk_create(
+            counter(day=day, kind=kind, value=value)
+            for day, value in last.items()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_admin', '0009_uploadsession'),
+        ('sales', '0012_dailycounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='customer_id',
+            field=models.CharField(blank=True, editable=False, max_length=12, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='invoice_id',
+            field=models.CharField(blank=True, editable=False, max_length=12, unique=True),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
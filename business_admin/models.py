@@ -1,5 +1,10 @@
-import datetime
 import decimal
+import fcntl
+import os
+import uuid
+from django.conf import settings
+from django.core.files import File
+from django.http import UnreadablePostError
 from django.utils import timezone
 from django.db.models import Sum
 from django.db import models
@@ -7,11 +12,15 @@ from django.db import models
 from auditlog.models import AuditlogHistoryField
 from auditlog.registry import auditlog
 from phonenumber_field.modelfields import PhoneNumberField
+from PIL import Image
+
+from gallery.models import GalleryImage, GalleryItem
+from sales.models import DailyCounter, Vehicle, VehicleImages
 
 
 class Customer(models.Model):
     customer_id = models.CharField(
-        max_length=10,
+        max_length=12,
         blank=True,
         unique=True,
         editable=False
@@ -31,22 +40,14 @@ class Customer(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.customer_id:
-            today = datetime.date.today()
-            today_string = today.strftime('%y%m%d')
-            next_customer_number = '001'
-            last_customer = Customer.objects.filter(
-                customer_id__startswith=today_string
-            ).order_by('customer_id').last()
-            if last_customer:
-                last_customer_number = int(last_customer.customer_id[7:])
-                next_customer_number = f"{last_customer_number + 1:03d}"
-            self.customer_id = f'{today_string}1{next_customer_number}'
+            self.customer_id = DailyCounter.next_id(
+                DailyCounter.Kind.CUSTOMER)
         super(Customer, self).save(*args, **kwargs)
 
 
 class Invoice(models.Model):
     invoice_id = models.CharField(
-        max_length=10,
+        max_length=12,
         blank=True,
         unique=True,
         editable=False
@@ -92,16 +93,7 @@ class Invoice(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.invoice_id:
-            today = datetime.date.today()
-            today_string = today.strftime('%y%m%d')
-            next_invoice_number = '001'
-            last_invoice = Invoice.objects.filter(
-                invoice_id__startswith=today_string
-            ).order_by('invoice_id').last()
-            if last_invoice:
-                last_invoice_number = int(last_invoice.invoice_id[7:])
-                next_invoice_number = f"{last_invoice_number + 1:03d}"
-            self.invoice_id = f'{today_string}2{next_invoice_number}'
+            self.invoice_id = DailyCounter.next_id(DailyCounter.Kind.INVOICE)
         self.labour_total = self.get_labour_total()
         if self.invoice_id:
             self.invoice_total = self.get_total()
@@ -127,6 +119,109 @@ class InvoiceItem(models.Model):
         return f'{self.description} - £{self.line_price}'
 
 
+class UploadSession(models.Model):
+    """A vehicle or gallery photo uploaded in chunks, which can be resumed
+    from ``offset`` after a dropped connection."""
+    upload_id = models.UUIDField(
+        default=uuid.uuid4,
+        unique=True,
+        editable=False
+    )
+    filename = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    vehicle = models.ForeignKey(
+        Vehicle,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True
+    )
+    gallery_item = models.ForeignKey(
+        GalleryItem,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True
+    )
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    read_size = 64 * 1024
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+    @property
+    def path(self):
+        return os.path.join(
+            settings.CHUNKED_UPLOAD_ROOT,
+            f'{self.upload_id}.part'
+        )
+
+    def is_complete(self):
+        return self.offset == self.size
+
+    def write_chunk(self, stream, start, length):
+        """Stream ``length`` bytes from ``stream`` to the file at ``start``
+        and record how much was written.
+
+        Nothing is written, and None returned, unless ``start`` is the
+        current offset and no other chunk of the upload is being written.
+        The file is locked while the chunk arrives, and the offset is read
+        and moved in single statements, so no row stays locked meanwhile.
+
+        Bytes past the offset are left from a chunk that was cut off and
+        are overwritten. If the client goes away mid-chunk the offset
+        still moves past what did arrive, so the upload can resume there.
+        """
+        os.makedirs(settings.CHUNKED_UPLOAD_ROOT, exist_ok=True)
+        descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with open(descriptor, 'r+b') as file:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            self.refresh_from_db(fields=['offset'])
+            if start != self.offset:
+                return None
+            file.seek(start)
+            file.truncate()
+            remaining = length
+            try:
+                while remaining:
+                    data = stream.read(min(remaining, self.read_size))
+                    if not data:
+                        break
+                    file.write(data)
+                    remaining -= len(data)
+            except UnreadablePostError:
+                pass
+            self.offset = file.tell()
+            type(self).objects.filter(pk=self.pk, offset=start).update(
+                offset=self.offset)
+        return length - remaining
+
+    def is_valid_image(self):
+        try:
+            with Image.open(self.path) as image:
+                image.verify()
+        except Exception:  # pylint: disable=broad-except
+            return False
+        return True
+
+    def attach(self):
+        """Create the vehicle or gallery image from the uploaded file."""
+        with open(self.path, 'rb') as file:
+            image = File(file, name=self.filename)
+            if self.vehicle_id:
+                return VehicleImages.objects.create(
+                    vehicle_id=self.vehicle_id,
+                    image=image
+                )
+            return GalleryImage.objects.create(
+                item_id=self.gallery_item_id,
+                image=image
+            )
+
+
 auditlog.register(Invoice, exclude_fields=[
     'created_date',
     'vat',
@@ -1,6 +1,12 @@
+import os
+
+from django.conf import settings
 from rest_framework import serializers
 
-from .models import Invoice, InvoiceItem, Customer
+from gallery.models import GalleryItem
+from sales.models import Vehicle
+
+from .models import Invoice, InvoiceItem, Customer, UploadSession
 from .utils import get_customer, create_invoice_items
 
 # pylint: disable=W0223
@@ -155,3 +161,97 @@ class CustomerInvoicesSerializer(serializers.ModelSerializer):
                               .prefetch_related('line_items')
         serializer = InvoiceSerializer(data, many=True)
         return serializer.data
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    upload_id = serializers.ReadOnlyField()
+    offset = serializers.ReadOnlyField()
+    vehicle = serializers.SlugRelatedField(
+        slug_field='slug',
+        queryset=Vehicle.objects.all(),
+        required=False
+    )
+    gallery_item = serializers.SlugRelatedField(
+        slug_field='slug',
+        queryset=GalleryItem.objects.all(),
+        required=False
+    )
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'upload_id',
+            'filename',
+            'size',
+            'offset',
+            'vehicle',
+            'gallery_item',
+        ]
+
+    def validate_filename(self, value):
+        filename = os.path.basename(value)
+        if not filename:
+            raise serializers.ValidationError('A file name is required.')
+        return filename
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Uploads must be between 1 and '
+                f'{settings.CHUNKED_UPLOAD_MAX_SIZE} bytes.'
+            )
+        return value
+
+    def validate(self, attrs):
+        if bool(attrs.get('vehicle')) == bool(attrs.get('gallery_item')):
+            raise serializers.ValidationError(
+                'An upload is attached to either a vehicle or a gallery item.'
+            )
+        return attrs
+
+
+class ChoiceLabelField(serializers.ChoiceField):
+    """Choice field that also accepts a choice by its label, ignoring case,
+    as stock feeds give "Diesel" rather than its stored value."""
+
+    def to_internal_value(self, data):
+        labels = {
+            str(label).strip().lower(): value
+            for value, label in self.choices.items()
+        }
+        return super().to_internal_value(
+            labels.get(str(data).strip().lower(), data))
+
+
+class StockRowSerializer(serializers.ModelSerializer):
+    fuel = ChoiceLabelField(choices=Vehicle.Fuel.choices, required=False)
+    body_type = ChoiceLabelField(
+        choices=Vehicle.BodyType.choices, required=False)
+    car_state = ChoiceLabelField(
+        choices=Vehicle.CarState.choices, required=False)
+
+    class Meta:
+        model = Vehicle
+        fields = [
+            'vrm',
+            'make',
+            'model',
+            'trim',
+            'year',
+            'fuel',
+            'body_type',
+            'car_state',
+            'mileage',
+            'engine_size',
+            'mot_expiry',
+            'extras',
+            'price',
+            'published',
+        ]
+        # Rows are matched against existing vehicles in batches, so the
+        # per-row uniqueness queries are skipped.
+        extra_kwargs = {'vrm': {'validators': []}}
+
+    def validate_vrm(self, value):
+        value = (value or '').replace(' ', '').upper()
+        return value or None
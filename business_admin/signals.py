@@ -0,0 +1,18 @@
+import os
+
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import UploadSession
+
+
+@receiver(post_delete, sender=UploadSession)
+def delete_upload_file(sender, instance, **kwargs):
+    path = instance.path
+
+    def delete():
+        if os.path.exists(path):
+            os.remove(path)
+
+    transaction.on_commit(delete)
@@ -0,0 +1,196 @@
+import codecs
+import csv
+import json
+import re
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from backend import feeds
+from backend.cache import invalidate_responses
+from sales.models import Vehicle
+from sales.similarity import similarity_index
+from sales.state import vehicle_status_map
+
+from .serializers import StockRowSerializer
+
+FIELDS = StockRowSerializer.Meta.fields
+MAX_REPORTED_ERRORS = 100
+READ_SIZE = 64 * 1024
+JSON_SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+
+def parse_csv(file):
+    """Yield the rows of a CSV feed read line by line from the binary
+    ``file``, leaving out empty cells."""
+    for row in csv.DictReader(codecs.iterdecode(file, 'utf-8-sig')):
+        yield {
+            key.strip(): value.strip() for key, value in row.items()
+            if key and value and value.strip()
+        }
+
+
+def parse_json(file):
+    """Yield the objects of a JSON array, or of newline delimited JSON,
+    decoding them as the binary ``file`` is read."""
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer += text.decode(chunk, final=not chunk)
+        position = 0
+        while True:
+            position = JSON_SEPARATORS.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            try:
+                row, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                # The object continues in the next chunk.
+                break
+            yield row
+        buffer = buffer[position:]
+        if not chunk:
+            return
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'json': parse_json,
+}
+
+
+def import_stock(rows, batch_size=500):
+    """Upsert vehicles from the rows of a stock feed, a batch at a time.
+
+    Rows are matched to existing vehicles by VRM, or by slug when no
+    vehicle has the VRM, so vehicles added without one are found too.
+    Matched vehicles are updated when a field changed and the others
+    inserted. Rows repeating a VRM or slug of the feed, and rows whose VRM
+    and slug belong to different vehicles, are invalid. Returns counts of
+    inserted, updated, unchanged and invalid rows, with the errors of the
+    first invalid ones.
+
+    Each batch is committed on its own. If the feed cannot be read to the
+    end, the rows before the fault are still imported and the report
+    returned with the reason as ``error``.
+    """
+    report = {
+        'inserted': 0,
+        'updated': 0,
+        'unchanged': 0,
+        'invalid': 0,
+        'errors': [],
+    }
+    rows = enumerate(rows, start=1)
+    while True:
+        batch = []
+        try:
+            batch.extend(islice(rows, batch_size))
+        except (ValueError, csv.Error) as error:
+            report['error'] = f'Could not read the stock feed: {error}'
+        valid = []
+        for number, row in batch:
+            serializer = StockRowSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((number, serializer.validated_data))
+            else:
+                report_invalid(report, number, serializer.errors)
+        if batch:
+            with transaction.atomic():
+                upsert_vehicles(valid, report)
+        if 'error' in report or len(batch) < batch_size:
+            return report
+
+
+def report_invalid(report, number, errors):
+    report['invalid'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'row': number, 'errors': errors})
+
+
+def upsert_vehicles(rows, report):
+    entries = []
+    vrms = set()
+    slugs = set()
+    for number, data in rows:
+        vrm = data.get('vrm')
+        slug = Vehicle(**data).build_slug()
+        if vrm and vrm in vrms:
+            report_invalid(report, number, {
+                'vrm': ['An earlier row of the feed has the same VRM.']})
+        elif slug in slugs:
+            report_invalid(report, number, {
+                'slug': ['An earlier row of the feed has the same make, '
+                         'model, trim and year.']})
+        else:
+            if vrm:
+                vrms.add(vrm)
+            slugs.add(slug)
+            entries.append((number, data, slug))
+
+    existing = Vehicle.objects.filter(
+        Q(vrm__in=vrms) | Q(slug__in=slugs)
+    ).values('pk', 'slug', *FIELDS)
+    by_vrm = {}
+    by_slug = {}
+    for vehicle in existing:
+        by_slug[vehicle['slug']] = vehicle
+        if vehicle['vrm']:
+            by_vrm[vehicle['vrm']] = vehicle
+
+    now = timezone.now()
+    inserts = []
+    updates = []
+    changed_fields = set()
+    changed_slugs = []
+    for number, data, slug in entries:
+        vrm = data.get('vrm')
+        match = by_vrm.get(vrm) if vrm else None
+        taken = by_slug.get(slug)
+        if match is None and taken is not None and \
+                not (vrm and taken['vrm']):
+            # Vehicles added without a VRM are found by their slug.
+            match = taken
+        if taken is not None and (match is None or taken['pk'] != match['pk']):
+            # Updating or inserting would take over another vehicle.
+            report_invalid(report, number, {
+                'slug': ['Another vehicle has the same make, model, trim '
+                         'and year.']})
+            continue
+        if match is None:
+            inserts.append(Vehicle(slug=slug, **data))
+            changed_slugs.append(slug)
+            continue
+        changed = {
+            field for field, value in data.items() if match[field] != value
+        }
+        if not changed and match['slug'] == slug:
+            report['unchanged'] += 1
+            continue
+        changed_fields |= changed
+        values = {**match, **data, 'slug': slug, 'updated_at': now}
+        updates.append(Vehicle(**values))
+        changed_slugs += [match['slug'], slug]
+
+    if inserts:
+        Vehicle.objects.bulk_create(inserts)
+    if updates:
+        Vehicle.objects.bulk_update(
+            updates,
+            [*changed_fields, 'slug', 'updated_at']
+        )
+    report['inserted'] += len(inserts)
+    report['updated'] += len(updates)
+    if changed_slugs:
+        # Bulk writes send no signals.
+        invalidate_responses('vehicles', *changed_slugs)
+        transaction.on_commit(vehicle_status_map.invalidate)
+        transaction.on_commit(similarity_index.invalidate)
+        feeds.schedule_update(Vehicle, *Vehicle.objects.filter(
+            slug__in=changed_slugs).values_list('pk', flat=True))
@@ -0,0 +1,122 @@
+import csv
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.test import RequestFactory
+from rest_framework.test import APITestCase
+
+from sales.models import Vehicle, VehicleImages
+
+from .export import vehicle_rows
+from .stock import import_stock, parse_csv
+
+
+class TestVehicleExport(APITestCase):
+
+    def setUp(self):
+        user = get_user_model()
+        user.objects.create(
+            first_name='Harold',
+            last_name='Finch',
+            username='admin',
+            password=make_password('TestP455word!'),
+            is_staff=True
+        ).save()
+        for year in range(2015, 2020):
+            Vehicle.objects.create(
+                vrm=f'AB{year % 100}CDE',
+                make='Ford',
+                model='Focus',
+                trim='Zetec',
+                year=year,
+                fuel='2',
+                body_type='4',
+                mileage=60000,
+                engine_size=1596,
+                mot_expiry='2024-01-01',
+                extras='Test Focus, "ST" pack',
+                price=6000.00
+            )
+        vehicle = Vehicle.objects.get(year=2016)
+        VehicleImages.objects.create(vehicle=vehicle, image='vehicles/a.jpg')
+        VehicleImages.objects.create(vehicle=vehicle, image='vehicles/b.jpg')
+
+    def get_access_token(self):
+        access_request = self.client.post(
+            '/api/auth/jwt/create/',
+            {
+                'username': 'admin',
+                'password': 'TestP455word!'
+            }
+        )
+        return access_request.data['access']
+
+    def export(self, export_format):
+        return self.client.get(
+            f'/api/admin/vehicle/export/{export_format}/',
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.get_access_token()}'}
+        )
+
+    def test_export_csv(self):
+        response = self.export('csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('vehicles.csv', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(len(rows), 5)
+        row = rows[1]
+        self.assertEqual(row['slug'], 'ford-focus-zetec-2016')
+        self.assertEqual(row['vrm'], 'AB16CDE')
+        self.assertEqual(row['fuel'], 'Diesel')
+        self.assertEqual(row['body_type'], 'Estate')
+        self.assertEqual(row['reserved'], 'For Sale')
+        self.assertEqual(row['extras'], 'Test Focus, "ST" pack')
+        self.assertEqual(
+            row['images'],
+            'http://testserver/media/vehicles/a.jpg '
+            'http://testserver/media/vehicles/b.jpg'
+        )
+        self.assertEqual(rows[0]['images'], '')
+
+    def test_export_ndjson(self):
+        response = self.export('ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1]['price'], '6000.00')
+        self.assertEqual(rows[1]['mot_expiry'], '2024-01-01')
+        self.assertEqual(rows[1]['published'], False)
+        self.assertEqual(len(rows[1]['images']), 2)
+
+    def test_export_can_be_imported(self):
+        content = b''.join(self.export('csv').streaming_content)
+        report = import_stock(parse_csv(content.splitlines(keepends=True)))
+        self.assertEqual(report['unchanged'], 5)
+        self.assertEqual(report['invalid'], 0)
+
+    def test_vehicles_without_a_vrm_can_be_imported_again(self):
+        Vehicle.objects.update(vrm=None)
+        content = b''.join(self.export('csv').streaming_content)
+        report = import_stock(parse_csv(content.splitlines(keepends=True)))
+        self.assertEqual(report['unchanged'], 5)
+        self.assertEqual(report['invalid'], 0)
+
+    def test_images_are_fetched_per_chunk(self):
+        request = RequestFactory().get('/')
+        # One query for the vehicles and one for the images of each chunk.
+        with self.assertNumQueries(4):
+            rows = list(vehicle_rows(request, chunk_size=2))
+        self.assertEqual([len(row['images']) for row in rows], [0, 2, 0, 0, 0])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.export('xml').status_code, 404)
+
+    def test_export_requires_admin(self):
+        response = self.client.get('/api/admin/vehicle/export/csv/')
+        self.assertEqual(response.status_code, 401)
@@ -1,8 +1,10 @@
 import json
 import shutil
 import tempfile
+from unittest import mock
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
+from django.db import DatabaseError
 from django.test import override_settings
 from rest_framework.test import APITestCase
 
@@ -696,3 +698,39 @@ class TestBusinessAdminInvoice(APITestCase):
         self.destroy_invoice_working()
         self.update_customer()
         self.destroy_customer()
+
+    def test_invoice_is_not_saved_when_its_email_fails(self):
+        with mock.patch(
+            'business_admin.utils.EmailMessage.send',
+            side_effect=DatabaseError('The outbox is unavailable.')
+        ), self.assertRaises(DatabaseError):
+            self.client.post(
+                '/api/admin/invoice/',
+                {
+                    "customer": {
+                        "first_name": "Elizabeth",
+                        "last_name": "Windsor",
+                        "phone_number": "07123456789",
+                        "email": "test@example.com",
+                        "address_line_1": "1 The Mall",
+                        "address_line_2": "",
+                        "town_city": "Westminter",
+                        "county": "London",
+                        "postcode": "SW1A 1AA"
+                    },
+                    "make": "Land Rover",
+                    "model": "Defender",
+                    "trim": "110",
+                    "year": 2021,
+                    "mileage": 250,
+                    "vrm": "B16 LIZ",
+                    "labour_quantity": 10,
+                    "labour_unit": 15,
+                    "new_line_items": [],
+                    "comments": "Testing a failed email",
+                },
+                format="json",
+                **{'HTTP_AUTHORIZATION': f'Bearer {self.get_access_token()}'}
+            )
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(Customer.objects.exists())
@@ -0,0 +1,265 @@
+import json
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from rest_framework.test import APITestCase
+
+from sales.models import Vehicle
+
+from .stock import import_stock, parse_json
+
+CSV_FEED = '''vrm,make,model,trim,year,fuel,body_type,car_state,mileage,engine_size,mot_expiry,extras,price,published
+AB12 CDE,Ford,Focus,Zetec,2015,Petrol,Hatchback,Frontline,60000,1596,2024-01-01,Test Focus,6000.00,true
+FG34HIJ,BMW,3 Series,320d,2018,diesel,Saloon,Frontline,41000,1995,2024-02-01,Test 320d,14500.00,true
+KL56MNO,Audi,A3,Sport,2019,Diesel,Hatchback,Frontline,30000,1968,2024-03-01,Test A3,16000.00,
+'''
+
+
+class TestStockImport(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = get_user_model()
+        user.objects.create(
+            first_name='Harold',
+            last_name='Finch',
+            username='admin',
+            password=make_password('TestP455word!'),
+            is_staff=True
+        ).save()
+
+    def get_access_token(self):
+        access_request = self.client.post(
+            '/api/auth/jwt/create/',
+            {
+                'username': 'admin',
+                'password': 'TestP455word!'
+            }
+        )
+        return access_request.data['access']
+
+    def import_feed(self, content, suffix, batch_size=500):
+        with tempfile.NamedTemporaryFile(suffix=suffix) as feed:
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            feed.write(content)
+            feed.flush()
+            out = StringIO()
+            call_command(
+                'import_stock',
+                feed.name,
+                batch_size=batch_size,
+                stdout=out
+            )
+        return json.loads(out.getvalue())
+
+    def test_import_csv(self):
+        report = self.import_feed(CSV_FEED, '.csv', batch_size=2)
+        self.assertEqual(
+            report,
+            {'inserted': 3, 'updated': 0, 'unchanged': 0, 'invalid': 0,
+             'errors': []}
+        )
+        vehicle = Vehicle.objects.get(vrm='AB12CDE')
+        self.assertEqual(vehicle.slug, 'ford-focus-zetec-2015')
+        self.assertEqual(vehicle.get_fuel_display(), 'Petrol')
+        self.assertEqual(vehicle.get_body_type_display(), 'Hatchback')
+        self.assertEqual(Vehicle.objects.get(vrm='FG34HIJ').fuel, '2')
+        self.assertFalse(Vehicle.objects.get(vrm='KL56MNO').published)
+        self.assertEqual(
+            Vehicle.objects.filter(search_vector='focus').count(), 1)
+
+    def test_reimport_updates_changed_rows(self):
+        self.import_feed(CSV_FEED, '.csv')
+        response = self.client.get('/api/sales/ford-focus-zetec-2015/')
+        self.assertEqual(json.loads(response.content)['price'], '6000.00')
+        updated_at = Vehicle.objects.get(vrm='AB12CDE').updated_at
+
+        feed = [
+            {'vrm': 'AB12CDE', 'make': 'Ford', 'model': 'Focus',
+             'trim': 'Zetec', 'year': 2015, 'mileage': 60000,
+             'engine_size': 1596, 'mot_expiry': '2024-01-01',
+             'extras': 'Test Focus', 'price': '5750.00'},
+            # Matched by VRM although the trim, and so the slug, changed.
+            {'vrm': 'FG34HIJ', 'make': 'BMW', 'model': '3 Series',
+             'trim': '320d M Sport', 'year': 2018, 'fuel': 'Diesel',
+             'body_type': 'Saloon', 'car_state': 'frontline', 'mileage': 41000,
+             'engine_size': 1995, 'mot_expiry': '2024-02-01',
+             'extras': 'Test 320d', 'price': '14500.00'},
+            {'vrm': 'KL56 MNO', 'make': 'Audi', 'model': 'A3',
+             'trim': 'Sport', 'year': 2019, 'fuel': '2', 'body_type': '2',
+             'car_state': '2', 'mileage': 30000, 'engine_size': 1968,
+             'mot_expiry': '2024-03-01', 'extras': 'Test A3',
+             'price': '16000.00', 'published': False},
+            {'vrm': 'PQ78RST', 'make': 'Audi', 'model': 'A3',
+             'trim': 'S Line', 'year': 2017, 'fuel': 'Hydrogen',
+             'mileage': 30000, 'engine_size': 1968,
+             'mot_expiry': '2024-03-01', 'extras': 'Test A3',
+             'price': '12000.00'},
+        ]
+        report = self.import_feed(json.dumps(feed), '.json')
+        self.assertEqual(report['inserted'], 0)
+        self.assertEqual(report['updated'], 2)
+        self.assertEqual(report['unchanged'], 1)
+        self.assertEqual(report['invalid'], 1)
+        self.assertEqual(report['errors'][0]['row'], 4)
+        self.assertIn('fuel', report['errors'][0]['errors'])
+
+        vehicle = Vehicle.objects.get(vrm='AB12CDE')
+        self.assertEqual(str(vehicle.price), '5750.00')
+        self.assertGreater(vehicle.updated_at, updated_at)
+        response = self.client.get('/api/sales/ford-focus-zetec-2015/')
+        self.assertEqual(json.loads(response.content)['price'], '5750.00')
+        self.assertEqual(
+            Vehicle.objects.get(vrm='FG34HIJ').slug,
+            'bmw-3-series-320d-m-sport-2018'
+        )
+        self.assertEqual(Vehicle.objects.count(), 3)
+
+    def test_existing_vehicles_are_matched_by_slug(self):
+        Vehicle.objects.create(
+            make='Ford', model='Focus', trim='Zetec', year=2015,
+            mileage=65000, engine_size=1596, mot_expiry='2023-01-01',
+            extras='Test Focus', price=6500.00
+        )
+        report = self.import_feed(CSV_FEED, '.csv')
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual(report['updated'], 1)
+        vehicle = Vehicle.objects.get(slug='ford-focus-zetec-2015')
+        self.assertEqual(vehicle.vrm, 'AB12CDE')
+        self.assertEqual(vehicle.mileage, 60000)
+
+    def test_rows_matching_two_vehicles_are_invalid(self):
+        Vehicle.objects.create(
+            vrm='AB12CDE', make='Ford', model='Focus', trim='Zetec',
+            year=2014, mileage=65000, engine_size=1596,
+            mot_expiry='2023-01-01', extras='Test Focus', price=6500.00
+        )
+        Vehicle.objects.create(
+            make='Ford', model='Focus', trim='Zetec', year=2015,
+            mileage=70000, engine_size=1596, mot_expiry='2023-01-01',
+            extras='Another Focus', price=5500.00
+        )
+        report = self.import_feed(CSV_FEED, '.csv')
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual(report['invalid'], 1)
+        self.assertEqual(report['errors'][0]['row'], 1)
+        self.assertEqual(Vehicle.objects.get(vrm='AB12CDE').year, 2014)
+        self.assertEqual(
+            Vehicle.objects.get(slug='ford-focus-zetec-2015').mileage, 70000)
+
+    def test_vehicles_with_another_vrm_are_not_taken_over(self):
+        Vehicle.objects.create(
+            vrm='XY99ZZZ', make='Ford', model='Focus', trim='Zetec',
+            year=2015, mileage=65000, engine_size=1596,
+            mot_expiry='2023-01-01', extras='Test Focus', price=6500.00
+        )
+        report = self.import_feed(CSV_FEED, '.csv')
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual(report['updated'], 0)
+        self.assertEqual(report['invalid'], 1)
+        self.assertEqual(report['errors'][0]['row'], 1)
+        self.assertIn('slug', report['errors'][0]['errors'])
+        vehicle = Vehicle.objects.get(slug='ford-focus-zetec-2015')
+        self.assertEqual(vehicle.vrm, 'XY99ZZZ')
+        self.assertEqual(vehicle.mileage, 65000)
+
+    def test_rows_sharing_a_slug_are_invalid(self):
+        feed = CSV_FEED + (
+            'ZZ11ZZZ,Ford,Focus,Zetec,2015,Petrol,Hatchback,Frontline,'
+            '70000,1596,2024-01-01,Another Focus,5000.00,true\n'
+        )
+        report = self.import_feed(feed, '.csv')
+        self.assertEqual(report['inserted'], 3)
+        self.assertEqual(report['invalid'], 1)
+        self.assertEqual(report['errors'][0]['row'], 4)
+        self.assertIn('slug', report['errors'][0]['errors'])
+        self.assertEqual(
+            Vehicle.objects.get(slug='ford-focus-zetec-2015').vrm, 'AB12CDE')
+        self.assertFalse(Vehicle.objects.filter(vrm='ZZ11ZZZ').exists())
+
+    def test_duplicate_rows_are_invalid(self):
+        lines = CSV_FEED.splitlines(keepends=True)
+        feed = ''.join(lines + [lines[2].replace('41000', '42000')])
+        report = self.import_feed(feed, '.csv')
+        self.assertEqual(report['inserted'], 3)
+        self.assertEqual(report['invalid'], 1)
+        self.assertEqual(report['errors'][0]['row'], 4)
+        self.assertIn('vrm', report['errors'][0]['errors'])
+        self.assertEqual(Vehicle.objects.get(vrm='FG34HIJ').mileage, 41000)
+
+    def test_rows_before_a_fault_are_imported(self):
+        lines = CSV_FEED.splitlines(keepends=True)
+        # The last row is not UTF-8.
+        feed = ''.join(lines[:3]).encode() + b'ZZ11ZZZ,\xff\n'
+        with self.assertRaisesMessage(CommandError, 'Could not read'):
+            self.import_feed(feed, '.csv', batch_size=1)
+        self.assertEqual(Vehicle.objects.count(), 2)
+
+        response = self.client.post(
+            '/api/admin/vehicle/import/',
+            {'file': SimpleUploadedFile(
+                'stock.json', b'[{"vrm": "KL56MNO"}, {"vrm": ')},
+            format='multipart',
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.get_access_token()}'}
+        )
+        self.assertEqual(response.status_code, 400)
+        report = json.loads(response.content)
+        self.assertEqual(report['invalid'], 1)
+        self.assertIn('Could not read the stock feed', report['error'])
+
+    def test_parse_json_across_reads(self):
+        rows = [{'make': 'Ford', 'extras': 'a, [b] {c}' * 10}] * 20
+        for content in (json.dumps(rows), '\n'.join(map(json.dumps, rows))):
+            feed = BytesIO(content.encode('utf-8'))
+            with mock.patch('business_admin.stock.READ_SIZE', 7):
+                self.assertEqual(list(parse_json(feed)), rows)
+
+    def test_import_stock_reads_rows_lazily(self):
+        consumed = []
+
+        def rows():
+            for number in range(5):
+                consumed.append(number)
+                yield {'make': 'Ford'}
+
+        read_before_upsert = []
+        with mock.patch(
+            'business_admin.stock.upsert_vehicles',
+            side_effect=lambda *args: read_before_upsert.append(len(consumed))
+        ):
+            report = import_stock(rows(), batch_size=2)
+        self.assertEqual(report['invalid'], 5)
+        self.assertEqual(read_before_upsert, [2, 4, 5])
+
+    def test_import_endpoint(self):
+        response = self.client.post(
+            '/api/admin/vehicle/import/',
+            {'file': SimpleUploadedFile('stock.csv', CSV_FEED.encode())},
+            format='multipart',
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.get_access_token()}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['inserted'], 3)
+
+        response = self.client.post(
+            '/api/admin/vehicle/import/',
+            {'file': SimpleUploadedFile('stock.xml', b'<stock/>')},
+            format='multipart',
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.get_access_token()}'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_endpoint_requires_admin(self):
+        response = self.client.post(
+            '/api/admin/vehicle/import/',
+            {'file': SimpleUploadedFile('stock.csv', CSV_FEED.encode())},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 401)
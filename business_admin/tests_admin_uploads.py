@@ -0,0 +1,283 @@
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from io import BytesIO, StringIO
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from gallery.models import GalleryItem, GalleryImage
+from sales.models import Vehicle, VehicleImages
+
+from .models import UploadSession
+
+MEDIA_ROOT = tempfile.mkdtemp()
+UPLOAD_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHUNKED_UPLOAD_ROOT=UPLOAD_ROOT)
+class TestBusinessAdminUploads(APITestCase):
+
+    def setUp(self):
+        user = get_user_model()
+        user.objects.create(
+            first_name='Harold',
+            last_name='Finch',
+            username='admin',
+            password=make_password('TestP455word!'),
+            is_staff=True
+        ).save()
+        Vehicle.objects.create(
+            make="BMW",
+            model="5 Series",
+            trim="M",
+            year=2018,
+            mileage=28614,
+            engine_size=2998,
+            mot_expiry="2023-04-11",
+            extras="Test M5",
+            price=32500.00
+        ).save()
+        GalleryItem.objects.create(
+            make="Mercedes",
+            model="190E",
+            trim="Cosworth",
+            year=1992,
+            description="loads of stuff"
+        ).save()
+        self.token = self.get_access_token()
+
+    def get_access_token(self):
+        access_request = self.client.post(
+            '/api/auth/jwt/create/',
+            {
+                'username': 'admin',
+                'password': 'TestP455word!'
+            }
+        )
+        return access_request.data['access']
+
+    def image_bytes(self):
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400)).save(buffer, 'jpeg')
+        return buffer.getvalue()
+
+    def create_session(self, **data):
+        return self.client.post(
+            '/api/admin/upload/',
+            data,
+            format='json',
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+        )
+
+    def put_chunk(self, upload_id, data, start, size):
+        return self.client.put(
+            f'/api/admin/upload/{upload_id}/',
+            data,
+            content_type='application/octet-stream',
+            **{
+                'HTTP_AUTHORIZATION': f'Bearer {self.token}',
+                'HTTP_CONTENT_RANGE':
+                    f'bytes {start}-{start + len(data) - 1}/{size}'
+            }
+        )
+
+    def finalize(self, upload_id):
+        return self.client.post(
+            f'/api/admin/upload/{upload_id}/finalize/',
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+        )
+
+    def test_chunked_upload_to_vehicle(self):
+        content = self.image_bytes()
+        response = self.create_session(
+            filename='forecourt/photo.jpg',
+            size=len(content),
+            vehicle='bmw-5-series-m-2018'
+        )
+        self.assertEqual(response.status_code, 201)
+        session = json.loads(response.content)
+        self.assertEqual(session['filename'], 'photo.jpg')
+        self.assertEqual(session['offset'], 0)
+        upload_id = session['upload_id']
+
+        chunk_size = len(content) // 3 + 1
+        for start in range(0, len(content), chunk_size):
+            response = self.put_chunk(
+                upload_id,
+                content[start:start + chunk_size],
+                start,
+                len(content)
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                json.loads(response.content)['offset'],
+                min(start + chunk_size, len(content))
+            )
+
+        part = UploadSession.objects.get(upload_id=upload_id).path
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 201)
+        image = VehicleImages.objects.get(vehicle__slug='bmw-5-series-m-2018')
+        self.assertEqual(json.loads(response.content)['id'], image.id)
+        with image.image.open('rb') as file:
+            self.assertEqual(file.read(), content)
+        self.assertIn('thumbnail', image.renditions)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(part))
+
+    def test_resume_after_interrupted_chunk(self):
+        content = self.image_bytes()
+        upload_id = json.loads(self.create_session(
+            filename='photo.jpg',
+            size=len(content),
+            gallery_item='mercedes-190e-cosworth-1992'
+        ).content)['upload_id']
+
+        self.put_chunk(upload_id, content[:100], 0, len(content))
+        # A retried chunk that overlaps what was stored is refused with the
+        # offset to resume from.
+        response = self.put_chunk(upload_id, content[50:200], 50, len(content))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content)['offset'], 100)
+
+        response = self.client.get(
+            f'/api/admin/upload/{upload_id}/',
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+        )
+        offset = json.loads(response.content)['offset']
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 400)
+
+        self.put_chunk(upload_id, content[offset:], offset, len(content))
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 201)
+        image = GalleryImage.objects.get()
+        with image.image.open('rb') as file:
+            self.assertEqual(file.read(), content)
+
+    def test_chunks_are_refused_while_another_is_written(self):
+        upload_id = json.loads(self.create_session(
+            filename='photo.jpg',
+            size=10,
+            vehicle='bmw-5-series-m-2018'
+        ).content)['upload_id']
+        session = UploadSession.objects.get(upload_id=upload_id)
+        with open(session.path, 'wb') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            response = self.put_chunk(upload_id, b'12345', 0, 10)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content)['offset'], 0)
+
+        # No row is locked while the chunk is streamed.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.put_chunk(upload_id, b'12345', 0, 10)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['offset'], 5)
+        self.assertFalse(any(
+            'FOR UPDATE' in query['sql'] for query in queries))
+
+    def test_expired_uploads_are_deleted(self):
+        sessions = [
+            json.loads(self.create_session(
+                filename='photo.jpg',
+                size=10,
+                vehicle='bmw-5-series-m-2018'
+            ).content)['upload_id']
+            for _ in range(2)
+        ]
+        for upload_id in sessions:
+            self.put_chunk(upload_id, b'12345', 0, 10)
+        UploadSession.objects.filter(upload_id=sessions[0]).update(
+            created_date=timezone.now() - timedelta(days=2))
+        expired_path = UploadSession.objects.get(upload_id=sessions[0]).path
+        kept_path = UploadSession.objects.get(upload_id=sessions[1]).path
+        stray_path = os.path.join(UPLOAD_ROOT, f'{uuid.uuid4()}.part')
+        with open(stray_path, 'wb') as file:
+            file.write(b'123')
+        stale = (timezone.now() - timedelta(days=2)).timestamp()
+        os.utime(stray_path, (stale, stale))
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('expire_uploads', stdout=out)
+        self.assertEqual(
+            out.getvalue(),
+            'Deleted 1 expired uploads and 1 stray partial files.\n'
+        )
+        self.assertEqual(
+            [str(upload_id) for upload_id in
+             UploadSession.objects.values_list('upload_id', flat=True)],
+            sessions[1:]
+        )
+        self.assertFalse(os.path.exists(expired_path))
+        self.assertFalse(os.path.exists(stray_path))
+        self.assertTrue(os.path.exists(kept_path))
+
+    def test_invalid_chunks(self):
+        upload_id = json.loads(self.create_session(
+            filename='photo.jpg',
+            size=10,
+            vehicle='bmw-5-series-m-2018'
+        ).content)['upload_id']
+        response = self.client.put(
+            f'/api/admin/upload/{upload_id}/',
+            b'12345',
+            content_type='application/octet-stream',
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.put_chunk(upload_id, b'12345678901', 0, 11)
+        self.assertEqual(response.status_code, 400)
+
+        self.put_chunk(upload_id, b'1234567890', 0, 10)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            json.loads(response.content)['error'],
+            'The uploaded file is not an image.'
+        )
+        self.assertFalse(VehicleImages.objects.exists())
+
+    def test_session_needs_one_target(self):
+        response = self.create_session(filename='photo.jpg', size=10)
+        self.assertEqual(response.status_code, 400)
+        response = self.create_session(
+            filename='photo.jpg',
+            size=10,
+            vehicle='bmw-5-series-m-2018',
+            gallery_item='mercedes-190e-cosworth-1992'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.create_session(
+            filename='photo.jpg',
+            size=10 ** 12,
+            vehicle='bmw-5-series-m-2018'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_uploads_require_admin(self):
+        response = self.client.post(
+            '/api/admin/upload/',
+            {'filename': 'photo.jpg', 'size': 10},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 401)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(UPLOAD_ROOT, ignore_errors=True)
+        super().tearDownClass()
@@ -1,11 +1,16 @@
 import json
+import os
 import shutil
 import tempfile
+from unittest import mock
 from PIL import Image
 
+from auditlog.models import LogEntry
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 
 from sales.models import VehicleImages, Vehicle
@@ -212,6 +217,105 @@ class TestBusinessAdminVehicle(APITestCase):
         )
         self.assertEqual(response.status_code, 204)
 
+    def vehicle_data(self, uploaded_images):
+        return {
+            "make": "Audi",
+            "model": "A4",
+            "trim": "S Line",
+            "year": 2017,
+            "mileage": 51000,
+            "engine_size": 1968,
+            "mot_expiry": "2023-08-01",
+            "extras": "Test A4",
+            "price": "12500.00",
+            "uploaded_images": uploaded_images
+        }
+
+    def test_uploaded_images_are_oriented_and_inserted_together(self):
+        rotated = Image.new('RGB', (200, 100))
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        tmp_file = tempfile.NamedTemporaryFile(suffix='.jpg')
+        rotated.save(tmp_file, 'jpeg', exif=exif)
+        tmp_file.seek(0)
+        token = self.get_access_token()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/admin/vehicle/',
+                self.vehicle_data([
+                    tmp_file,
+                    self.temporary_image(),
+                    self.temporary_image()
+                ]),
+                format="multipart",
+                **{'HTTP_AUTHORIZATION': f'Bearer {token}'}
+            )
+        self.assertEqual(response.status_code, 201)
+        inserts = [
+            query for query in queries
+            if query['sql'].startswith('INSERT INTO "sales_vehicleimages"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        images = VehicleImages.objects.filter(
+            vehicle__slug='audi-a4-s-line-2017').order_by('id')
+        self.assertEqual(images.count(), 3)
+        with images[0].image.open('rb') as file, Image.open(file) as image:
+            self.assertEqual(image.size, (100, 200))
+            self.assertNotIn(0x0112, image.getexif())
+        self.assertEqual(images[0].renditions['thumbnail']['width'], 100)
+
+    def test_uploaded_images_are_audit_logged(self):
+        response = self.client.post(
+            '/api/admin/vehicle/',
+            self.vehicle_data([
+                self.temporary_image(), self.temporary_image()]),
+            format="multipart",
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.get_access_token()}'}
+        )
+        self.assertEqual(response.status_code, 201)
+        entries = LogEntry.objects.get_for_objects(
+            VehicleImages.objects.all())
+        self.assertEqual(
+            sorted(int(entry.object_pk) for entry in entries),
+            sorted(VehicleImages.objects.values_list('pk', flat=True))
+        )
+        for entry in entries:
+            self.assertEqual(entry.action, LogEntry.Action.CREATE)
+
+    def stored_files(self):
+        return {
+            os.path.join(directory, name)
+            for directory, _, files in os.walk(MEDIA_ROOT) for name in files
+        }
+
+    def test_files_of_images_that_fail_to_insert_are_deleted(self):
+        stored = self.stored_files()
+        with mock.patch.object(
+            VehicleImages.objects, 'bulk_create', side_effect=IntegrityError
+        ), self.assertRaises(IntegrityError):
+            self.client.post(
+                '/api/admin/vehicle/',
+                self.vehicle_data([self.temporary_image()]),
+                format="multipart",
+                **{'HTTP_AUTHORIZATION': f'Bearer {self.get_access_token()}'}
+            )
+        self.assertEqual(self.stored_files(), stored)
+
+    def test_invalid_uploaded_images_are_rejected(self):
+        tmp_file = tempfile.NamedTemporaryFile(suffix='.jpg')
+        tmp_file.write(b'testimageofacar')
+        tmp_file.seek(0)
+        response = self.client.post(
+            '/api/admin/vehicle/',
+            self.vehicle_data([self.temporary_image(), tmp_file]),
+            format="multipart",
+            **{'HTTP_AUTHORIZATION': f'Bearer {self.get_access_token()}'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('is not a valid image.',
+                      json.loads(response.content)['uploaded_images'][0])
+        self.assertFalse(Vehicle.objects.exists())
+
     def test_in_order(self):
         self.create_vehicle_no_images()
         self.create_vehicle_with_images()
@@ -12,7 +12,12 @@ from .views import (
     GetUpdateDeleteVehicle,
     GetUpdateDeleteGallery,
     DeleteGalleryImage,
-    DeleteVehicleImage
+    DeleteVehicleImage,
+    CreateUploadSession,
+    UploadSessionView,
+    FinalizeUpload,
+    ImportStock,
+    ExportVehicles
 )
 
 urlpatterns = [
@@ -26,6 +31,9 @@ urlpatterns = [
     path('customer/<str:customer_id>/',
          CustomerView.as_view(), name="get_customer"),
     path('vehicle/', CreateListVehicle.as_view(), name="create_vehicle"),
+    path('vehicle/import/', ImportStock.as_view(), name="import_stock"),
+    path('vehicle/export/<str:export_format>/', ExportVehicles.as_view(),
+         name="export_vehicles"),
     path('vehicle/<slug:slug>/', GetUpdateDeleteVehicle.as_view(),
          name="vehicle_options"),
     path(
@@ -41,4 +49,9 @@ urlpatterns = [
         DeleteGalleryImage.as_view(),
         name="gallery_image_options"
     ),
+    path('upload/', CreateUploadSession.as_view(), name="create_upload"),
+    path('upload/<uuid:upload_id>/', UploadSessionView.as_view(),
+         name="upload_options"),
+    path('upload/<uuid:upload_id>/finalize/', FinalizeUpload.as_view(),
+         name="finalize_upload"),
 ]
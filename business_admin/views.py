@@ -1,15 +1,22 @@
 import json
+import os
+import re
 
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
 from django.db.models.deletion import ProtectedError
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status, filters
 from rest_framework.generics import (
+    CreateAPIView,
     DestroyAPIView,
     ListAPIView,
     ListCreateAPIView,
+    RetrieveDestroyAPIView,
     RetrieveUpdateDestroyAPIView,
 )
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -24,17 +31,22 @@ from sales.serializers import (
     VehicleImagesSerializer
 )
 
-from .models import Invoice, Customer
+from .export import EXPORTERS, vehicle_rows
+from .models import Invoice, Customer, UploadSession
 from .serializers import (
     InvoiceSerializer,
     CustomerSerializer,
     CustomerInvoicesSerializer,
-    ResendInvoiceSerializer
+    ResendInvoiceSerializer,
+    UploadSessionSerializer
 )
+from .stock import PARSERS, import_stock
 from .utils import invoice_handler
 
 # Create your views here.
 
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
 
 class SendInvoice(APIView):
     permission_classes = [IsAdminUser]
@@ -45,23 +57,26 @@ class SendInvoice(APIView):
         if email_serializer.is_valid():
             invoice = get_object_or_404(Invoice, invoice_id=invoice_id)
             invoice_serializer = InvoiceSerializer(invoice, many=False)
-            send_email = invoice_handler(
-                invoice_serializer.data,
-                extra_emails=email_serializer.data
-            )
-            if send_email:
-                LogEntry.objects.create(
-                    actor_id=request.user.id,
-                    content_type_id=ContentType.objects.get_for_model(
-                        invoice).pk,
-                    object_id=invoice.id,
-                    object_pk=invoice,
-                    object_repr=str(invoice),
-                    action=1,  # 1 is update
-                    changes=json.dumps({
-                        "sent_to": email_serializer.data
-                    }),
+            # The email is queued in the outbox, so it commits with the log.
+            with transaction.atomic():
+                send_email = invoice_handler(
+                    invoice_serializer.data,
+                    extra_emails=email_serializer.data
                 )
+                if send_email:
+                    LogEntry.objects.create(
+                        actor_id=request.user.id,
+                        content_type_id=ContentType.objects.get_for_model(
+                            invoice).pk,
+                        object_id=invoice.id,
+                        object_pk=invoice,
+                        object_repr=str(invoice),
+                        action=1,  # 1 is update
+                        changes=json.dumps({
+                            "sent_to": email_serializer.data
+                        }),
+                    )
+            if send_email:
                 return Response(status=status.HTTP_200_OK)
             return Response(
                 {"error": "Couldn't render data into PDF file."},
@@ -76,8 +91,11 @@ class InvoiceView(APIView):
     def post(self, request):
         serializer = InvoiceSerializer(data=request.data, many=False)
         if serializer.is_valid():
-            serializer.save()
-            send_invoice_by_email = invoice_handler(serializer.data)
+            # The email is queued in the outbox, so it only goes out if
+            # the invoice is saved, and an error queueing it undoes both.
+            with transaction.atomic():
+                serializer.save()
+                send_invoice_by_email = invoice_handler(serializer.data)
             if send_invoice_by_email:
                 return Response(serializer.data, status=status.HTTP_200_OK)
             return Response(
@@ -118,6 +136,27 @@ class CreateListVehicle(ListCreateAPIView):
     permission_classes = [IsAdminUser]
 
 
+class ExportVehicles(APIView):
+    """Stream every vehicle with its image URLs as CSV or NDJSON, see
+    ``business_admin.export.vehicle_rows``."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, export_format):
+        if export_format not in EXPORTERS:
+            return Response(
+                {"error": "Exports are available as CSV or NDJSON."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        stream, content_type, extension = EXPORTERS[export_format]
+        response = StreamingHttpResponse(
+            stream(vehicle_rows(request)),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="vehicles.{extension}"'
+        return response
+
+
 class CreateListGalleryItem(ListCreateAPIView):
     queryset = GalleryItem.objects.all()
     pagination_by = 10
@@ -187,3 +226,120 @@ class CustomerView(RetrieveUpdateDestroyAPIView):
                 {"error": "Customer object cannot be deleted with Invoice objects still active."},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+
+class CreateUploadSession(CreateAPIView):
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAdminUser]
+    queryset = UploadSession.objects.all()
+
+
+class UploadSessionView(RetrieveDestroyAPIView):
+    """Progress of an upload, with chunks sent as PUT requests carrying a
+    ``Content-Range: bytes start-end/size`` header.
+
+    A chunk must start at the current offset and not overlap another chunk
+    still being written; otherwise a 409 with the session is returned so
+    the client can resume from its offset.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAdminUser]
+    queryset = UploadSession.objects.all()
+    lookup_field = 'upload_id'
+
+    def put(self, request, upload_id):
+        match = CONTENT_RANGE.fullmatch(
+            request.headers.get('Content-Range', ''))
+        if match is None:
+            return Response(
+                {"error": "A Content-Range header of the form "
+                          "'bytes start-end/size' is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        start, end, size = (int(value) for value in match.groups())
+        length = end - start + 1
+        if int(request.headers.get('Content-Length') or 0) != length:
+            return Response(
+                {"error": "The chunk does not match its Content-Range."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        session = get_object_or_404(UploadSession, upload_id=upload_id)
+        if size != session.size or end >= session.size:
+            return Response(
+                {"error": "The chunk is outside the upload."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            written = session.write_chunk(request.stream, start, length)
+        except UploadSession.DoesNotExist as error:
+            raise Http404 from error
+        if written is None:
+            return Response(
+                self.get_serializer(session).data,
+                status=status.HTTP_409_CONFLICT
+            )
+        if written != length:
+            return Response(
+                {"error": "The chunk was cut off.", "offset": session.offset},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(self.get_serializer(session).data)
+
+
+class FinalizeUpload(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, upload_id):
+        with transaction.atomic():
+            session = get_object_or_404(
+                UploadSession.objects.select_for_update(),
+                upload_id=upload_id
+            )
+            if not session.is_complete():
+                return Response(
+                    {"error": "The upload is not complete.",
+                     "offset": session.offset},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if not session.is_valid_image():
+                session.delete()
+                return Response(
+                    {"error": "The uploaded file is not an image."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            image = session.attach()
+            session.delete()
+        if isinstance(image, VehicleImages):
+            serializer = VehicleImagesSerializer(
+                image, context={'request': request})
+        else:
+            serializer = GalleryImageSerializer(
+                image, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class ImportStock(APIView):
+    """Import vehicles from an uploaded CSV or JSON stock feed, see
+    ``business_admin.stock.import_stock``."""
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        feed = request.data.get('file')
+        if feed is None:
+            return Response(
+                {"error": "A stock feed file is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        feed_format = request.data.get('format') or \
+            os.path.splitext(feed.name)[1].lstrip('.').lower()
+        if feed_format not in PARSERS:
+            return Response(
+                {"error": "Stock feeds must be CSV or JSON."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        report = import_stock(PARSERS[feed_format](feed))
+        if 'error' in report:
+            # The rows before the fault are imported all the same.
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.4 on 2026-10-18 09:38
+
+import backend.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0004_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='galleryimage',
+            name='image',
+            field=models.ImageField(storage=backend.storage.get_image_storage, upload_to='gallery'),
+        ),
+    ]
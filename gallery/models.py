@@ -1,6 +1,8 @@
 from django.db import models
 from django.utils.text import slugify
 
+from backend.storage import get_image_storage
+
 # Create your models here.
 
 
@@ -13,6 +15,7 @@ class GalleryItem(models.Model):
     year = models.IntegerField()
     description = models.TextField()
     published = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f'{self.id} {self.make} {self.model} {self.trim}'
@@ -29,7 +32,8 @@ class GalleryItem(models.Model):
 class GalleryImage(models.Model):
     """Image for galleryItem"""
     item = models.ForeignKey(GalleryItem, on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='gallery')
+    image = models.ImageField(upload_to='gallery', storage=get_image_storage)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ['id']
@@ -1,5 +1,12 @@
 from rest_framework import serializers
 
+from backend.images import InvalidImage, create_images, process_uploads
+from backend.serializers import (
+    SparseFieldsetMixin,
+    SrcsetField,
+    ValuesSerializerMixin
+)
+
 from .models import GalleryImage, GalleryItem
 
 
@@ -21,19 +28,27 @@ class GalleryItemSerailizer(serializers.ModelSerializer):
         ]
 
 
-class GalleryImageSerializer(serializers.ModelSerializer):
+class GalleryImageSerializer(ValuesSerializerMixin,
+                             serializers.ModelSerializer):
     """Serializer for an Image item"""
+    srcset = SrcsetField()
+
     class Meta:
         model = GalleryImage
         fields = [
             'id',
             'item',
             'image',
+            'srcset',
         ]
 
 
-class GallerySerializer(serializers.ModelSerializer):
+class GallerySerializer(SparseFieldsetMixin, ValuesSerializerMixin,
+                        serializers.ModelSerializer):
     """Serializer for a full gallery item"""
+    expandable_fields = {'images': 'galleryimage_set'}
+    expanded_serializers = {'images': GalleryImageSerializer}
+
     images = serializers.SerializerMethodField()
     uploaded_images = serializers.ListField(
         child=serializers.FileField(
@@ -61,30 +76,24 @@ class GallerySerializer(serializers.ModelSerializer):
         ]
 
     def get_images(self, obj):
-        images = GalleryImage.objects.filter(item_id=obj.id)
+        images = obj.galleryimage_set.all()
         serializer = GalleryImageSerializer(images, many=True)
         return serializer.data
 
+    def validate_uploaded_images(self, value):
+        try:
+            return process_uploads(value)
+        except InvalidImage as error:
+            raise serializers.ValidationError(str(error)) from error
+
     def create(self, validated_data):
-        if 'uploaded_images' in validated_data:
-            uploaded_images = validated_data.pop('uploaded_images')
-            gallery = GalleryItem.objects.create(**validated_data)
-            for image in uploaded_images:
-                GalleryImage.objects.create(
-                    item_id=gallery.id,
-                    image=image
-                )
-        else:
-            gallery = GalleryItem.objects.create(**validated_data)
+        uploaded_images = validated_data.pop('uploaded_images', [])
+        gallery = GalleryItem.objects.create(**validated_data)
+        create_images(GalleryImage, gallery, uploaded_images, 'gallery')
         return gallery
 
     def update(self, instance, validated_data):
-        if 'uploaded_images' in validated_data:
-            uploaded_images = validated_data.pop('uploaded_images')
-            for image in uploaded_images:
-                GalleryImage.objects.create(
-                    item_id=instance.id,
-                    image=image
-                )
+        uploaded_images = validated_data.pop('uploaded_images', [])
+        create_images(GalleryImage, instance, uploaded_images, 'gallery')
         super().update(instance, validated_data)
         return instance
@@ -0,0 +1,65 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from backend import feeds
+from backend.cache import invalidate_responses
+from backend.images import (
+    discard_renditions, file_replaced, remember_file, store_renditions)
+
+from .models import GalleryImage, GalleryItem
+
+
+@receiver(pre_save, sender=GalleryItem)
+def remember_gallery_slug(sender, instance, **kwargs):
+    # The slug is rebuilt on every save, so the old one has to be looked
+    # up to invalidate responses cached under it.
+    instance.previous_slug = None
+    if instance.pk:
+        instance.previous_slug = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=GalleryItem)
+@receiver(post_delete, sender=GalleryItem)
+def invalidate_gallery_responses(sender, instance, **kwargs):
+    invalidate_responses(
+        'gallery',
+        instance.slug,
+        getattr(instance, 'previous_slug', None)
+    )
+
+
+@receiver(post_save, sender=GalleryItem)
+@receiver(post_delete, sender=GalleryItem)
+def update_gallery_feeds(sender, instance, **kwargs):
+    feeds.schedule_update(GalleryItem, instance.pk)
+
+
+@receiver(pre_save, sender=GalleryImage)
+def remember_gallery_image_file(sender, instance, **kwargs):
+    remember_file(instance)
+
+
+@receiver(post_save, sender=GalleryImage)
+def create_gallery_image_renditions(sender, instance, created, **kwargs):
+    if created or not instance.renditions or file_replaced(instance):
+        store_renditions(instance)
+
+
+@receiver(post_delete, sender=GalleryImage)
+def delete_gallery_image_renditions(sender, instance, **kwargs):
+    discard_renditions(instance)
+
+
+@receiver(post_save, sender=GalleryImage)
+@receiver(post_delete, sender=GalleryImage)
+def touch_gallery_item(sender, instance, **kwargs):
+    items = GalleryItem.objects.filter(pk=instance.item_id)
+    items.update(updated_at=timezone.now())
+    invalidate_responses(
+        'gallery',
+        items.values_list('slug', flat=True).first()
+    )
+    feeds.schedule_update(GalleryItem, instance.item_id)
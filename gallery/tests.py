@@ -1,12 +1,18 @@
+import hashlib
 import json
 import shutil
 import tempfile
+from io import BytesIO
 
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import override_settings
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
 from .models import GalleryImage, GalleryItem
+from .serializers import GallerySerializer
 
 # Create your tests here.
 
@@ -67,7 +73,11 @@ class TestGalleryModels(APITestCase):
         self.assertEqual(gallery_image.item.make, 'Mercedes')
         self.assertEqual(gallery_image.item.model, '190E')
         self.assertEqual(gallery_image.item.trim, 'Cosworth')
-        self.assertEqual(gallery_image.image.url, '/media/gallery/image_1.jpg')
+        digest = hashlib.sha256(b'testimageofacar').hexdigest()
+        self.assertEqual(
+            gallery_image.image.url,
+            f'/media/images/{digest[:2]}/{digest}.jpg'
+        )
 
     def test_in_order(self):
         self.gallery_item()
@@ -78,6 +88,7 @@ class TestGalleryModels(APITestCase):
 class TestGalleryApp(APITestCase):
 
     def setUp(self):
+        cache.clear()
         g_1 = GalleryItem.objects.create(
             id=1,
             make="Mercedes",
@@ -163,3 +174,113 @@ class TestGalleryApp(APITestCase):
                 'images': []
             }
         )
+
+    def test_gallery_sparse_fieldsets(self):
+        GalleryImage.objects.create(
+            item_id=1,
+            image=SimpleUploadedFile('image_1.jpg', b'testimageofacar')
+        )
+        response = self.client.get('/api/gallery/?fields=id,slug')
+        self.assertEqual(
+            json.loads(response.content)['results'],
+            [
+                {'id': 2, 'slug': 'mercedes-190e-cosworth-1992'},
+                {'id': 1, 'slug': 'mercedes-a-class-a250-2013'},
+            ]
+        )
+        response = self.client.get(
+            '/api/gallery/mercedes-a-class-a250-2013/?fields=make'
+            '&expand=images'
+        )
+        content = json.loads(response.content)
+        self.assertEqual(list(content), ['make', 'images'])
+        self.assertEqual(len(content['images']), 1)
+
+    def test_gallery_list_prefetches_images(self):
+        for item_id in (1, 2):
+            GalleryImage.objects.create(
+                item_id=item_id,
+                image=SimpleUploadedFile('image_1.jpg', b'testimageofacar')
+            )
+        with self.assertNumQueries(4):
+            self.client.get('/api/gallery/')
+
+    def test_gallery_list_matches_serializer(self):
+        for item_id in (1, 1, 2):
+            GalleryImage.objects.create(
+                item_id=item_id,
+                image=SimpleUploadedFile('image_1.jpg', b'testimageofacar')
+            )
+        response = self.client.get('/api/gallery/')
+        serializer = GallerySerializer(
+            GalleryItem.objects.filter(published=True),
+            many=True
+        )
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render({
+                'count': 2,
+                'next': None,
+                'previous': None,
+                'results': serializer.data,
+            })
+        )
+
+    def test_gallery_image_renditions(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800)).save(buffer, 'JPEG')
+        GalleryImage.objects.create(
+            item_id=1,
+            image=SimpleUploadedFile('photo.jpg', buffer.getvalue())
+        )
+        response = self.client.get('/api/gallery/mercedes-a-class-a250-2013/')
+        srcset = json.loads(response.content)['images'][0]['srcset']
+        self.assertEqual(
+            [url.rsplit(' ', 1)[1] for url in srcset['webp'].split(', ')],
+            ['320w', '800w', '1200w']
+        )
+        self.assertTrue(srcset['jpeg'].startswith('/media/images/'))
+
+    def test_gallery_cache_invalidation(self):
+        self.client.get('/api/gallery/')
+        self.client.get('/api/gallery/mercedes-a-class-a250-2013/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/gallery/')
+            self.client.get('/api/gallery/mercedes-a-class-a250-2013/')
+
+        GalleryImage.objects.create(
+            item_id=1,
+            image=SimpleUploadedFile('image_2.jpg', b'testimageofacar')
+        )
+        response = self.client.get('/api/gallery/mercedes-a-class-a250-2013/')
+        self.assertEqual(len(json.loads(response.content)['images']), 1)
+
+        item = GalleryItem.objects.get(id=2)
+        item.published = False
+        item.save()
+        response = self.client.get('/api/gallery/')
+        self.assertEqual(json.loads(response.content)['count'], 1)
+        response = self.client.get('/api/gallery/mercedes-190e-cosworth-1992/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_gallery_conditional_requests(self):
+        url = '/api/gallery/mercedes-a-class-a250-2013/'
+        etag = self.client.get(url)['ETag']
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        updated_at = GalleryItem.objects.get(id=1).updated_at
+        GalleryImage.objects.create(
+            item_id=1,
+            image=SimpleUploadedFile('image_3.jpg', b'testimageofacar')
+        )
+        self.assertGreater(
+            GalleryItem.objects.get(id=1).updated_at, updated_at)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = self.client.get('/api/gallery/')['ETag']
+        response = self.client.get('/api/gallery/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
@@ -1,17 +1,28 @@
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 
+from backend.cache import CachedResponseMixin
+from backend.serializers import SparseFieldsetViewMixin, ValuesListMixin
+
 from .models import GalleryItem
 from .serializers import GallerySerializer
 
 
-class GalleryList(ListAPIView):
+class GalleryList(CachedResponseMixin, SparseFieldsetViewMixin,
+                  ValuesListMixin, ListAPIView):
+    cache_namespace = 'gallery'
     serializer_class = GallerySerializer
     paginate_by = 10
-    queryset = GalleryItem.objects.filter(published=True)
+    queryset = GalleryItem.objects.filter(
+        published=True
+    ).prefetch_related('galleryimage_set')
 
 
-class GalleryDetail(RetrieveAPIView):
+class GalleryDetail(CachedResponseMixin, SparseFieldsetViewMixin,
+                    RetrieveAPIView):
+    cache_namespace = 'gallery'
     serializer_class = GallerySerializer
-    queryset = GalleryItem.objects.filter(published=True)
+    queryset = GalleryItem.objects.filter(
+        published=True
+    ).prefetch_related('galleryimage_set')
     lookup_url_kwarg = 'slug'
     lookup_field = 'slug'
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.mail import BATCH_SIZE, send_outbox
+
+
+class Command(BaseCommand):
+    help = ('Send the emails waiting in the outbox, a batch at a time over '
+            'one SMTP connection, retrying failed ones with a growing '
+            'delay. Runs until stopped unless --once is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send the emails that are due and exit.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to wait for new emails when none are due.'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            count = send_outbox(options['batch_size'])
+            if count:
+                self.stdout.write(f'Attempted {count} emails.')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """Take over the outbox table from the sales app."""
+
+    initial = True
+
+    dependencies = [
+        ('sales', '0018_daily_id_sequences'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OutgoingEmail',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('from_email', models.CharField(max_length=254)),
+                        ('recipients', models.JSONField()),
+                        ('subject', models.CharField(blank=True, max_length=255)),
+                        ('message', models.BinaryField()),
+                        ('created_at', models.DateTimeField(auto_now_add=True)),
+                        ('sent_at', models.DateTimeField(blank=True, null=True)),
+                        ('attempts', models.PositiveSmallIntegerField(default=0)),
+                        ('next_attempt_at', models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True)),
+                        ('last_error', models.TextField(blank=True)),
+                    ],
+                    options={
+                        'ordering': ['id'],
+                        'db_table': 'sales_outgoingemail',
+                        'indexes': [models.Index(fields=['next_attempt_at'], name='outgoing_email_pending_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.AlterModelTable(
+            name='outgoingemail',
+            table=None,
+        ),
+    ]
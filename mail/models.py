@@ -0,0 +1,32 @@
+from django.db import models
+from django.utils import timezone
+
+
+class OutgoingEmail(models.Model):
+    """An email waiting in the outbox, see ``backend.mail``.
+
+    Sending an email stores it here, in the same transaction as the change
+    it is about, and the send_emails worker delivers it over SMTP.
+    """
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField()
+    subject = models.CharField(max_length=255, blank=True)
+    # The whole message as sent, with CRLF line endings.
+    message = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # None once the email is sent or has failed too often.
+    next_attempt_at = models.DateTimeField(
+        null=True, blank=True, default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at'], name='outgoing_email_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {", ".join(self.recipients)}'
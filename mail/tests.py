@@ -0,0 +1,222 @@
+import socketserver
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.mail import EmailMessage, send_mail
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from backend.mail import MAX_ATTEMPTS, SMTPSender, send_batch, send_outbox
+
+from .models import OutgoingEmail
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of an SMTP server to receive mail in tests.
+
+    Records each connection and the messages received, and rejects
+    recipients in ``refused``.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPStandInHandler)
+        self.connections = 0
+        self.messages = []
+        self.refused = set()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost ready')
+        sender, recipients = None, []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip('<>'), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipient = command[8:].strip('<>')
+                if recipient in self.server.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(recipient)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                self.server.messages.append((sender, recipients, data))
+                self.reply('250 OK')
+            elif verb == 'RSET':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Not implemented')
+
+
+@override_settings(
+    EMAIL_BACKEND='backend.mail.OutboxBackend',
+    EMAIL_HOST='127.0.0.1',
+    EMAIL_HOST_USER='',
+    EMAIL_HOST_PASSWORD='',
+    EMAIL_USE_TLS=False
+)
+class TestEmailOutbox(APITestCase):
+
+    def queue(self, count, **kwargs):
+        for number in range(count):
+            send_mail(
+                subject=f'Message {number}',
+                message='Hello',
+                from_email='info@cheshirewestvehicles.co.uk',
+                recipient_list=[kwargs.get('to', f'buyer{number}@test.com')]
+            )
+
+    def test_emails_are_stored_not_sent(self):
+        self.queue(2)
+        emails = OutgoingEmail.objects.all()
+        self.assertEqual(len(emails), 2)
+        self.assertEqual(emails[0].recipients, ['buyer0@test.com'])
+        self.assertEqual(emails[0].subject, 'Message 0')
+        self.assertIsNotNone(emails[0].next_attempt_at)
+
+    def test_emails_roll_back_with_the_transaction(self):
+        try:
+            with transaction.atomic():
+                self.queue(1)
+                raise RuntimeError('The change failed.')
+        except RuntimeError:
+            pass
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    def test_batch_is_sent_over_one_connection(self):
+        self.queue(3)
+        email = EmailMessage(
+            'Invoice', 'Attached', 'info@cheshirewestvehicles.co.uk',
+            to=['customer@test.com'], cc=['accounts@test.com']
+        )
+        email.attach('invoice.pdf', b'%PDF-1.4', 'application/pdf')
+        email.send()
+        with SMTPStandIn() as server, \
+                self.settings(EMAIL_PORT=server.server_address[1]):
+            self.assertEqual(send_outbox(), 4)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(len(server.messages), 4)
+        sender, recipients, data = server.messages[3]
+        self.assertEqual(sender, 'info@cheshirewestvehicles.co.uk')
+        self.assertEqual(recipients, ['customer@test.com', 'accounts@test.com'])
+        self.assertIn(b'Subject: Invoice', data)
+        self.assertIn(b'filename="invoice.pdf"', data)
+        self.assertFalse(
+            OutgoingEmail.objects.filter(sent_at__isnull=True).exists())
+        with SMTPStandIn() as server, \
+                self.settings(EMAIL_PORT=server.server_address[1]):
+            self.assertEqual(send_outbox(), 0)
+
+    def test_rejected_emails_are_retried(self):
+        self.queue(1, to='unknown@test.com')
+        self.queue(1)
+        with SMTPStandIn() as server, \
+                self.settings(EMAIL_PORT=server.server_address[1]):
+            server.refused.add('unknown@test.com')
+            with self.assertLogs('backend.mail', 'WARNING'):
+                self.assertEqual(send_outbox(), 2)
+        self.assertEqual(len(server.messages), 1)
+        rejected = OutgoingEmail.objects.get(recipients=['unknown@test.com'])
+        self.assertEqual(rejected.attempts, 1)
+        self.assertIsNone(rejected.sent_at)
+        self.assertIn('SMTPRecipientsRefused', rejected.last_error)
+        self.assertGreater(rejected.next_attempt_at, timezone.now())
+
+        OutgoingEmail.objects.filter(pk=rejected.pk).update(
+            next_attempt_at=timezone.now())
+        with SMTPStandIn() as server, \
+                self.settings(EMAIL_PORT=server.server_address[1]):
+            self.assertEqual(send_outbox(), 1)
+        rejected.refresh_from_db()
+        self.assertEqual(rejected.attempts, 2)
+        self.assertIsNotNone(rejected.sent_at)
+
+    def test_unreachable_server_puts_the_batch_off(self):
+        self.queue(3)
+        with SMTPStandIn() as server:
+            port = server.server_address[1]
+        with self.settings(EMAIL_PORT=port), \
+                self.assertLogs('backend.mail', 'ERROR') as logs:
+            self.assertEqual(send_outbox(), 3)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(
+            OutgoingEmail.objects.filter(
+                attempts=0, next_attempt_at__gt=timezone.now()).count(),
+            3
+        )
+        self.assertIn(
+            'ConnectionRefusedError', OutgoingEmail.objects.first().last_error)
+
+    def test_outages_do_not_use_up_attempts(self):
+        self.queue(1)
+        with SMTPStandIn() as server:
+            port = server.server_address[1]
+        with self.settings(EMAIL_PORT=port), \
+                self.assertLogs('backend.mail', 'ERROR'):
+            for _attempt in range(MAX_ATTEMPTS + 1):
+                OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+                send_outbox()
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.attempts, 0)
+        self.assertIsNotNone(email.next_attempt_at)
+
+    def test_claimed_emails_are_leased_while_sending(self):
+        self.queue(2)
+        leased = []
+
+        def send_email(_sender, email):
+            # Another worker finds nothing to claim meanwhile.
+            leased.append(send_batch())
+            self.assertGreater(
+                OutgoingEmail.objects.get(pk=email.pk).next_attempt_at,
+                timezone.now() + timedelta(minutes=5)
+            )
+
+        with mock.patch.object(SMTPSender, 'open'), \
+                mock.patch.object(SMTPSender, 'send_email', send_email):
+            self.assertEqual(send_outbox(), 2)
+        self.assertEqual(leased, [0, 0])
+        self.assertEqual(
+            OutgoingEmail.objects.filter(attempts=1, sent_at__isnull=False)
+            .count(),
+            2
+        )
+
+    def test_send_emails_command(self):
+        self.queue(2)
+        with SMTPStandIn() as server, \
+                self.settings(EMAIL_PORT=server.server_address[1]):
+            out = StringIO()
+            call_command('send_emails', '--once', stdout=out)
+        self.assertEqual(len(server.messages), 2)
+        self.assertIn('Attempted 2 emails.', out.getvalue())
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
+
+    def ready(self):
+        from . import signals  # pylint: disable=import-outside-toplevel,unused-import
+        from backend import checks  # pylint: disable=import-outside-toplevel,unused-import
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'vehicle_state'
+STREAM_PATH = '/api/sales/state/stream/'
+KEEPALIVE_SECONDS = 15
+RECONNECT_SECONDS = 5
+
+
+def publish_vehicle_state(vehicle):
+    """Notify listeners that the reserved state of ``vehicle`` changed.
+
+    PostgreSQL only delivers the notification once the surrounding
+    transaction commits, and drops it if the transaction rolls back.
+    """
+    payload = json.dumps({
+        'slug': vehicle.slug,
+        'reserved': vehicle.get_reserved_display(),
+    })
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+
+
+class VehicleStateBroadcaster:
+    """Fan PostgreSQL notifications out to the open event streams.
+
+    Each process holds a single LISTEN connection while at least one
+    client is subscribed; the socket is watched by the event loop, so idle
+    streams cost a queue each and no thread.
+    """
+    queue_size = 100
+
+    def __init__(self):
+        self.subscribers = set()
+        self._connection = None
+        self._loop = None
+        self._reconnect = None
+        self._starting = None
+
+    async def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        if self._connection is None and self._reconnect is None:
+            if self._starting is None:
+                self._starting = asyncio.ensure_future(self.listen())
+            await asyncio.shield(self._starting)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers:
+            self.close()
+
+    async def listen(self):
+        params = connections['default'].get_connection_params()
+        try:
+            conn = await sync_to_async(psycopg2.connect)(**params)
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+        except psycopg2.Error:
+            logger.exception('Could not listen for vehicle state changes.')
+            self.schedule_reconnect()
+            return
+        finally:
+            self._starting = None
+        if not self.subscribers:
+            conn.close()
+            return
+        self._connection = conn
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(conn.fileno(), self.read_notifications)
+
+    def schedule_reconnect(self):
+        loop = asyncio.get_running_loop()
+
+        def reconnect():
+            self._reconnect = None
+            if self.subscribers:
+                asyncio.ensure_future(self.listen())
+
+        self._reconnect = loop.call_later(RECONNECT_SECONDS, reconnect)
+
+    def read_notifications(self):
+        try:
+            self._connection.poll()
+        except psycopg2.Error:
+            logger.exception('Lost the vehicle state listener connection.')
+            self.close()
+            if self.subscribers:
+                self.schedule_reconnect()
+            return
+        while self._connection.notifies:
+            self.dispatch(self._connection.notifies.pop(0).payload)
+
+    def dispatch(self, payload):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                logger.warning('Dropped a vehicle state event for a slow '
+                               'client.')
+
+    def close(self):
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+            self._reconnect = None
+        if self._connection is None:
+            return
+        if not self._loop.is_closed():
+            self._loop.remove_reader(self._connection.fileno())
+        self._connection.close()
+        self._connection = None
+        self._loop = None
+
+
+broadcaster = VehicleStateBroadcaster()
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def vehicle_state_stream(scope, receive, send):
+    """ASGI application streaming vehicle state changes as Server-Sent
+    Events, one ``vehicle_state`` event per change with a ``{slug,
+    reserved}`` payload."""
+    queue = await broadcaster.subscribe()
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'access-control-allow-origin', b'*'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {RECONNECT_SECONDS * 1000}\n\n'.encode(),
+            'more_body': True,
+        })
+        while not disconnected.done():
+            event = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                {event, disconnected},
+                timeout=KEEPALIVE_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if event.done():
+                body = f'event: {CHANNEL}\ndata: {event.result()}\n\n'
+            elif disconnected.done():
+                event.cancel()
+                break
+            else:
+                event.cancel()
+                body = ': keepalive\n\n'
+            await send({
+                'type': 'http.response.body',
+                'body': body.encode(),
+                'more_body': True,
+            })
+    finally:
+        disconnected.cancel()
+        broadcaster.unsubscribe(queue)
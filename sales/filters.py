@@ -0,0 +1,213 @@
+from collections import Counter
+
+import django_filters
+import numpy as np
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity
+)
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from .models import Vehicle
+
+
+class VehicleFilter(django_filters.FilterSet):
+    q = django_filters.CharFilter(method='search')
+    make = django_filters.CharFilter(lookup_expr='iexact')
+    model = django_filters.CharFilter(lookup_expr='iexact')
+    fuel = django_filters.MultipleChoiceFilter(choices=Vehicle.Fuel.choices)
+    body_type = django_filters.MultipleChoiceFilter(
+        choices=Vehicle.BodyType.choices)
+    car_state = django_filters.MultipleChoiceFilter(
+        choices=Vehicle.CarState.choices)
+    year = django_filters.RangeFilter()
+    price = django_filters.RangeFilter()
+    mileage = django_filters.RangeFilter()
+
+    facet_fields = ['make', 'model', 'fuel', 'body_type', 'car_state']
+    histogram_fields = ['price', 'mileage']
+    choice_facets = {
+        'fuel': Vehicle.Fuel.choices,
+        'body_type': Vehicle.BodyType.choices,
+        'car_state': Vehicle.CarState.choices,
+    }
+
+    class Meta:
+        model = Vehicle
+        fields = [
+            'make',
+            'model',
+            'fuel',
+            'body_type',
+            'car_state',
+            'year',
+            'price',
+            'mileage',
+        ]
+
+    def search(self, queryset, name, value):
+        """Rank vehicles by full-text match across make, model, trim and
+        extras, with trigram similarity on make and model so that typos
+        such as "mercedez" still match."""
+        query = SearchQuery(value, config='english', search_type='websearch')
+        return queryset.annotate(
+            rank=SearchRank(F('search_vector'), query) + Greatest(
+                TrigramSimilarity('make', value),
+                TrigramSimilarity('model', value)
+            )
+        ).filter(
+            Q(search_vector=query) |
+            Q(make__trigram_similar=value) |
+            Q(model__trigram_similar=value)
+        ).order_by('-rank', '-id')
+
+    def get_selected_facets(self):
+        selected = {}
+        for name in self.facet_fields:
+            value = self.form.cleaned_data.get(name)
+            if not value:
+                continue
+            if isinstance(value, str):
+                value = [value]
+            selected[name] = {self._facet_key(name, item) for item in value}
+        return selected
+
+    def _facet_key(self, name, value):
+        if name in self.choice_facets:
+            return value
+        return value.lower()
+
+    def facet_counts(self):
+        """Count matching vehicles for every value of every facet.
+
+        The range filters are applied in SQL and the result grouped by the
+        facet columns, giving one row per distinct combination. The facet
+        filters are then applied to those rows in Python, each facet
+        ignoring its own selection so the other options stay visible.
+
+        Makes and models are filtered case-insensitively, so they are
+        counted by their lower case value too and labelled with their most
+        common spelling.
+        """
+        queryset = self.queryset
+        for name, value in self.form.cleaned_data.items():
+            if name not in self.facet_fields:
+                queryset = self.filters[name].filter(queryset, value)
+        rows = queryset.order_by().values(*self.facet_fields).annotate(
+            count=Count('id')
+        )
+
+        selected = self.get_selected_facets()
+        counts = {name: Counter() for name in self.facet_fields}
+        spellings = {
+            name: {} for name in self.facet_fields
+            if name not in self.choice_facets
+        }
+        total = 0
+        for row in rows:
+            keys = {
+                name: self._facet_key(name, row[name])
+                for name in self.facet_fields
+            }
+            rejected = [
+                name for name, values in selected.items()
+                if keys[name] not in values
+            ]
+            if not rejected:
+                total += row['count']
+            for name in self.facet_fields:
+                if name in spellings:
+                    spellings[name].setdefault(keys[name], Counter())[
+                        row[name]] += row['count']
+                if not rejected or rejected == [name]:
+                    counts[name][keys[name]] += row['count']
+
+        facets = {}
+        for name in self.facet_fields:
+            if name in self.choice_facets:
+                options = [
+                    (value, value, label)
+                    for value, label in self.choice_facets[name]
+                ]
+            else:
+                options = []
+                for key, spelling in spellings[name].items():
+                    if counts[name][key]:
+                        label = max(sorted(spelling), key=spelling.get)
+                        options.append((label, key, label))
+                options.sort()
+            facets[name] = [
+                {
+                    'value': value,
+                    'label': label,
+                    'count': counts[name][key]
+                } for value, key, label in options
+            ]
+        return {'count': total, 'facets': facets}
+
+    def histograms(self, buckets):
+        """Bucket the price and mileage of matching vehicles for range
+        sliders.
+
+        The other filters are applied in SQL and both columns read in one
+        query. The range filters are then applied to the arrays, each
+        histogram ignoring its own range like ``facet_counts`` does, so a
+        slider always shows the whole distribution it can select from.
+        """
+        queryset = self.queryset
+        ranges = {}
+        for name, value in self.form.cleaned_data.items():
+            if name in self.histogram_fields:
+                ranges[name] = value
+            else:
+                queryset = self.filters[name].filter(queryset, value)
+        rows = np.array(
+            list(queryset.order_by().values_list(*self.histogram_fields)),
+            dtype=np.float64
+        ).reshape(-1, len(self.histogram_fields))
+        columns = dict(zip(self.histogram_fields, rows.T))
+
+        matches = {}
+        for name, column in columns.items():
+            match = np.ones(len(column), dtype=bool)
+            selected = ranges.get(name)
+            if selected and selected.start is not None:
+                match &= column >= float(selected.start)
+            if selected and selected.stop is not None:
+                match &= column <= float(selected.stop)
+            matches[name] = match
+
+        histograms = {}
+        for name, column in columns.items():
+            others = np.ones(len(column), dtype=bool)
+            for other, match in matches.items():
+                if other != name:
+                    others &= match
+            histograms[name] = self._histogram(column[others], buckets)
+        total = np.logical_and.reduce(list(matches.values()))
+        return {'count': int(total.sum()), 'histograms': histograms}
+
+    def _histogram(self, values, buckets):
+        if not len(values):
+            return {'min': None, 'max': None, 'buckets': []}
+        low = int(np.floor(values.min()))
+        high = int(np.floor(values.max()))
+        # Whole number bucket widths keep the slider steps round.
+        width = max(1, -(-(high - low + 1) // buckets))
+        counts = np.bincount(
+            ((values - low) // width).astype(np.int64),
+            minlength=(high - low) // width + 1
+        )
+        return {
+            'min': low,
+            'max': high,
+            'buckets': [
+                {
+                    'min': low + index * width,
+                    'max': low + (index + 1) * width,
+                    'count': int(count),
+                } for index, count in enumerate(counts)
+            ]
+        }
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from gallery.views import GalleryList
+from sales.views import ListVehicles
+
+
+class Command(BaseCommand):
+    help = ('Time the model serializers against the values() read path '
+            'of the public list endpoints and check their output matches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=100)
+
+    def handle(self, *args, **options):
+        for path, view_class in (
+            ('/api/sales/', ListVehicles),
+            ('/api/gallery/', GalleryList),
+        ):
+            self.benchmark(path, view_class, options)
+
+    def benchmark(self, path, view_class, options):
+        request = Request(APIRequestFactory().get(path))
+        view = view_class(request=request, format_kwarg=None)
+        queryset = view.get_queryset()[:options['limit']]
+        renderer = JSONRenderer()
+
+        def model_serializer():
+            serializer = view.get_serializer(queryset.all(), many=True)
+            return renderer.render(serializer.data)
+
+        def values_serializer():
+            serializer = view.get_serializer()
+            rows = serializer.get_values_queryset(queryset.all())
+            return renderer.render(serializer.serialize_values(rows))
+
+        if model_serializer() != values_serializer():
+            raise CommandError(f'{path}: the values() output differs from '
+                               'the serializer output.')
+        timings = {}
+        for name, render in (
+            ('serializer', model_serializer),
+            ('values', values_serializer),
+        ):
+            start = time.perf_counter()
+            for _ in range(options['iterations']):
+                render()
+            timings[name] = (
+                (time.perf_counter() - start) / options['iterations'] * 1000
+            )
+        self.stdout.write(
+            f'{path} ({queryset.count()} rows): '
+            f'serializer {timings["serializer"]:.2f}ms, '
+            f'values {timings["values"]:.2f}ms, '
+            f'{timings["serializer"] / timings["values"]:.1f}x, '
+            'output identical'
+        )
@@ -0,0 +1,88 @@
+# pylint: disable=protected-access
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from backend import feeds
+from backend.cache import invalidate_responses
+from backend.images import regenerate_renditions
+from gallery.models import GalleryImage, GalleryItem
+from sales.models import Vehicle, VehicleImages
+
+
+class Command(BaseCommand):
+    help = ('Generate the resized renditions of vehicle and gallery images, '
+            'spreading the work over a pool of processes.')
+
+    # Image model, the foreign key to its parent, the parent model and the
+    # namespace its responses are cached under.
+    targets = (
+        (VehicleImages, 'vehicle_id', Vehicle, 'vehicles'),
+        (GalleryImage, 'item_id', GalleryItem, 'gallery'),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Regenerate renditions of images that already have them.'
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        for model, parent_key, parent, namespace in self.targets:
+            images = model.objects.order_by('pk')
+            if not options['all']:
+                images = images.filter(renditions={})
+            rows = list(images.values_list(
+                'pk', 'image', 'renditions', parent_key))
+            if not rows:
+                continue
+            # Worker processes must not inherit open database connections.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                initializer=django.setup
+            ) as executor:
+                for start in range(0, len(rows), options['batch_size']):
+                    self.process_batch(
+                        executor,
+                        model,
+                        rows[start:start + options['batch_size']]
+                    )
+            self.touch_parents(
+                parent, namespace, {row[3] for row in rows})
+            self.stdout.write(
+                f'{model._meta.label}: generated renditions for '
+                f'{len(rows)} images.'
+            )
+
+    def process_batch(self, executor, model, rows):
+        results = executor.map(
+            regenerate_renditions,
+            [model._meta.label] * len(rows),
+            ['image'] * len(rows),
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+        )
+        model.objects.bulk_update(
+            [
+                model(pk=row[0], renditions=renditions)
+                for row, renditions in zip(rows, results)
+            ],
+            ['renditions']
+        )
+
+    def touch_parents(self, parent, namespace, pks):
+        # bulk_update sends no signals, so the cached responses,
+        # validators and feed entries are refreshed here.
+        parents = parent.objects.filter(pk__in=pks)
+        parents.update(updated_at=timezone.now())
+        invalidate_responses(
+            namespace, *parents.values_list('slug', flat=True))
+        feeds.schedule_update(parent, *pks)
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sales.webhooks import process_events
+
+
+class Command(BaseCommand):
+    help = ('Handle the Stripe webhook events received by the API, oldest '
+            'first, retrying failed ones with a growing delay. Runs until '
+            'stopped unless --once is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Handle the events that are due and exit.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='Seconds to wait for new events when none are due.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = process_events()
+            if count:
+                self.stdout.write(f'Handled {count} Stripe events.')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from backend import feeds
+
+
+class Command(BaseCommand):
+    help = ('Build the sitemap and stock feeds from every vehicle and gallery '
+            'item. The update_feeds worker keeps them up to date as rows '
+            'change afterwards.')
+
+    def handle(self, *args, **options):
+        feeds.rebuild()
+        entries = feeds.load_entries()
+        self.stdout.write(
+            f'Built {", ".join(feeds.DOCUMENTS)} from {len(entries)} entries.'
+        )
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.feeds import BATCH_SIZE, update_pending
+
+
+class Command(BaseCommand):
+    help = ('Apply the queued changes to the sitemap and stock feeds, '
+            'rewriting the documents once for each batch. Runs until '
+            'stopped unless --once is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Apply the queued changes and exit.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to wait for new changes when none are queued.'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            count = update_pending(options['batch_size'])
+            if count:
+                self.stdout.write(f'Applied {count} feed updates.')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
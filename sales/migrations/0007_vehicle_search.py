@@ -0,0 +1,61 @@
+# Generated by Django 4.1.4 on 2026-10-18 09:06
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+SEARCH_VECTOR_TRIGGER = """
+CREATE FUNCTION sales_vehicle_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.make, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.model, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.trim, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.extras, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER sales_vehicle_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF make, model, trim, extras, search_vector
+    ON sales_vehicle
+    FOR EACH ROW EXECUTE FUNCTION sales_vehicle_search_vector_update();
+
+UPDATE sales_vehicle SET search_vector = NULL;
+"""
+
+DROP_SEARCH_VECTOR_TRIGGER = """
+DROP TRIGGER IF EXISTS sales_vehicle_search_vector_trigger ON sales_vehicle;
+DROP FUNCTION IF EXISTS sales_vehicle_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_reservation_alter_tradein_reservation_and_more'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='vehicle',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_TRIGGER, DROP_SEARCH_VECTOR_TRIGGER),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='vehicle_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['make'], name='vehicle_make_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['model'], name='vehicle_model_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
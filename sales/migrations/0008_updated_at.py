@@ -0,0 +1,18 @@
+# Generated by Django 4.1.4 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_vehicle_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.4 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicleimages',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.4 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0009_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='vrm',
+            field=models.CharField(blank=True, max_length=10, null=True, unique=True),
+        ),
+    ]
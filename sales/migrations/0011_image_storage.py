@@ -0,0 +1,19 @@
+# Generated by Django 4.1.4 on 2026-10-18 09:38
+
+import backend.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0010_vehicle_vrm'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vehicleimages',
+            name='image',
+            field=models.ImageField(storage=backend.storage.get_image_storage, upload_to='vehicle_images'),
+        ),
+    ]
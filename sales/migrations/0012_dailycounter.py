@@ -0,0 +1,50 @@
+# Generated by Django 4.1.4 on 2026-10-18 09:53
+
+import datetime
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    """Start each day's counter after the IDs already given out."""
+    model = apps.get_model('sales', 'Reservation')
+    counter = apps.get_model('sales', 'DailyCounter')
+    last = {}
+    for value in model.objects.filter(
+        order_id__regex=r'^[0-9]{7}'
+    ).values_list('order_id', flat=True):
+        day = datetime.datetime.strptime(value[:6], '%y%m%d').date()
+        last[day] = max(last.get(day, 0), int(value[7:]))
+    counter.objects.bulk_create(
+        counter(day=day, kind=3, value=value)
+        for day, value in last.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0011_image_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Customer'), (2, 'Invoice'), (3, 'Reservation')])),
+                ('value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='order_id',
+            field=models.CharField(blank=True, editable=False, max_length=12, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycounter',
+            constraint=models.UniqueConstraint(fields=('day', 'kind'), name='unique_daily_counter'),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.4 on 2026-10-18 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0012_dailycounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='hold_expires',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
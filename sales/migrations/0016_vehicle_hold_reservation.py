@@ -0,0 +1,19 @@
+# Generated by Django 4.1.4 on 2026-10-18 10:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0015_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='hold_reservation',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='sales.reservation'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.4 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0016_vehicle_hold_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
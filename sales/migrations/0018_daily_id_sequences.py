@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.utils import timezone
+
+KINDS = (1, 2, 3)
+DAY_SIZE = 10 ** 6
+
+
+def seed_sequences(apps, schema_editor):
+    """Carry on from the numbers the counters have given out today."""
+    counter = apps.get_model('sales', 'DailyCounter')
+    today = timezone.localdate()
+    with schema_editor.connection.cursor() as cursor:
+        for kind, value in counter.objects.filter(day=today).values_list(
+            'kind', 'value'
+        ):
+            cursor.execute(
+                'SELECT setval(%s, %s)',
+                [
+                    f'sales_daily_id_{kind}',
+                    int(today.strftime('%y%m%d')) * DAY_SIZE + value
+                ]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0017_feedupdate'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [f'CREATE SEQUENCE sales_daily_id_{kind}' for kind in KINDS],
+            [f'DROP SEQUENCE sales_daily_id_{kind}' for kind in KINDS],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='DailyCounter',
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Hand the outbox table over to the mail app."""
+
+    dependencies = [
+        ('sales', '0018_daily_id_sequences'),
+        ('mail', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.DeleteModel(
+                    name='OutgoingEmail',
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0019_move_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeevent',
+            name='object_id',
+            field=models.CharField(blank=True, max_length=255, default=''),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            "UPDATE sales_stripeevent "
+            "SET object_id = COALESCE(payload #>> '{data,object,id}', '')",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(fields=['object_id', 'created'], name='stripe_event_object_idx'),
+        ),
+    ]
@@ -1,10 +1,16 @@
 import datetime
+from django.conf import settings
 from phonenumber_field.modelfields import PhoneNumberField
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connection, models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 
 from auditlog.registry import auditlog
 
+from backend.storage import get_image_storage
+
 
 class Vehicle(models.Model):
     """Vehicle Model"""
@@ -36,6 +42,7 @@ class Vehicle(models.Model):
         CONVERTIBLE = "6", "Convertible"
 
     slug = models.SlugField(unique=True, null=True, blank=True)
+    vrm = models.CharField(max_length=10, unique=True, null=True, blank=True)
     make = models.CharField(max_length=15)
     model = models.CharField(max_length=15)
     trim = models.CharField(max_length=30)
@@ -63,21 +70,79 @@ class Vehicle(models.Model):
     extras = models.TextField()
     price = models.DecimalField(max_digits=7, decimal_places=2)
     published = models.BooleanField(default=False)
+    # The reservation of a buyer paying to reserve the vehicle, and until
+    # when nobody else may try, see hold().
+    hold_reservation = models.ForeignKey(
+        'Reservation',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
+    hold_expires = models.DateTimeField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Kept up to date by a database trigger, see migration 0007.
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ["-id"]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="vehicle_search_idx"),
+            GinIndex(
+                fields=["make"],
+                name="vehicle_make_trgm_idx",
+                opclasses=["gin_trgm_ops"]
+            ),
+            GinIndex(
+                fields=["model"],
+                name="vehicle_model_trgm_idx",
+                opclasses=["gin_trgm_ops"]
+            ),
+        ]
+
+    def is_held(self):
+        return self.hold_expires is not None and \
+            self.hold_expires > timezone.now()
 
     def is_for_sale(self):
-        if self.reserved == "1":
+        if self.reserved == "1" and not self.is_held():
             return True
         return False
 
+    def hold(self, reservation):
+        """Keep anyone else from reserving the vehicle while the buyer of
+        ``reservation`` pays, for CHECKOUT_HOLD. The hold lapses by itself
+        if they never do."""
+        self.hold_reservation = reservation
+        self.hold_expires = timezone.now() + settings.CHECKOUT_HOLD
+        # Only the hold changes, which cached responses don't include.
+        Vehicle.objects.filter(pk=self.pk).update(
+            hold_reservation=reservation, hold_expires=self.hold_expires)
+
+    def release_hold(self):
+        self.hold_reservation = None
+        self.hold_expires = None
+        Vehicle.objects.filter(pk=self.pk).update(
+            hold_reservation=None, hold_expires=None)
+
+    def can_be_paid_for_by(self, reservation):
+        """Return whether a payment for ``reservation`` may reserve the
+        vehicle: it is still for sale and nobody else holds it, although
+        the buyer's own hold may have expired."""
+        if self.reserved != "1":
+            return False
+        return self.hold_reservation_id in (None, reservation.pk) or \
+            not self.is_held()
+
     def __str__(self):
         return f"{self.id} {self.make} {self.model} {self.trim} - £{self.price}"
 
+    def build_slug(self):
+        return slugify(f'{self.make} {self.model} {self.trim} {self.year}')
+
     def save(self, *args, **kwargs):
-        self.slug = slugify(
-            f'{self.make} {self.model} {self.trim} {self.year}')
+        self.slug = self.build_slug()
         super(Vehicle, self).save(*args, **kwargs)
 
 
@@ -85,15 +150,75 @@ class VehicleImages(models.Model):
     """Images relating to a vehicle"""
     vehicle = models.ForeignKey(
         Vehicle, on_delete=models.CASCADE, related_name="images")
-    image = models.ImageField(upload_to="vehicle_images")
+    image = models.ImageField(
+        upload_to="vehicle_images", storage=get_image_storage)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.vehicle.id} - {self.id}"
 
 
+class DailyCounter:
+    """Daily IDs of reservations, invoices and customers.
+
+    An ID is the date, a digit for the kind of record and the number of
+    the record that day, at least three digits long, e.g. ``2301053001``.
+    Each kind has a Postgres sequence whose values are the date followed
+    by six digits of that day's number.
+    """
+    class Kind(models.IntegerChoices):
+        CUSTOMER = 1
+        INVOICE = 2
+        RESERVATION = 3
+
+    DAY_SIZE = 10 ** 6
+
+    @staticmethod
+    def sequence_name(kind):
+        return f'sales_daily_id_{int(kind)}'
+
+    @classmethod
+    def next_id(cls, kind):
+        """Return the next ID of ``kind``.
+
+        Sequences are not transactional, so the number is taken in a
+        single ``nextval`` that the caller's transaction does not hold on
+        to. A number taken by a transaction that rolls back is not given
+        out again, leaving a gap in that day's IDs.
+        """
+        day = int(timezone.localdate().strftime('%y%m%d'))
+        sequence = cls.sequence_name(kind)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s)', [sequence])
+            value = cursor.fetchone()[0]
+            if value // cls.DAY_SIZE < day:
+                value = cls.start_day(cursor, sequence, day)
+        day, number = divmod(value, cls.DAY_SIZE)
+        return f'{day:06d}{int(kind)}{number:03d}'
+
+    @classmethod
+    def start_day(cls, cursor, sequence, day):
+        """Move ``sequence`` on to ``day`` and take its next value.
+
+        Only the first callers of a day get here. The lock makes sure
+        just one of them resets the sequence; the others wait for it to
+        be released, once a day, and find the sequence moved.
+        """
+        with transaction.atomic():
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(hashtext(%s))', [sequence])
+            cursor.execute(
+                f'SELECT last_value FROM {connection.ops.quote_name(sequence)}')
+            if cursor.fetchone()[0] < day * cls.DAY_SIZE:
+                cursor.execute(
+                    'SELECT setval(%s, %s)', [sequence, day * cls.DAY_SIZE])
+            cursor.execute('SELECT nextval(%s)', [sequence])
+            return cursor.fetchone()[0]
+
+
 class Reservation(models.Model):
     order_id = models.CharField(
-        max_length=10,
+        max_length=12,
         blank=True,
         unique=True,
         editable=False
@@ -111,16 +236,8 @@ class Reservation(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.order_id:
-            today = datetime.date.today()
-            today_string = today.strftime('%y%m%d')
-            next_reservation_number = '001'
-            last_reservation = Reservation.objects.filter(
-                order_id__startswith=today_string
-            ).order_by('order_id').last()
-            if last_reservation:
-                last_reservation_number = int(last_reservation.order_id[7:])
-                next_reservation_number = f"{last_reservation_number + 1:03d}"
-            self.order_id = f'{today_string}3{next_reservation_number}'
+            self.order_id = DailyCounter.next_id(
+                DailyCounter.Kind.RESERVATION)
         super(Reservation, self).save(*args, **kwargs)
 
 
@@ -152,6 +269,64 @@ class ReservationAmount(models.Model):
         return f'£{self.amount/100:.2f} - {activity}'
 
 
+class StripeEvent(models.Model):
+    """A verified Stripe webhook event, kept until it has been handled.
+
+    Stripe delivers an event at least once; its id is unique here, so
+    retried deliveries are stored once and handled once, see
+    ``sales.webhooks``.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    # The Stripe object the event is about, such as a payment intent.
+    object_id = models.CharField(max_length=255, blank=True)
+    # When Stripe created the event, which is the order the events about
+    # one object are handled in.
+    created = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # None once the event is processed or has failed too often.
+    next_attempt_at = models.DateTimeField(
+        null=True, blank=True, default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['created', 'id']
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at', 'created'],
+                name='stripe_event_pending_idx'
+            ),
+            models.Index(
+                fields=['object_id', 'created'],
+                name='stripe_event_object_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.event_id} {self.type}'
+
+
+class FeedUpdate(models.Model):
+    """A row whose feed entries are to be rendered again, see
+    ``backend.feeds``.
+
+    Changes are queued here in the transaction that makes them, and the
+    update_feeds worker rewrites the documents once for each batch.
+    """
+    # The label of the model, such as sales.Vehicle.
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
+
+
 auditlog.register(Vehicle)
 auditlog.register(VehicleImages)
 auditlog.register(Reservation)
@@ -0,0 +1,37 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class VehicleCursorPagination(CursorPagination):
+    page_size = 10
+    ordering = '-id'
+
+
+class VehiclePagination(LimitOffsetPagination):
+    """Keyset pagination for clients that ask for it with ``?cursor=``.
+
+    The first cursor page is requested with an empty ``cursor`` parameter
+    and every following page with the ``next`` link returned. Requests
+    without a cursor keep the limit/offset behaviour older clients rely on,
+    as do searches, which are ordered by rank rather than by id.
+    """
+    cursor_class = VehicleCursorPagination
+    search_query_param = 'q'
+
+    def get_paginator(self, request):
+        if request.query_params.get(self.search_query_param):
+            return None
+        if self.cursor_class.cursor_query_param in request.query_params:
+            return self.cursor_class()
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = self.get_paginator(request)
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
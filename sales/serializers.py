@@ -1,18 +1,33 @@
 from rest_framework import serializers
+
+from backend.images import InvalidImage, create_images, process_uploads
+from backend.serializers import (
+    SparseFieldsetMixin,
+    SrcsetField,
+    ValuesSerializerMixin
+)
+
 from .models import Vehicle, VehicleImages, Reservation, TradeIn
 
 
-class VehicleImagesSerializer(serializers.ModelSerializer):
+class VehicleImagesSerializer(ValuesSerializerMixin,
+                              serializers.ModelSerializer):
+    srcset = SrcsetField()
+
     class Meta:
         model = VehicleImages
         fields = [
             "id",
             "vehicle",
             "image",
+            "srcset",
         ]
 
 
-class VehicleSerializer(serializers.ModelSerializer):
+class VehicleSerializer(SparseFieldsetMixin, ValuesSerializerMixin,
+                        serializers.ModelSerializer):
+    expandable_fields = {'images': 'images'}
+
     images = VehicleImagesSerializer(many=True, read_only=True)
     uploaded_images = serializers.ListField(
         child=serializers.FileField(
@@ -64,27 +79,21 @@ class VehicleSerializer(serializers.ModelSerializer):
             'uploaded_images',
         ]
 
+    def validate_uploaded_images(self, value):
+        try:
+            return process_uploads(value)
+        except InvalidImage as error:
+            raise serializers.ValidationError(str(error)) from error
+
     def create(self, validated_data):
-        if 'uploaded_images' in validated_data:
-            uploaded_images = validated_data.pop('uploaded_images')
-            vehicle = Vehicle.objects.create(**validated_data)
-            for image in uploaded_images:
-                VehicleImages.objects.create(
-                    vehicle_id=vehicle.id,
-                    image=image
-                )
-        else:
-            vehicle = Vehicle.objects.create(**validated_data)
+        uploaded_images = validated_data.pop('uploaded_images', [])
+        vehicle = Vehicle.objects.create(**validated_data)
+        create_images(VehicleImages, vehicle, uploaded_images, 'vehicles')
         return vehicle
 
     def update(self, instance, validated_data):
-        if 'uploaded_images' in validated_data:
-            uploaded_images = validated_data.pop('uploaded_images')
-            for image in uploaded_images:
-                VehicleImages.objects.create(
-                    vehicle_id=instance.id,
-                    image=image
-                )
+        uploaded_images = validated_data.pop('uploaded_images', [])
+        create_images(VehicleImages, instance, uploaded_images, 'vehicles')
         super().update(instance, validated_data)
         return instance
 
@@ -93,10 +102,11 @@ class VehicleStateSerializer(serializers.ModelSerializer):
     reserved = serializers.CharField(
         source="get_reserved_display"
     )
+    on_hold = serializers.BooleanField(source="is_held", read_only=True)
 
     class Meta:
         model = Vehicle
-        fields = ["id", "reserved"]
+        fields = ["id", "reserved", "on_hold"]
 
 
 class TradeInSerializer(serializers.ModelSerializer):
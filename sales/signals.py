@@ -0,0 +1,110 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from backend import feeds
+from backend.cache import invalidate_responses
+from backend.images import (
+    discard_renditions, file_replaced, remember_file, store_renditions)
+
+from .events import publish_vehicle_state
+from .models import ReservationAmount, Vehicle, VehicleImages
+from .similarity import similarity_index
+from .state import vehicle_status_map
+from .utils import reservation_amount
+
+STATE_FIELDS = ('slug', 'reserved', 'published')
+
+
+@receiver(pre_save, sender=Vehicle)
+def remember_vehicle_state(sender, instance, **kwargs):
+    # The slug is rebuilt on every save, so the stored values have to be
+    # looked up to know what the save changed.
+    instance.previous_state = None
+    if instance.pk:
+        instance.previous_state = sender.objects.filter(
+            pk=instance.pk
+        ).values(*STATE_FIELDS).first()
+
+
+def state_changed(instance):
+    previous = getattr(instance, 'previous_state', None)
+    if previous is None:
+        return True
+    return any(
+        previous[field] != getattr(instance, field)
+        for field in STATE_FIELDS
+    )
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_vehicle_responses(sender, instance, **kwargs):
+    previous = getattr(instance, 'previous_state', None) or {}
+    invalidate_responses('vehicles', instance.slug, previous.get('slug'))
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def refresh_vehicle_status_map(sender, instance, **kwargs):
+    if kwargs.get('created') is False and not state_changed(instance):
+        return
+    vehicle_status_map.changed()
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def refresh_similarity_index(sender, instance, **kwargs):
+    # Any field of the vehicle may be a feature. The index is rebuilt from
+    # committed rows, so it is only invalidated once they are.
+    transaction.on_commit(similarity_index.invalidate)
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def update_vehicle_feeds(sender, instance, **kwargs):
+    feeds.schedule_update(Vehicle, instance.pk)
+
+
+@receiver(post_save, sender=Vehicle)
+def push_vehicle_state(sender, instance, created, **kwargs):
+    previous = getattr(instance, 'previous_state', None)
+    if created or previous is None or \
+            previous['reserved'] == instance.reserved:
+        return
+    publish_vehicle_state(instance)
+
+
+@receiver(pre_save, sender=VehicleImages)
+def remember_vehicle_image_file(sender, instance, **kwargs):
+    remember_file(instance)
+
+
+@receiver(post_save, sender=VehicleImages)
+def create_vehicle_image_renditions(sender, instance, created, **kwargs):
+    if created or not instance.renditions or file_replaced(instance):
+        store_renditions(instance)
+
+
+@receiver(post_delete, sender=VehicleImages)
+def delete_vehicle_image_renditions(sender, instance, **kwargs):
+    discard_renditions(instance)
+
+
+@receiver(post_save, sender=VehicleImages)
+@receiver(post_delete, sender=VehicleImages)
+def touch_vehicle(sender, instance, **kwargs):
+    vehicles = Vehicle.objects.filter(pk=instance.vehicle_id)
+    vehicles.update(updated_at=timezone.now())
+    invalidate_responses(
+        'vehicles',
+        vehicles.values_list('slug', flat=True).first()
+    )
+    feeds.schedule_update(Vehicle, instance.vehicle_id)
+
+
+@receiver(post_save, sender=ReservationAmount)
+@receiver(post_delete, sender=ReservationAmount)
+def refresh_reservation_amount(sender, instance, **kwargs):
+    reservation_amount.changed()
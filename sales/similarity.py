@@ -0,0 +1,93 @@
+# pylint: disable=protected-access
+import numpy as np
+
+from backend.cache import GenerationCache
+
+from .models import Vehicle
+
+# Numeric features with the weight of a difference of one standard
+# deviation of current stock.
+NUMERIC_FEATURES = (
+    ('price', 2.0),
+    ('year', 1.0),
+    ('mileage', 1.0),
+    ('engine_size', 0.5),
+)
+# Choice features with the weight of a mismatch, on the same scale.
+CHOICE_FEATURES = (
+    ('fuel', 1.0),
+    ('body_type', 1.0),
+)
+
+
+class SimilarityIndex(GenerationCache):
+    """Per-process feature matrix of published vehicles for finding the
+    vehicles for sale most like a given one.
+
+    Numeric features are standardised and choices one-hot encoded, each
+    scaled by its weight, so the squared euclidean distance between two
+    rows scores how alike two vehicles are. The matrix is rebuilt with one
+    query when the ``vehicles:similarity`` generation moves, which saving
+    or deleting any vehicle does.
+    """
+    generation_name = 'vehicles:similarity'
+
+    def empty_index(self):
+        return {}, None, None, np.empty(0, dtype=np.int64), None
+
+    def load(self):
+        numeric = [name for name, _ in NUMERIC_FEATURES]
+        choices = [name for name, _ in CHOICE_FEATURES]
+        rows = list(Vehicle.objects.filter(published=True).order_by(
+            'pk').values_list('pk', 'slug', 'reserved', *numeric, *choices))
+        if not rows:
+            return self.empty_index()
+        columns = list(zip(*rows))
+        ids = np.array(columns[0], dtype=np.int64)
+
+        values = np.array(columns[3:3 + len(numeric)], dtype=np.float64).T
+        deviation = values.std(axis=0)
+        deviation[deviation == 0] = 1
+        features = [
+            (values - values.mean(axis=0)) / deviation *
+            np.array([weight for _, weight in NUMERIC_FEATURES])
+        ]
+        for column, (name, weight) in zip(
+            columns[3 + len(numeric):], CHOICE_FEATURES
+        ):
+            options = np.array([
+                value for value, _ in Vehicle._meta.get_field(name).choices
+            ])
+            one_hot = np.array(column)[:, np.newaxis] == options
+            # Two mismatched one-hot rows differ in two columns.
+            features.append(one_hot * (weight / np.sqrt(2)))
+        matrix = np.hstack(features)
+
+        positions = {
+            slug: position for position, slug in enumerate(columns[1])
+        }
+        for_sale = np.array(columns[2]) == Vehicle.Reserve.FOR_SALE
+        return positions, ids, matrix, ids[for_sale], matrix[for_sale]
+
+    def lookup(self, slug, limit):
+        """Return the ids of up to ``limit`` vehicles for sale closest to the
+        published vehicle ``slug``, closest first, or None when there is no
+        such vehicle."""
+        positions, ids, matrix, candidate_ids, candidates = self.refresh()
+        position = positions.get(slug)
+        if position is None:
+            return None
+        # The vehicle itself is left out when it is for sale.
+        others = candidate_ids != ids[position]
+        candidate_ids = candidate_ids[others]
+        differences = candidates[others] - matrix[position]
+        distances = np.einsum('ij,ij->i', differences, differences)
+        limit = min(limit, len(distances))
+        if not limit:
+            return []
+        nearest = np.argpartition(distances, limit - 1)[:limit]
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        return candidate_ids[nearest].tolist()
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,44 @@
+from backend.cache import GenerationCache
+
+from .models import Vehicle
+
+
+class VehicleStatusMap(GenerationCache):
+    """Per-process map of the reserved state of every published vehicle.
+
+    The whole map is loaded with one query and kept until the
+    ``vehicles:state`` generation moves. Saving a vehicle whose state
+    changed bumps the generation, so every process sharing the cache
+    reloads on its next lookup.
+    """
+    generation_name = 'vehicles:state'
+
+    def load(self):
+        labels = dict(Vehicle.Reserve.choices)
+        by_id = {}
+        by_slug = {}
+        rows = Vehicle.objects.filter(published=True).values_list(
+            'id', 'slug', 'reserved')
+        for vehicle_id, slug, reserved in rows:
+            state = {
+                'id': vehicle_id,
+                'slug': slug,
+                'reserved': labels.get(reserved, reserved),
+            }
+            by_id[vehicle_id] = state
+            by_slug[slug] = state
+        return by_id, by_slug
+
+    def lookup(self, ids=(), slugs=()):
+        by_id, by_slug = self.refresh()
+        states = {}
+        for vehicle_id in ids:
+            if vehicle_id in by_id:
+                states[vehicle_id] = by_id[vehicle_id]
+        for slug in slugs:
+            if slug in by_slug:
+                states[by_slug[slug]['id']] = by_slug[slug]
+        return list(states.values())
+
+
+vehicle_status_map = VehicleStatusMap()
@@ -1,19 +1,46 @@
+import asyncio
 import json
 import shutil
 import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import override_settings
-from rest_framework.test import APITestCase
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from PIL import Image
+import stripe
+
+from backend.checks import check_shared_cache
+from gallery.models import GalleryItem
 
 from .models import (
+    DailyCounter,
+    StripeEvent,
     Vehicle,
     VehicleImages,
     Reservation,
     TradeIn,
     ReservationAmount
 )
-from .utils import get_reservation_amount
+from .serializers import VehicleSerializer
+from .similarity import similarity_index
+from .state import vehicle_status_map
+from .utils import ReservationAmountCache, get_reservation_amount
+from .webhooks import MAX_ATTEMPTS, process_events
 
 MEDIA_ROOT = tempfile.mkdtemp()
 
@@ -22,6 +49,7 @@ MEDIA_ROOT = tempfile.mkdtemp()
 class TestView(APITestCase):
 
     def setUp(self):
+        cache.clear()
         v_1 = Vehicle.objects.create(
             slug="mercedes-a-class-a250",
             make="Mercedes",
@@ -118,6 +146,52 @@ class TestView(APITestCase):
             }
         )
 
+    def test_get_list_of_vehicles_cursor_pagination(self):
+        for number in range(11):
+            Vehicle.objects.create(
+                make="Ford",
+                model="Focus",
+                trim=f"Zetec {number}",
+                year=2015,
+                mileage=60000,
+                engine_size=1596,
+                mot_expiry="2023-12-01",
+                extras="Test Focus",
+                price=6000.00,
+                published=True
+            )
+        response = self.client.get("/api/sales/?cursor=")
+        self.assertEqual(response.status_code, 200)
+        first_page = json.loads(response.content)
+        self.assertNotIn("count", first_page)
+        self.assertIsNone(first_page["previous"])
+        self.assertEqual(len(first_page["results"]), 10)
+
+        response = self.client.get(first_page["next"])
+        self.assertEqual(response.status_code, 200)
+        second_page = json.loads(response.content)
+        self.assertIsNone(second_page["next"])
+        self.assertEqual(len(second_page["results"]), 3)
+
+        ids = [
+            vehicle["id"] for vehicle
+            in first_page["results"] + second_page["results"]
+        ]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(set(ids)), 13)
+
+    def test_get_list_of_vehicles_offset_pagination(self):
+        a_class = Vehicle.objects.get(slug="mercedes-a-class-a250-2013")
+        response = self.client.get("/api/sales/?limit=1&offset=1")
+        self.assertEqual(response.status_code, 200)
+        page = json.loads(response.content)
+        self.assertEqual(page["count"], 2)
+        self.assertIsNone(page["next"])
+        self.assertEqual(
+            [vehicle["id"] for vehicle in page["results"]],
+            [a_class.id]
+        )
+
     def test_get_vehicle_detail(self):
         vehicle = Vehicle.objects.get(slug="mercedes-a-class-a250-2013")
         response = self.client.get(f"/api/sales/{vehicle.slug}/")
@@ -158,7 +232,8 @@ class TestView(APITestCase):
             json.loads(response.content),
             {
                 "id": vehicle.id,
-                "reserved": "For Sale"
+                "reserved": "For Sale",
+                "on_hold": False
             }
         )
 
@@ -261,6 +336,1614 @@ class TestView(APITestCase):
         ).exists())
 
 
+class TestVehicleQueryCounts(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = Vehicle.objects.bulk_create([
+            Vehicle(
+                slug=f"ford-focus-zetec-{number}",
+                make="Ford",
+                model="Focus",
+                trim=f"Zetec {number}",
+                year=2015,
+                reserved=str(number % 2 + 1),
+                mileage=60000 + number,
+                engine_size=1596,
+                mot_expiry="2023-12-01",
+                extras="Test Focus",
+                price=6000.00,
+                published=True
+            ) for number in range(3000)
+        ])
+        VehicleImages.objects.bulk_create([
+            VehicleImages(
+                vehicle=vehicle,
+                image=f"vehicle_images/{vehicle.slug}-{number}.jpg"
+            ) for vehicle in vehicles for number in range(3)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    # Cold requests make one extra indexed lookup for the ETag and
+    # Last-Modified validators.
+    def test_list_query_count_is_independent_of_page_size(self):
+        for limit in (10, 100, 500):
+            with self.assertNumQueries(4):
+                response = self.client.get(f"/api/sales/?limit={limit}")
+            self.assertEqual(response.status_code, 200)
+            results = json.loads(response.content)["results"]
+            self.assertEqual(len(results), limit)
+            self.assertTrue(all(len(v["images"]) == 3 for v in results))
+
+    def test_list_query_count_deep_offset(self):
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/sales/?limit=10&offset=2990")
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_query_count_cursor(self):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/sales/?cursor=")
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(3):
+            response = self.client.get(json.loads(response.content)["next"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_query_count(self):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/sales/ford-focus-zetec-1500/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)["images"]), 3)
+
+    def test_sparse_fieldset_list(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/api/sales/?fields=id,slug,make,model,price&limit=5")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn('"extras"', queries[-1]["sql"])
+        results = json.loads(response.content)["results"]
+        self.assertEqual(len(results), 5)
+        for vehicle in results:
+            self.assertEqual(
+                list(vehicle),
+                ["id", "slug", "make", "model", "price"]
+            )
+
+    def test_sparse_fieldset_expand(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                "/api/sales/?fields=slug,reserved&expand=images&limit=5")
+        for vehicle in json.loads(response.content)["results"]:
+            self.assertEqual(list(vehicle), ["slug", "reserved", "images"])
+            self.assertEqual(len(vehicle["images"]), 3)
+
+    def test_sparse_fieldset_detail(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                "/api/sales/ford-focus-zetec-1500/?fields=slug,fuel")
+        self.assertEqual(
+            json.loads(response.content),
+            {"slug": "ford-focus-zetec-1500", "fuel": "Petrol"}
+        )
+        response = self.client.get(
+            "/api/sales/ford-focus-zetec-1500/?expand=images")
+        self.assertIn("extras", json.loads(response.content))
+
+
+class TestValuesSerialization(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = Vehicle.objects.bulk_create([
+            Vehicle(
+                slug=f"bmw-3-series-{number}",
+                make="BMW",
+                model="3 Series",
+                trim=f"320d {number}",
+                year=1980 + number,
+                fuel=str(number % 4 + 1),
+                body_type=str(number % 6 + 1),
+                car_state=str(number % 2 + 1),
+                reserved=str(number % 3 + 1),
+                mileage=1000 * number,
+                engine_size=1995,
+                mot_expiry=f"2024-{number % 12 + 1:02}-01",
+                extras=f"Extras \u00a3{number}",
+                price=f"{number * 1000 + 0.5}",
+                published=True
+            ) for number in range(24)
+        ])
+        VehicleImages.objects.bulk_create([
+            VehicleImages(
+                vehicle=vehicle,
+                image=f"vehicle_images/{vehicle.slug}-{number}.jpg"
+            ) for vehicle in vehicles[::2] for number in range(2)
+        ] + [VehicleImages(vehicle=vehicles[1], image="")])
+
+    def render_both(self, url, queryset):
+        request = Request(APIRequestFactory().get(url))
+        serializer = VehicleSerializer(
+            queryset, many=True, context={"request": request})
+        expected = JSONRenderer().render(serializer.data)
+        serializer = VehicleSerializer(context={"request": request})
+        rows = serializer.get_values_queryset(queryset)
+        actual = JSONRenderer().render(serializer.serialize_values(rows))
+        return expected, actual
+
+    def test_output_matches_serializer(self):
+        queryset = Vehicle.objects.prefetch_related("images")
+        expected, actual = self.render_both("/api/sales/", queryset)
+        self.assertEqual(actual, expected)
+        expected, actual = self.render_both(
+            "/api/sales/?fields=slug,fuel,price&expand=images", queryset)
+        self.assertEqual(actual, expected)
+
+    def test_endpoint_matches_serializer(self):
+        cache.clear()
+        response = self.client.get("/api/sales/?limit=100")
+        queryset = Vehicle.objects.filter(
+            reserved__in=["1", "2"], published=True
+        ).prefetch_related("images")
+        expected, _ = self.render_both("/api/sales/?limit=100", queryset)
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render({
+                "count": queryset.count(),
+                "next": None,
+                "previous": None,
+                "results": json.loads(expected),
+            })
+        )
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_serializers", iterations=1, stdout=out)
+        self.assertIn("/api/sales/ (16 rows)", out.getvalue())
+        self.assertEqual(out.getvalue().count("output identical"), 2)
+
+
+class TestVehicleFacets(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        stock = [
+            ("Ford", "Focus", 2015, "1", "2", "1", 60000, 6000.00, True),
+            ("Ford", "Fiesta", 2018, "2", "2", "2", 30000, 8500.00, True),
+            ("BMW", "3 Series", 2019, "2", "3", "1", 25000, 18000.00, True),
+            ("BMW", "1 Series", 2012, "1", "2", "2", 90000, 5000.00, True),
+            ("Audi", "A4", 2017, "2", "3", "1", 50000, 11000.00, False),
+        ]
+        for make, model, year, fuel, body_type, reserved, mileage, price, \
+                published in stock:
+            Vehicle.objects.create(
+                make=make,
+                model=model,
+                trim="Test",
+                year=year,
+                fuel=fuel,
+                body_type=body_type,
+                reserved=reserved,
+                mileage=mileage,
+                engine_size=1998,
+                mot_expiry="2023-12-01",
+                extras="Test",
+                price=price,
+                published=published
+            )
+        Vehicle.objects.create(
+            make="Ford",
+            model="Focus",
+            trim="Sold",
+            year=2016,
+            fuel="2",
+            reserved="3",
+            mileage=40000,
+            engine_size=1596,
+            mot_expiry="2023-12-01",
+            extras="Test",
+            price=7000.00,
+            published=True
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_facets(self, query=""):
+        response = self.client.get(f"/api/sales/facets/{query}")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def facet(self, data, name):
+        return {
+            option["label"]: option["count"]
+            for option in data["facets"][name]
+        }
+
+    def test_list_filters(self):
+        response = self.client.get("/api/sales/?fuel=2")
+        self.assertEqual(
+            [vehicle["model"] for vehicle
+             in json.loads(response.content)["results"]],
+            ["3 Series", "Fiesta"]
+        )
+        response = self.client.get(
+            "/api/sales/?make=ford&price_max=7000&mileage_min=50000")
+        self.assertEqual(
+            [vehicle["model"] for vehicle
+             in json.loads(response.content)["results"]],
+            ["Focus"]
+        )
+        response = self.client.get("/api/sales/?year_min=2016&body_type=2")
+        self.assertEqual(
+            [vehicle["model"] for vehicle
+             in json.loads(response.content)["results"]],
+            ["Fiesta"]
+        )
+
+    def test_facets_without_filters(self):
+        data = self.get_facets()
+        self.assertEqual(data["count"], 4)
+        self.assertEqual(
+            self.facet(data, "fuel"),
+            {"Petrol": 2, "Diesel": 2, "Hybrid": 0, "Electric": 0}
+        )
+        self.assertEqual(self.facet(data, "make"), {"BMW": 2, "Ford": 2})
+        self.assertEqual(
+            data["facets"]["body_type"][1],
+            {"value": "2", "label": "Hatchback", "count": 3}
+        )
+
+    def test_facets_ignore_their_own_selection(self):
+        data = self.get_facets("?fuel=2")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(self.facet(data, "fuel")["Petrol"], 2)
+        self.assertEqual(self.facet(data, "fuel")["Diesel"], 2)
+        self.assertEqual(self.facet(data, "make"), {"BMW": 1, "Ford": 1})
+
+        data = self.get_facets("?fuel=2&make=bmw")
+        self.assertEqual(data["count"], 1)
+        self.assertEqual(self.facet(data, "make"), {"BMW": 1, "Ford": 1})
+        self.assertEqual(self.facet(data, "fuel")["Petrol"], 1)
+        self.assertEqual(self.facet(data, "fuel")["Diesel"], 1)
+        self.assertEqual(self.facet(data, "model"), {"3 Series": 1})
+
+    def test_facets_ignore_case(self):
+        Vehicle.objects.create(
+            make="FORD",
+            model="focus",
+            trim="Test",
+            year=2020,
+            fuel="1",
+            mileage=10000,
+            engine_size=998,
+            mot_expiry="2023-12-01",
+            extras="Test",
+            price=12000.00,
+            published=True
+        )
+        data = self.get_facets()
+        self.assertEqual(self.facet(data, "make"), {"BMW": 2, "Ford": 3})
+        self.assertEqual(self.facet(data, "model")["Focus"], 2)
+        data = self.get_facets("?make=FORD&model=Focus")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(self.facet(data, "make"), {"Ford": 2})
+
+    def test_facets_apply_range_filters(self):
+        data = self.get_facets("?year_min=2015&price_max=10000")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(self.facet(data, "make"), {"Ford": 2})
+
+    def test_facets_single_query(self):
+        with self.assertNumQueries(2):
+            self.get_facets("?fuel=1&fuel=2&make=ford&year_min=2010")
+
+    def test_facets_invalid_filter(self):
+        response = self.client.get("/api/sales/facets/?fuel=9")
+        self.assertEqual(response.status_code, 400)
+
+    def get_histograms(self, query=""):
+        response = self.client.get(f"/api/sales/histograms/{query}")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def bucket_counts(self, data, name):
+        return [
+            bucket["count"]
+            for bucket in data["histograms"][name]["buckets"]
+        ]
+
+    def test_histograms_without_filters(self):
+        data = self.get_histograms("?buckets=4")
+        self.assertEqual(data["count"], 4)
+        price = data["histograms"]["price"]
+        self.assertEqual((price["min"], price["max"]), (5000, 18000))
+        self.assertEqual(
+            price["buckets"][0], {"min": 5000, "max": 8251, "count": 2})
+        self.assertEqual(self.bucket_counts(data, "price"), [2, 1, 0, 1])
+        self.assertEqual(self.bucket_counts(data, "mileage"), [2, 0, 1, 1])
+
+    def test_histograms_ignore_their_own_range(self):
+        data = self.get_histograms("?fuel=2&price_max=10000&buckets=2")
+        self.assertEqual(data["count"], 1)
+        # The price range leaves the price histogram alone but narrows the
+        # mileage one.
+        self.assertEqual(self.bucket_counts(data, "price"), [1, 1])
+        self.assertEqual(
+            data["histograms"]["mileage"],
+            {"min": 30000, "max": 30000,
+             "buckets": [{"min": 30000, "max": 30001, "count": 1}]}
+        )
+        data = self.get_histograms("?make=tesla")
+        self.assertEqual(data["count"], 0)
+        self.assertEqual(
+            data["histograms"]["price"],
+            {"min": None, "max": None, "buckets": []}
+        )
+
+    def test_histograms_are_cached_per_filter(self):
+        with self.assertNumQueries(2):
+            self.get_histograms("?make=ford")
+        with self.assertNumQueries(0):
+            self.get_histograms("?make=ford")
+        vehicle = Vehicle.objects.get(model="Fiesta")
+        vehicle.price = 9500
+        vehicle.save()
+        data = self.get_histograms("?make=ford&buckets=1")
+        self.assertEqual(data["histograms"]["price"]["max"], 9500)
+
+    def test_histograms_invalid_buckets(self):
+        for buckets in ("0", "51", "ten"):
+            response = self.client.get(
+                f"/api/sales/histograms/?buckets={buckets}")
+            self.assertEqual(response.status_code, 400)
+
+
+class TestVehicleSearch(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        stock = [
+            ("Mercedes", "A Class", "A250 AMG", "Panoramic roof"),
+            ("BMW", "3 Series", "M Sport", "Heated seats"),
+            ("Volvo", "V70", "R", "Roof rails, previously owned by a BMW "
+             "dealer"),
+        ]
+        for make, model, trim, extras in stock:
+            Vehicle.objects.create(
+                make=make,
+                model=model,
+                trim=trim,
+                year=2015,
+                mileage=60000,
+                engine_size=1998,
+                mot_expiry="2023-12-01",
+                extras=extras,
+                price=9000.00,
+                published=True
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get(f"/api/sales/?q={query}")
+        self.assertEqual(response.status_code, 200)
+        return [
+            vehicle["make"] for vehicle
+            in json.loads(response.content)["results"]
+        ]
+
+    def test_search_vector_is_maintained(self):
+        vehicle = Vehicle.objects.get(make="BMW")
+        vehicle.extras = "Sunroof"
+        vehicle.save()
+        self.assertEqual(self.search("heated"), [])
+        self.assertEqual(self.search("sunroof"), ["BMW"])
+
+    def test_search_across_fields(self):
+        self.assertEqual(self.search("mercedes"), ["Mercedes"])
+        self.assertEqual(self.search("amg"), ["Mercedes"])
+        self.assertEqual(self.search("heated seats"), ["BMW"])
+        self.assertEqual(sorted(self.search("roof")), ["Mercedes", "Volvo"])
+
+    def test_search_ranks_make_above_extras(self):
+        self.assertEqual(self.search("bmw"), ["BMW", "Volvo"])
+
+    def test_search_tolerates_typos(self):
+        self.assertEqual(self.search("mercedez"), ["Mercedes"])
+        self.assertEqual(self.search("volvp"), ["Volvo"])
+
+    def test_search_combines_with_filters_and_facets(self):
+        response = self.client.get("/api/sales/?q=roof&make=volvo&cursor=")
+        results = json.loads(response.content)["results"]
+        self.assertEqual([vehicle["make"] for vehicle in results], ["Volvo"])
+        response = self.client.get("/api/sales/facets/?q=roof")
+        self.assertEqual(json.loads(response.content)["count"], 2)
+
+
+class TestSharedCacheCheck(APITestCase):
+
+    @override_settings(DEBUG=False)
+    def test_local_cache_warns(self):
+        warnings = check_shared_cache(None)
+        self.assertEqual([warning.id for warning in warnings], ['backend.W001'])
+
+    @override_settings(DEBUG=False, CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': '127.0.0.1:11211',
+    }})
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(DEBUG=True)
+    def test_debug_skips_the_check(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestResponseCache(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.vehicle = Vehicle.objects.create(
+            make="Volvo",
+            model="V70",
+            trim="R",
+            year=1997,
+            mileage=181000,
+            engine_size=2435,
+            mot_expiry="2023-05-01",
+            extras="Test V70",
+            price=10000.00,
+            published=True
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_warm_requests_do_not_query(self):
+        for url in ("/api/sales/", "/api/sales/volvo-v70-r-1997/",
+                    "/api/sales/facets/"):
+            cold = self.client.get(url)
+            with self.assertNumQueries(0):
+                warm = self.client.get(url)
+            self.assertEqual(warm.status_code, 200)
+            self.assertEqual(warm.content, cold.content)
+
+    def test_query_parameters_are_normalised(self):
+        self.client.get("/api/sales/?limit=5&offset=0&fuel=1&fuel=2")
+        with self.assertNumQueries(0):
+            self.client.get("/api/sales/?fuel=2&offset=0&fuel=1&limit=5")
+
+    def test_saving_vehicle_invalidates(self):
+        self.client.get("/api/sales/")
+        self.client.get("/api/sales/volvo-v70-r-1997/")
+        self.vehicle.price = 9500.00
+        self.vehicle.save()
+        response = self.client.get("/api/sales/")
+        self.assertEqual(
+            json.loads(response.content)["results"][0]["price"], "9500.00")
+        response = self.client.get("/api/sales/volvo-v70-r-1997/")
+        self.assertEqual(json.loads(response.content)["price"], "9500.00")
+
+    def test_renamed_vehicle_invalidates_old_slug(self):
+        self.client.get("/api/sales/volvo-v70-r-1997/")
+        self.vehicle.trim = "T5"
+        self.vehicle.save()
+        response = self.client.get("/api/sales/volvo-v70-r-1997/")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/api/sales/volvo-v70-t5-1997/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleting_vehicle_invalidates(self):
+        self.client.get("/api/sales/")
+        self.client.get("/api/sales/volvo-v70-r-1997/")
+        self.vehicle.delete()
+        response = self.client.get("/api/sales/")
+        self.assertEqual(json.loads(response.content)["count"], 0)
+        response = self.client.get("/api/sales/volvo-v70-r-1997/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_vehicle_images_invalidate(self):
+        self.client.get("/api/sales/volvo-v70-r-1997/")
+        image = VehicleImages.objects.create(
+            vehicle=self.vehicle,
+            image=SimpleUploadedFile('v70.png', b'testimageofavehicle')
+        )
+        response = self.client.get("/api/sales/volvo-v70-r-1997/")
+        self.assertEqual(len(json.loads(response.content)["images"]), 1)
+        image.delete()
+        response = self.client.get("/api/sales/volvo-v70-r-1997/")
+        self.assertEqual(json.loads(response.content)["images"], [])
+
+    def test_other_vehicles_and_gallery_keep_detail_cached(self):
+        self.client.get("/api/sales/volvo-v70-r-1997/")
+        Vehicle.objects.create(
+            make="Volvo",
+            model="V40",
+            trim="T4",
+            year=1998,
+            mileage=120000,
+            engine_size=1948,
+            mot_expiry="2023-05-01",
+            extras="Test V40",
+            price=3000.00,
+            published=True
+        )
+        GalleryItem.objects.create(
+            make="Volvo",
+            model="850",
+            trim="T5-R",
+            year=1995,
+            description="Test 850",
+            published=True
+        )
+        with self.assertNumQueries(0):
+            self.client.get("/api/sales/volvo-v70-r-1997/")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestConditionalRequests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.vehicle = Vehicle.objects.create(
+            make="Volvo",
+            model="V70",
+            trim="R",
+            year=1997,
+            mileage=181000,
+            engine_size=2435,
+            mot_expiry="2023-05-01",
+            extras="Test V70",
+            price=10000.00,
+            published=True
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_validators_are_sent(self):
+        for url in ("/api/sales/", "/api/sales/volvo-v70-r-1997/"):
+            response = self.client.get(url)
+            self.assertTrue(response["ETag"].startswith('"'))
+            self.assertIn("Last-Modified", response)
+            with self.assertNumQueries(0):
+                cached = self.client.get(url)
+            self.assertEqual(cached["ETag"], response["ETag"])
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=0)
+    def test_if_none_match_cold_cache_is_single_lookup(self):
+        for url in ("/api/sales/", "/api/sales/volvo-v70-r-1997/"):
+            etag = self.client.get(url)["ETag"]
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response["ETag"], etag)
+
+    def test_if_none_match_warm_cache(self):
+        etag = self.client.get("/api/sales/volvo-v70-r-1997/")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/sales/volvo-v70-r-1997/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(
+            "/api/sales/volvo-v70-r-1997/")["Last-Modified"]
+        response = self.client.get(
+            "/api/sales/volvo-v70-r-1997/",
+            HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_produce_new_etag(self):
+        detail = self.client.get("/api/sales/volvo-v70-r-1997/")["ETag"]
+        listing = self.client.get("/api/sales/")["ETag"]
+
+        VehicleImages.objects.create(
+            vehicle=self.vehicle,
+            image=SimpleUploadedFile('v70.png', b'testimageofavehicle')
+        )
+        response = self.client.get(
+            "/api/sales/volvo-v70-r-1997/", HTTP_IF_NONE_MATCH=detail)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], detail)
+        response = self.client.get("/api/sales/", HTTP_IF_NONE_MATCH=listing)
+        self.assertEqual(response.status_code, 200)
+        listing = response["ETag"]
+
+        self.vehicle.delete()
+        response = self.client.get("/api/sales/", HTTP_IF_NONE_MATCH=listing)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["count"], 0)
+
+    def test_image_changes_bump_updated_at(self):
+        updated_at = self.vehicle.updated_at
+        VehicleImages.objects.create(
+            vehicle=self.vehicle,
+            image=SimpleUploadedFile('v70.png', b'testimageofavehicle')
+        )
+        self.vehicle.refresh_from_db()
+        self.assertGreater(self.vehicle.updated_at, updated_at)
+
+    def test_etag_depends_on_query(self):
+        first = self.client.get("/api/sales/?limit=1")["ETag"]
+        second = self.client.get("/api/sales/?limit=2")["ETag"]
+        self.assertNotEqual(first, second)
+
+
+class TestVehicleStates(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.vehicles = [
+            Vehicle.objects.create(
+                make="Volvo",
+                model="V70",
+                trim=trim,
+                year=1997,
+                reserved=reserved,
+                mileage=181000,
+                engine_size=2435,
+                mot_expiry="2023-05-01",
+                extras="Test V70",
+                price=10000.00,
+                published=published
+            ) for trim, reserved, published in (
+                ("R", "1", True),
+                ("T5", "2", True),
+                ("GLT", "1", False),
+            )
+        ]
+
+    def get_states(self, query):
+        response = self.client.get(f"/api/sales/state/{query}")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_batch_states(self):
+        r, t5, glt = self.vehicles
+        self.assertEqual(
+            self.get_states(
+                f"?slugs={r.slug},{glt.slug},missing&ids={t5.id},999"),
+            [
+                {"id": t5.id, "slug": t5.slug, "reserved": "Reserved"},
+                {"id": r.id, "slug": r.slug, "reserved": "For Sale"},
+            ]
+        )
+
+    def test_warm_lookups_do_not_query(self):
+        self.get_states(f"?ids={self.vehicles[0].id}")
+        with self.assertNumQueries(0):
+            self.get_states(f"?ids={self.vehicles[0].id}")
+
+    def test_state_changes_refresh_the_map(self):
+        vehicle = self.vehicles[0]
+        self.get_states(f"?ids={vehicle.id}")
+        vehicle.reserved = "2"
+        vehicle.save()
+        self.assertEqual(
+            self.get_states(f"?ids={vehicle.id}")[0]["reserved"],
+            "Reserved"
+        )
+        vehicle.published = False
+        vehicle.save()
+        self.assertEqual(self.get_states(f"?ids={vehicle.id}"), [])
+
+    def test_reloads_before_the_commit_are_dropped(self):
+        vehicle = self.vehicles[0]
+        stale = vehicle_status_map.load()
+        with self.captureOnCommitCallbacks(execute=True):
+            vehicle.reserved = "2"
+            vehicle.save()
+            # Another request reloads before the save is committed, so it
+            # still reads the old row.
+            with mock.patch.object(
+                vehicle_status_map, "load", return_value=stale
+            ):
+                self.assertEqual(
+                    self.get_states(f"?ids={vehicle.id}")[0]["reserved"],
+                    "For Sale"
+                )
+        self.assertEqual(
+            self.get_states(f"?ids={vehicle.id}")[0]["reserved"],
+            "Reserved"
+        )
+
+    def test_unrelated_changes_keep_the_map(self):
+        vehicle = self.vehicles[0]
+        self.get_states(f"?ids={vehicle.id}")
+        vehicle.price = 9000.00
+        vehicle.save()
+        with self.assertNumQueries(0):
+            self.get_states(f"?ids={vehicle.id}")
+
+    @mock.patch("sales.webhooks.send_new_reservation_email")
+    @mock.patch("sales.webhooks.send_reservation_email")
+    @mock.patch("sales.views.stripe.Webhook.construct_event")
+    def test_stripe_webhook_refreshes_the_map(self, construct_event, *_):
+        vehicle = self.vehicles[0]
+        reservation = Reservation.objects.create(
+            name="John Doe",
+            email="test@test.com",
+            phone_number="07123456789",
+            vehicle=vehicle
+        )
+        construct_event.return_value = {
+            "id": "evt_test",
+            "type": "payment_intent.succeeded",
+            "created": 1700000000,
+            "data": {"object": {
+                "id": "pi_test",
+                "amount": 10000,
+                "metadata": {"reservation_id": reservation.order_id},
+            }},
+        }
+        self.get_states(f"?ids={vehicle.id}")
+        response = self.client.post(
+            "/api/sales/webhooks/stripe/",
+            data="{}",
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE="signature"
+        )
+        self.assertEqual(response.status_code, 200)
+        process_events()
+        self.assertEqual(
+            self.get_states(f"?ids={vehicle.id}")[0]["reserved"],
+            "Reserved"
+        )
+
+    def test_invalid_lookups(self):
+        response = self.client.get("/api/sales/state/?ids=1,abc")
+        self.assertEqual(response.status_code, 400)
+        ids = ",".join(str(number) for number in range(101))
+        response = self.client.get(f"/api/sales/state/?ids={ids}")
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch("sales.webhooks.send_new_reservation_email")
+@mock.patch("sales.webhooks.send_reservation_email")
+@mock.patch("sales.views.stripe.Webhook.construct_event")
+class TestStripeWebhook(APITestCase):
+
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(
+            make="Volvo",
+            model="V70",
+            trim="R",
+            year=1997,
+            mileage=181000,
+            engine_size=2435,
+            mot_expiry="2023-05-01",
+            extras="Test V70",
+            price=10000.00,
+            published=True
+        )
+        self.reservation = Reservation.objects.create(
+            name="John Doe",
+            email="test@test.com",
+            phone_number="07123456789",
+            vehicle=self.vehicle
+        )
+
+    def payment_event(self, event_id="evt_1", created=1700000000):
+        return {
+            "id": event_id,
+            "type": "payment_intent.succeeded",
+            "created": created,
+            "data": {"object": {
+                "id": "pi_test",
+                "amount": 10000,
+                "metadata": {"reservation_id": self.reservation.order_id},
+            }},
+        }
+
+    def deliver(self, construct_event, event):
+        construct_event.return_value = event
+        return self.client.post(
+            "/api/sales/webhooks/stripe/",
+            data="{}",
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE="signature"
+        )
+
+    def test_events_are_stored_and_acknowledged(
+        self, construct_event, send_reservation_email, _
+    ):
+        response = self.deliver(construct_event, self.payment_event())
+        self.assertEqual(response.status_code, 200)
+        event = StripeEvent.objects.get()
+        self.assertEqual(event.event_id, "evt_1")
+        self.assertEqual(event.type, "payment_intent.succeeded")
+        self.assertIsNone(event.processed_at)
+        self.reservation.refresh_from_db()
+        self.assertFalse(self.reservation.paid)
+        send_reservation_email.assert_not_called()
+
+    def test_redelivered_events_are_handled_once(
+        self, construct_event, send_reservation_email, _
+    ):
+        self.deliver(construct_event, self.payment_event())
+        self.assertEqual(process_events(), 1)
+        self.deliver(construct_event, self.payment_event())
+        self.assertEqual(process_events(), 0)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        send_reservation_email.assert_called_once()
+        self.reservation.refresh_from_db()
+        self.assertTrue(self.reservation.paid)
+        self.assertEqual(self.reservation.paymentIntent_id, "pi_test")
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.reserved, "2")
+        self.assertIsNotNone(StripeEvent.objects.get().processed_at)
+
+    def test_failed_events_are_retried_with_backoff(
+        self, construct_event, send_reservation_email, _
+    ):
+        send_reservation_email.side_effect = ConnectionError("SMTP down")
+        self.deliver(construct_event, self.payment_event())
+        with self.assertLogs("sales.webhooks", "ERROR"):
+            self.assertEqual(process_events(), 1)
+        event = StripeEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.last_error, "ConnectionError: SMTP down")
+        self.assertGreater(
+            event.next_attempt_at, timezone.now() + timedelta(seconds=25))
+        # The handler's changes were rolled back with it.
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.reserved, "1")
+        self.assertEqual(process_events(), 0)
+
+        send_reservation_email.side_effect = None
+        StripeEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_events(), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 2)
+        self.assertIsNotNone(event.processed_at)
+        self.assertIsNone(event.next_attempt_at)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.reserved, "2")
+
+    def test_events_are_given_up_on(
+        self, construct_event, send_reservation_email, _
+    ):
+        send_reservation_email.side_effect = ConnectionError("SMTP down")
+        self.deliver(construct_event, self.payment_event())
+        with self.assertLogs("sales.webhooks", "ERROR"):
+            for _attempt in range(MAX_ATTEMPTS):
+                StripeEvent.objects.update(next_attempt_at=timezone.now())
+                process_events()
+        event = StripeEvent.objects.get()
+        self.assertEqual(event.attempts, MAX_ATTEMPTS)
+        self.assertIsNone(event.next_attempt_at)
+        self.assertIsNone(event.processed_at)
+
+    def test_events_are_handled_in_order(self, construct_event, *_):
+        handled = []
+        self.deliver(construct_event, {
+            "id": "evt_2", "type": "test.later", "created": 1700000002})
+        self.deliver(construct_event, {
+            "id": "evt_1", "type": "test.earlier", "created": 1700000001})
+        with mock.patch.dict("sales.webhooks.HANDLERS", {
+            "test.earlier": lambda event: handled.append(event["id"]),
+            "test.later": lambda event: handled.append(event["id"]),
+        }):
+            call_command("process_stripe_events", "--once", stdout=StringIO())
+        self.assertEqual(handled, ["evt_1", "evt_2"])
+
+    def test_later_events_wait_for_a_retry_of_the_same_object(
+        self, construct_event, *_
+    ):
+        handled = []
+
+        def handle(event):
+            if event["id"] == "evt_1" and not handled:
+                handled.append("failed")
+                raise ConnectionError("Temporary failure")
+            handled.append(event["id"])
+
+        for number, object_id in ((1, "pi_1"), (2, "pi_1"), (3, "pi_2")):
+            self.deliver(construct_event, {
+                "id": f"evt_{number}",
+                "type": "test.event",
+                "created": 1700000000 + number,
+                "data": {"object": {"id": object_id}},
+            })
+        self.assertEqual(
+            StripeEvent.objects.get(event_id="evt_3").object_id, "pi_2")
+        with mock.patch.dict("sales.webhooks.HANDLERS", {
+            "test.event": handle
+        }), self.assertLogs("sales.webhooks", "ERROR"):
+            # evt_2 waits for evt_1; evt_3 is about another object.
+            self.assertEqual(process_events(), 2)
+            self.assertEqual(handled, ["failed", "evt_3"])
+            StripeEvent.objects.filter(event_id="evt_1").update(
+                next_attempt_at=timezone.now())
+            self.assertEqual(process_events(), 2)
+        self.assertEqual(handled, ["failed", "evt_3", "evt_1", "evt_2"])
+
+    def test_given_up_events_do_not_hold_up_later_ones(
+        self, construct_event, *_
+    ):
+        for number in (1, 2):
+            self.deliver(construct_event, {
+                "id": f"evt_{number}",
+                "type": "charge.refunded",
+                "created": 1700000000 + number,
+                "data": {"object": {"id": "ch_1"}},
+            })
+        StripeEvent.objects.filter(event_id="evt_1").update(
+            attempts=MAX_ATTEMPTS, next_attempt_at=None)
+        self.assertEqual(process_events(), 1)
+        self.assertIsNotNone(
+            StripeEvent.objects.get(event_id="evt_2").processed_at)
+
+    def test_unhandled_event_types_are_marked_processed(
+        self, construct_event, *_
+    ):
+        self.deliver(construct_event, {
+            "id": "evt_1", "type": "charge.refunded", "created": 1700000000})
+        self.assertEqual(process_events(), 1)
+        self.assertIsNotNone(StripeEvent.objects.get().processed_at)
+
+    def test_invalid_signature(self, construct_event, *_):
+        construct_event.side_effect = \
+            stripe.error.SignatureVerificationError("Invalid", "header")
+        response = self.client.post(
+            "/api/sales/webhooks/stripe/",
+            data="{}",
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE="signature"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+
+class TestVehicleStateStream(TransactionTestCase):
+
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(
+            make="Volvo",
+            model="V70",
+            trim="R",
+            year=1997,
+            mileage=181000,
+            engine_size=2435,
+            mot_expiry="2023-05-01",
+            extras="Test V70",
+            price=10000.00,
+            published=True
+        )
+
+    def save_vehicle(self, **changes):
+        for field, value in changes.items():
+            setattr(self.vehicle, field, value)
+        self.vehicle.save()
+        # Runs in a worker thread, whose connection would outlive the test.
+        connection.close()
+
+    async def open_stream(self):
+        # pylint: disable=import-outside-toplevel
+        from backend.asgi import application
+        received = asyncio.Queue()
+        sent = asyncio.Queue()
+        task = asyncio.ensure_future(application(
+            {'type': 'http', 'path': '/api/sales/state/stream/',
+             'method': 'GET', 'headers': []},
+            received.get,
+            sent.put
+        ))
+        start = await asyncio.wait_for(sent.get(), 5)
+        self.assertEqual(start['status'], 200)
+        self.assertIn(
+            (b'content-type', b'text/event-stream'), start['headers'])
+        retry = await asyncio.wait_for(sent.get(), 5)
+        self.assertEqual(retry['body'], b'retry: 5000\n\n')
+        return task, received, sent
+
+    def test_reservation_changes_are_pushed(self):
+        async def scenario():
+            task, received, sent = await self.open_stream()
+            await sync_to_async(self.save_vehicle)(price=9000.00)
+            await sync_to_async(self.save_vehicle)(reserved="2")
+            message = await asyncio.wait_for(sent.get(), 5)
+            await received.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(task, 5)
+            return message
+
+        message = asyncio.run(scenario())
+        self.assertEqual(
+            message['body'],
+            b'event: vehicle_state\n'
+            b'data: {"slug": "volvo-v70-r-1997", "reserved": "Reserved"}\n\n'
+        )
+
+    def test_listener_is_released_when_streams_close(self):
+        # pylint: disable=import-outside-toplevel
+        from .events import broadcaster
+
+        async def scenario():
+            first = await self.open_stream()
+            second = await self.open_stream()
+            self.assertEqual(len(broadcaster.subscribers), 2)
+            for task, received, _ in (first, second):
+                await received.put({'type': 'http.disconnect'})
+                await asyncio.wait_for(task, 5)
+
+        asyncio.run(scenario())
+        self.assertEqual(broadcaster.subscribers, set())
+        self.assertIsNone(broadcaster._connection)  # pylint: disable=protected-access
+
+
+def jpeg(width, height, name="photo.jpg"):
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+def create_vehicle():
+    return Vehicle.objects.create(
+        make="Audi",
+        model="A3",
+        trim="Sport",
+        year=2018,
+        mileage=42000,
+        engine_size=1968,
+        mot_expiry="2024-06-01",
+        extras="Test A3",
+        price=14500.00,
+        published=True
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestImageRenditions(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.vehicle = create_vehicle()
+
+    def test_renditions_are_generated_on_upload(self):
+        image = VehicleImages.objects.create(
+            vehicle=self.vehicle, image=jpeg(2000, 1000))
+        image.refresh_from_db()
+        self.assertEqual(
+            {size: rendition["width"]
+             for size, rendition in image.renditions.items()},
+            {"thumbnail": 320, "medium": 800, "large": 1600}
+        )
+        thumbnail = image.renditions["thumbnail"]
+        with default_storage.open(thumbnail["webp"]) as file:
+            with Image.open(file) as rendition:
+                self.assertEqual(rendition.format, "WEBP")
+                self.assertEqual(rendition.size, (320, 160))
+        self.assertRegex(
+            thumbnail["jpeg"], r"^images/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+
+    def test_small_images_are_not_scaled_up(self):
+        image = VehicleImages.objects.create(
+            vehicle=self.vehicle, image=jpeg(500, 250))
+        self.assertEqual(
+            {size: rendition["width"]
+             for size, rendition in image.renditions.items()},
+            {"thumbnail": 320, "medium": 500}
+        )
+
+    def test_unreadable_images_have_no_renditions(self):
+        image = VehicleImages.objects.create(
+            vehicle=self.vehicle,
+            image=SimpleUploadedFile("image.jpg", b"testimageofacar")
+        )
+        image.refresh_from_db()
+        self.assertEqual(image.renditions, {})
+
+    def test_srcset_is_served(self):
+        VehicleImages.objects.create(
+            vehicle=self.vehicle, image=jpeg(1000, 500))
+        response = self.client.get(f"/api/sales/{self.vehicle.slug}/")
+        srcset = json.loads(response.content)["images"][0]["srcset"]
+        self.assertEqual(set(srcset), {"jpeg", "webp"})
+        urls = srcset["webp"].split(", ")
+        self.assertEqual(len(urls), 3)
+        self.assertTrue(urls[0].startswith(
+            "http://testserver/media/images/"))
+        self.assertTrue(urls[0].endswith(".webp 320w"))
+        self.assertTrue(urls[2].endswith(".webp 1000w"))
+
+    def test_renditions_are_deleted_with_the_image(self):
+        image = VehicleImages.objects.create(
+            vehicle=self.vehicle, image=jpeg(400, 400))
+        names = [
+            rendition[key] for rendition in image.renditions.values()
+            for key in ("jpeg", "webp")
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+
+    def rendition_names(self, image):
+        return [
+            rendition[key] for rendition in image.renditions.values()
+            for key in ("jpeg", "webp")
+        ]
+
+    def test_renditions_are_replaced_with_the_file(self):
+        image = VehicleImages.objects.create(
+            vehicle=self.vehicle, image=jpeg(400, 400))
+        old_names = self.rendition_names(image)
+        image.image = jpeg(900, 600, "replacement.jpg")
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        image.refresh_from_db()
+        self.assertEqual(
+            {size: rendition["width"]
+             for size, rendition in image.renditions.items()},
+            {"thumbnail": 320, "medium": 800, "large": 900}
+        )
+        for name in self.rendition_names(image):
+            self.assertTrue(default_storage.exists(name))
+        for name in old_names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_shared_renditions_are_kept_when_the_file_is_replaced(self):
+        content = jpeg(400, 400).read()
+        image = VehicleImages.objects.create(
+            vehicle=self.vehicle, image=SimpleUploadedFile("a.jpg", content))
+        VehicleImages.objects.create(
+            vehicle=self.vehicle, image=SimpleUploadedFile("b.jpg", content))
+        old_names = self.rendition_names(image)
+        image.image = jpeg(900, 600, "replacement.jpg")
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        for name in old_names:
+            self.assertTrue(default_storage.exists(name))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
+class TestSimilarVehicles(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        stock = [
+            # trim, year, fuel, body type, mileage, engine size, price
+            ("Sport", 2018, "1", "2", 42000, 1498, 16000),
+            ("S Line", 2018, "1", "2", 38000, 1498, 16500),
+            ("SE", 2015, "1", "2", 78000, 1395, 11000),
+            ("TDI", 2018, "2", "3", 45000, 1968, 16200),
+            ("Vorsprung", 2022, "4", "1", 9000, 0, 45000),
+            ("Black Edition", 2019, "1", "2", 30000, 1498, 18000),
+        ]
+        for trim, year, fuel, body_type, mileage, engine_size, price in stock:
+            Vehicle.objects.create(
+                make="Audi", model="A3", trim=trim, year=year, fuel=fuel,
+                body_type=body_type, mileage=mileage, engine_size=engine_size,
+                mot_expiry="2024-01-01", extras="Test", price=price,
+                published=True
+            )
+
+    def similar(self, slug, **params):
+        return self.client.get(f"/api/sales/{slug}/similar/", params)
+
+    def test_closest_vehicles_first(self):
+        response = self.similar("audi-a3-sport-2018")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [vehicle["slug"] for vehicle in json.loads(response.content)],
+            [
+                "audi-a3-s-line-2018",
+                "audi-a3-black-edition-2019",
+                "audi-a3-tdi-2018",
+                "audi-a3-se-2015",
+            ]
+        )
+        response = self.similar("audi-a3-sport-2018", limit=1, fields="slug")
+        self.assertEqual(
+            json.loads(response.content), [{"slug": "audi-a3-s-line-2018"}])
+
+    def test_only_vehicles_for_sale_are_recommended(self):
+        Vehicle.objects.filter(trim="S Line").update(reserved="2")
+        Vehicle.objects.filter(trim="SE").update(published=False)
+        similarity_index.invalidate()
+        slugs = [
+            vehicle["slug"] for vehicle in
+            json.loads(self.similar("audi-a3-sport-2018").content)
+        ]
+        self.assertNotIn("audi-a3-s-line-2018", slugs)
+        self.assertNotIn("audi-a3-se-2015", slugs)
+        self.assertEqual(len(slugs), 3)
+        # A reserved vehicle still gets recommendations.
+        self.assertEqual(
+            self.similar("audi-a3-s-line-2018").status_code, 200)
+        self.assertEqual(self.similar("audi-a3-se-2015").status_code, 404)
+
+    def test_index_is_rebuilt_when_vehicles_change(self):
+        self.similar("audi-a3-sport-2018")
+        # Only the vehicles and their images are read.
+        with self.assertNumQueries(2):
+            self.similar("audi-a3-sport-2018")
+
+        vehicle = Vehicle.objects.get(trim="TDI")
+        vehicle.fuel = "1"
+        vehicle.body_type = "2"
+        vehicle.mileage = 42000
+        vehicle.engine_size = 1498
+        vehicle.price = 16000
+        with self.captureOnCommitCallbacks(execute=True):
+            vehicle.save()
+        response = self.similar("audi-a3-sport-2018", limit=1)
+        self.assertEqual(
+            json.loads(response.content)[0]["slug"], "audi-a3-tdi-2018")
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.similar("missing").status_code, 404)
+        for limit in ("0", "21", "many"):
+            response = self.similar("audi-a3-sport-2018", limit=limit)
+            self.assertEqual(response.status_code, 400)
+
+    def test_index_lookup(self):
+        Vehicle.objects.exclude(trim="Sport").delete()
+        similarity_index.invalidate()
+        self.assertEqual(similarity_index.lookup("audi-a3-sport-2018", 4), [])
+        Vehicle.objects.all().delete()
+        similarity_index.invalidate()
+        self.assertIsNone(similarity_index.lookup("audi-a3-sport-2018", 4))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestGenerateRenditionsCommand(TransactionTestCase):
+
+    def test_backfill(self):
+        vehicle = create_vehicle()
+        names = [
+            default_storage.save(f"vehicle_images/old-{number}.jpg",
+                                 jpeg(900, 600))
+            for number in range(3)
+        ]
+        # bulk_create sends no signals, like images from before renditions.
+        VehicleImages.objects.bulk_create([
+            VehicleImages(vehicle=vehicle, image=name) for name in names
+        ])
+        cache.clear()
+        etag = self.client.get(f"/api/sales/{vehicle.slug}/")["ETag"]
+
+        out = StringIO()
+        call_command("generate_renditions", workers=2, stdout=out)
+        self.assertEqual(
+            out.getvalue(),
+            "sales.VehicleImages: generated renditions for 3 images.\n"
+        )
+        for image in VehicleImages.objects.all():
+            self.assertEqual(
+                [image.renditions[size]["width"]
+                 for size in ("thumbnail", "medium")],
+                [320, 800]
+            )
+        response = self.client.get(
+            f"/api/sales/{vehicle.slug}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        srcset = json.loads(response.content)["images"][0]["srcset"]
+        self.assertIn("webp", srcset)
+
+        out = StringIO()
+        call_command("generate_renditions", workers=2, stdout=out)
+        self.assertEqual(out.getvalue(), "")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@mock.patch(
+    "sales.views.stripe.PaymentIntent.create",
+    return_value=mock.Mock(client_secret="secret")
+)
+class TestCheckoutHold(TransactionTestCase):
+
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(
+            make="Volvo",
+            model="V70",
+            trim="R",
+            year=1997,
+            mileage=181000,
+            engine_size=2435,
+            mot_expiry="2023-05-01",
+            extras="Test V70",
+            price=10000.00,
+            published=True
+        )
+
+    def reserve(self, client=None, name="John Doe"):
+        return (client or self.client).post(
+            f"/api/sales/reserve/{self.vehicle.id}/",
+            {
+                "name": name,
+                "email": "test@test.com",
+                "phone_number": "07123456789"
+            }
+        )
+
+    def test_reserving_holds_the_vehicle(self, create_intent):
+        started = timezone.now()
+        response = self.reserve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"client_secret": "secret"})
+        create_intent.assert_called_once()
+        self.vehicle.refresh_from_db()
+        self.assertTrue(self.vehicle.is_held())
+        self.assertGreaterEqual(
+            self.vehicle.hold_expires, started + timedelta(minutes=15))
+        response = self.client.get(f"/api/sales/state/{self.vehicle.slug}/")
+        self.assertTrue(response.data["on_hold"])
+
+    def test_held_vehicle_cannot_be_reserved(self, create_intent):
+        self.reserve()
+        response = self.reserve(name="Jane Doe")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(create_intent.call_count, 1)
+        self.assertFalse(Reservation.objects.filter(name="Jane Doe").exists())
+
+    def test_hold_expires(self, create_intent):
+        self.reserve()
+        Vehicle.objects.filter(pk=self.vehicle.pk).update(
+            hold_expires=timezone.now() - timedelta(seconds=1))
+        response = self.reserve(name="Jane Doe")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(create_intent.call_count, 2)
+
+    def test_failed_payment_intent_releases_the_hold(self, create_intent):
+        create_intent.side_effect = stripe.error.APIConnectionError("Down")
+        response = self.reserve()
+        self.assertEqual(response.status_code, 400)
+        self.vehicle.refresh_from_db()
+        self.assertIsNone(self.vehicle.hold_expires)
+
+    def pay(self, name):
+        reservation = Reservation.objects.get(name=name)
+        event = {
+            "id": f"evt_{reservation.pk}",
+            "created": 1700000000,
+            "type": "payment_intent.succeeded",
+            "data": {"object": {
+                "id": f"pi_{reservation.pk}",
+                "amount": 10000,
+                "metadata": {"reservation_id": reservation.order_id},
+            }},
+        }
+        with mock.patch(
+            "sales.views.stripe.Webhook.construct_event", return_value=event
+        ), mock.patch("sales.webhooks.send_reservation_email"), \
+                mock.patch("sales.webhooks.send_new_reservation_email"):
+            self.client.post(
+                "/api/sales/webhooks/stripe/",
+                data="{}",
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE="signature"
+            )
+            process_events()
+        reservation.refresh_from_db()
+        return reservation
+
+    def expire_hold(self):
+        Vehicle.objects.filter(pk=self.vehicle.pk).update(
+            hold_expires=timezone.now() - timedelta(seconds=1))
+
+    def test_payment_ends_the_hold(self, create_intent):
+        self.reserve()
+        self.vehicle.refresh_from_db()
+        self.assertEqual(
+            self.vehicle.hold_reservation, Reservation.objects.get())
+        self.assertTrue(self.pay("John Doe").paid)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.reserved, "2")
+        self.assertIsNone(self.vehicle.hold_reservation)
+        self.assertIsNone(self.vehicle.hold_expires)
+
+    @mock.patch("sales.webhooks.stripe.Refund.create")
+    def test_late_payment_is_accepted_if_nobody_else_holds(
+        self, create_refund, create_intent
+    ):
+        self.reserve()
+        self.expire_hold()
+        self.assertTrue(self.pay("John Doe").paid)
+        create_refund.assert_not_called()
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.reserved, "2")
+
+    @mock.patch("sales.webhooks.stripe.Refund.create")
+    def test_late_payment_is_refunded_once_another_buyer_holds(
+        self, create_refund, create_intent
+    ):
+        self.reserve()
+        self.expire_hold()
+        self.assertEqual(self.reserve(name="Jane Doe").status_code, 200)
+
+        late = self.pay("John Doe")
+        self.assertFalse(late.paid)
+        self.assertEqual(late.paymentIntent_id, f"pi_{late.pk}")
+        create_refund.assert_called_once_with(
+            payment_intent=f"pi_{late.pk}",
+            idempotency_key=f"refund-pi_{late.pk}"
+        )
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.reserved, "1")
+        self.assertEqual(self.vehicle.hold_reservation.name, "Jane Doe")
+
+        self.assertTrue(self.pay("Jane Doe").paid)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.reserved, "2")
+
+    @mock.patch("sales.webhooks.stripe.Refund.create")
+    def test_second_payment_for_a_reserved_vehicle_is_refunded(
+        self, create_refund, create_intent
+    ):
+        self.reserve()
+        self.expire_hold()
+        self.reserve(name="Jane Doe")
+        self.expire_hold()
+        self.assertTrue(self.pay("John Doe").paid)
+        self.assertFalse(self.pay("Jane Doe").paid)
+        create_refund.assert_called_once()
+
+    def test_concurrent_buyers_get_one_hold(self, create_intent):
+        buyers = 6
+        statuses = []
+        start = threading.Barrier(buyers)
+
+        def buy(number):
+            try:
+                start.wait()
+                statuses.append(
+                    self.reserve(APIClient(), f"Buyer {number}").status_code)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=buy, args=(number,))
+            for number in range(buyers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(sorted(statuses), [200] + [400] * (buyers - 1))
+        self.assertEqual(create_intent.call_count, 1)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+
+class TestDailyCounter(TransactionTestCase):
+
+    def create_reservation(self, name):
+        return Reservation.objects.create(
+            name=name,
+            email='test@test.com',
+            phone_number='07123456789'
+        )
+
+    def set_number(self, kind, day, number):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT setval(%s, %s)', [
+                DailyCounter.sequence_name(kind),
+                int(day.strftime('%y%m%d')) * DailyCounter.DAY_SIZE + number
+            ])
+
+    def test_id_format(self):
+        today = date.today().strftime('%y%m%d')
+        first = self.create_reservation('First').order_id
+        self.assertRegex(first, rf'^{today}3\d{{3,}}$')
+        self.assertEqual(
+            self.create_reservation('Second').order_id,
+            f'{today}3{int(first[7:]) + 1:03d}'
+        )
+
+    def test_counters_are_per_kind(self):
+        kinds = DailyCounter.Kind
+        first = DailyCounter.next_id(kinds.INVOICE)
+        self.assertEqual(DailyCounter.next_id(kinds.RESERVATION)[6], '3')
+        self.assertEqual(
+            int(DailyCounter.next_id(kinds.INVOICE)[7:]), int(first[7:]) + 1)
+
+    def test_each_day_starts_at_one(self):
+        kind = DailyCounter.Kind.INVOICE
+        today = date.today()
+        tomorrow = today + timedelta(days=1)
+        number = int(DailyCounter.next_id(kind)[7:])
+        self.addCleanup(self.set_number, kind, today, number)
+        with mock.patch(
+            'django.utils.timezone.localdate', return_value=tomorrow
+        ):
+            self.assertEqual(
+                DailyCounter.next_id(kind), f'{tomorrow:%y%m%d}2001')
+            self.assertEqual(
+                DailyCounter.next_id(kind), f'{tomorrow:%y%m%d}2002')
+
+    def test_counter_goes_past_999(self):
+        self.set_number(DailyCounter.Kind.RESERVATION, date.today(), 999)
+        reservation = self.create_reservation('Thousandth')
+        self.assertEqual(reservation.order_id[7:], '1000')
+
+    def test_one_query_per_id(self):
+        DailyCounter.next_id(DailyCounter.Kind.CUSTOMER)
+        with self.assertNumQueries(1):
+            DailyCounter.next_id(DailyCounter.Kind.CUSTOMER)
+
+    def test_ids_are_not_held_by_the_callers_transaction(self):
+        kind = DailyCounter.Kind.INVOICE
+        taken = threading.Event()
+        finish = threading.Event()
+        ids = []
+
+        def take():
+            try:
+                with transaction.atomic():
+                    ids.append(DailyCounter.next_id(kind))
+                    taken.set()
+                    finish.wait(5)
+                    raise RuntimeError('rolled back')
+            except RuntimeError:
+                pass
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=take)
+        worker.start()
+        taken.wait(5)
+        started = time.monotonic()
+        ids.append(DailyCounter.next_id(kind))
+        waited = time.monotonic() - started
+        finish.set()
+        worker.join()
+        self.assertLess(waited, 2)
+        # The rolled back transaction leaves a gap rather than a duplicate.
+        first, second = (int(number[7:]) for number in ids)
+        self.assertEqual(second, first + 1)
+        self.assertEqual(
+            int(DailyCounter.next_id(kind)[7:]), first + 2)
+
+    def test_concurrent_ids_are_unique(self):
+        threads, per_thread = 8, 25
+        order_ids, errors = [], []
+        start = threading.Barrier(threads)
+
+        def reserve(number):
+            try:
+                start.wait()
+                for count in range(per_thread):
+                    order_ids.append(self.create_reservation(
+                        f'Customer {number}-{count}').order_id)
+            except Exception as error:  # pylint: disable=broad-except
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=reserve, args=(number,))
+            for number in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        numbers = sorted(int(order_id[7:]) for order_id in order_ids)
+        self.assertEqual(
+            numbers, list(range(numbers[0], numbers[0] + threads * per_thread)))
+
+
 @override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class TestSalesModels(APITestCase):
 
@@ -382,3 +2065,27 @@ class TestSalesUtils(APITestCase):
         ).save()
         resveration_amount = get_reservation_amount()
         self.assertEqual(resveration_amount, 150)
+
+    def test_latest_active_amount_applies(self):
+        ReservationAmount.objects.create(amount=150, active=True)
+        ReservationAmount.objects.create(amount=250, active=True)
+        ReservationAmount.objects.create(amount=350, active=False)
+        self.assertEqual(get_reservation_amount(), 250)
+
+    def test_reservation_amount_is_cached(self):
+        ReservationAmount.objects.create(amount=150, active=True)
+        get_reservation_amount()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_reservation_amount(), 150)
+
+    def test_changes_reach_every_process(self):
+        amount = ReservationAmount.objects.create(amount=150, active=True)
+        # Another worker's copy, sharing only the cache.
+        other_process = ReservationAmountCache()
+        self.assertEqual(other_process.get(), 150)
+        amount.amount = 200
+        amount.save()
+        self.assertEqual(other_process.get(), 200)
+        amount.delete()
+        self.assertEqual(other_process.get(), 10000)
+        self.assertEqual(get_reservation_amount(), 10000)
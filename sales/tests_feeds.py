@@ -0,0 +1,156 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from backend import feeds
+from gallery.models import GalleryItem
+
+from .models import FeedUpdate, Vehicle, VehicleImages
+
+MEDIA_ROOT = tempfile.mkdtemp()
+FEEDS_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    FEEDS_ROOT=FEEDS_ROOT,
+    SITE_URL="https://example.com",
+    API_URL="https://api.example.com"
+)
+class TestFeeds(APITestCase):
+
+    def setUp(self):
+        shutil.rmtree(FEEDS_ROOT, ignore_errors=True)
+        self.vehicle = Vehicle.objects.create(
+            make="Audi", model="A3", trim="Sport", year=2018,
+            mileage=42000, engine_size=1968, mot_expiry="2024-06-01",
+            extras="Test A3", price=14500.00, published=True
+        )
+        VehicleImages.objects.create(vehicle=self.vehicle, image="a.jpg")
+        Vehicle.objects.create(
+            make="Audi", model="A3", trim="Hidden", year=2018,
+            mileage=42000, engine_size=1968, mot_expiry="2024-06-01",
+            extras="Test A3", price=14500.00
+        )
+        GalleryItem.objects.create(
+            make="Ford", model="Escort", trim="RS Cosworth", year=1994,
+            description="Test", published=True
+        )
+
+    def get_feed(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def stock(self):
+        return json.loads(self.get_feed("/feeds/stock.json"))["vehicles"]
+
+    def test_documents(self):
+        sitemap = self.get_feed("/sitemap.xml")
+        self.assertIn(
+            "<loc>https://example.com/vehicles/audi-a3-sport-2018/</loc>",
+            sitemap
+        )
+        self.assertIn(
+            "<loc>https://example.com/gallery/ford-escort-rs-cosworth-1994/"
+            "</loc>",
+            sitemap
+        )
+        self.assertNotIn("hidden", sitemap)
+
+        stock = self.stock()
+        self.assertEqual(len(stock), 1)
+        self.assertEqual(stock[0]["fuel"], "Petrol")
+        self.assertEqual(stock[0]["price"], "14500.00")
+        self.assertEqual(
+            stock[0]["images"], ["https://api.example.com/media/a.jpg"])
+
+        root = ElementTree.fromstring(self.get_feed("/feeds/stock.xml"))
+        self.assertEqual(
+            root.find("vehicle/url").text,
+            "https://example.com/vehicles/audi-a3-sport-2018/"
+        )
+        self.assertEqual(root.find("vehicle/make").text, "Audi")
+        self.assertEqual(
+            root.find("vehicle/images/image").text,
+            "https://api.example.com/media/a.jpg"
+        )
+
+    def test_documents_are_served_from_disk(self):
+        self.get_feed("/sitemap.xml")
+        with self.assertNumQueries(0):
+            self.get_feed("/feeds/stock.json")
+        response = self.client.get("/feeds/entries.json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_changed_rows_are_updated(self):
+        self.get_feed("/sitemap.xml")
+        self.vehicle.price = 15500
+        self.vehicle.save()
+        self.assertEqual(self.stock()[0]["price"], "14500.00")
+        feeds.update_pending()
+        self.assertEqual(self.stock()[0]["price"], "15500.00")
+        self.assertFalse(FeedUpdate.objects.exists())
+
+        # Only the changed rows and their images are read.
+        with self.assertNumQueries(2):
+            feeds.update({Vehicle: [self.vehicle.pk]})
+
+        Vehicle.objects.filter(pk=self.vehicle.pk).update(reserved="3")
+        feeds.schedule_update(Vehicle, self.vehicle.pk)
+        feeds.update_pending()
+        self.assertEqual(self.stock(), [])
+        self.assertIn("audi-a3-sport-2018", self.get_feed("/sitemap.xml"))
+
+        self.vehicle.delete()
+        feeds.update_pending()
+        self.assertNotIn("audi-a3-sport-2018", self.get_feed("/sitemap.xml"))
+
+    def test_updates_wait_for_the_first_build(self):
+        feeds.schedule_update(Vehicle, self.vehicle.pk)
+        feeds.update_pending()
+        self.assertFalse(
+            os.path.exists(os.path.join(FEEDS_ROOT, "entries.json")))
+        self.assertFalse(FeedUpdate.objects.exists())
+
+    def test_update_command_rewrites_the_documents_once_per_batch(self):
+        self.get_feed("/sitemap.xml")
+        FeedUpdate.objects.all().delete()
+        for price in (15000, 15500, 16000):
+            self.vehicle.price = price
+            self.vehicle.save()
+        GalleryItem.objects.update(published=False)
+        feeds.schedule_update(GalleryItem, *GalleryItem.objects.values_list(
+            "pk", flat=True))
+        out = StringIO()
+        with mock.patch.object(
+            feeds, "write_documents", wraps=feeds.write_documents
+        ) as write_documents:
+            call_command("update_feeds", once=True, batch_size=10, stdout=out)
+        self.assertEqual(out.getvalue(), "Applied 4 feed updates.\n")
+        write_documents.assert_called_once()
+        self.assertEqual(self.stock()[0]["price"], "16000.00")
+        self.assertNotIn("ford-escort", self.get_feed("/sitemap.xml"))
+
+    def test_rebuild_command(self):
+        out = StringIO()
+        call_command("rebuild_feeds", stdout=out)
+        self.assertEqual(
+            out.getvalue(),
+            "Built sitemap.xml, stock.xml, stock.json from 2 entries.\n"
+        )
+        self.assertEqual(len(self.stock()), 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(FEEDS_ROOT, ignore_errors=True)
+        super().tearDownClass()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from backend.storage import image_storage
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestMediaServing(APITestCase):
+
+    def setUp(self):
+        self.content = bytes(range(256)) * 4
+        self.name = image_storage.save(
+            "photo.jpg", SimpleUploadedFile("photo.jpg", self.content))
+        self.url = f"/media/{self.name}"
+
+    def read(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read(response), self.content)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["Content-Length"], "1024")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(
+            response["Cache-Control"], "public, max-age=31536000, immutable")
+
+    def test_files_without_a_content_name_are_revalidated(self):
+        name = default_storage.save("vehicle_images/old.jpg", BytesIO(b"x"))
+        response = self.client.get(f"/media/{name}")
+        self.assertEqual(response["Cache-Control"], "public, no-cache")
+        etag = response["ETag"]
+        response = self.client.get(f"/media/{name}", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        for header, start, end in (
+            ("bytes=10-19", 10, 19),
+            ("bytes=1000-", 1000, 1023),
+            ("bytes=-24", 1000, 1023),
+            ("bytes=1020-5000", 1020, 1023),
+        ):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(
+                response["Content-Range"], f"bytes {start}-{end}/1024")
+            self.assertEqual(response["Content-Length"], str(end - start + 1))
+            self.assertEqual(self.read(response), self.content[start:end + 1])
+
+    def test_invalid_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2000-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+        # Malformed and multiple ranges are ignored.
+        for header in ("bytes=20-10", "bytes=0-1,5-6", "lines=1-2"):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.read(response), self.content)
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read(response), self.content)
+
+    @override_settings(
+        MEDIA_SERVE_MODE="x-accel-redirect",
+        MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/"
+    )
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"], f"/protected-media/{self.name}")
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            response["Cache-Control"], "public, max-age=31536000, immutable")
+
+    @override_settings(MEDIA_SERVE_MODE="x-sendfile")
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response["X-Sendfile"], os.path.join(MEDIA_ROOT, self.name))
+        self.assertEqual(response.content, b"")
+
+    def test_missing_files(self):
+        for url in ("/media/missing.jpg", "/media/images/",
+                    "/media/%2e%2e/manage.py"):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
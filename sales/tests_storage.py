@@ -0,0 +1,159 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APITestCase
+
+from PIL import Image
+
+from backend.storage import image_storage
+from gallery.models import GalleryItem, GalleryImage
+
+from .models import Vehicle, VehicleImages
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def jpeg(width, height, name="photo.jpg"):
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+def create_vehicle():
+    return Vehicle.objects.create(
+        make="Audi",
+        model="A3",
+        trim="Sport",
+        year=2018,
+        mileage=42000,
+        engine_size=1968,
+        mot_expiry="2024-06-01",
+        extras="Test A3",
+        price=14500.00,
+        published=True
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestContentAddressedStorage(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.vehicle = create_vehicle()
+        self.gallery_item = GalleryItem.objects.create(
+            make="Audi", model="A3", trim="Sport", year=2018,
+            description="Test A3"
+        )
+
+    def test_identical_uploads_are_stored_once(self):
+        content = jpeg(900, 600).read()
+        vehicle_image = VehicleImages.objects.create(
+            vehicle=self.vehicle,
+            image=SimpleUploadedFile("front.jpg", content)
+        )
+        gallery_image = GalleryImage.objects.create(
+            item=self.gallery_item,
+            image=SimpleUploadedFile("front-copy.JPG", content)
+        )
+        name = vehicle_image.image.name
+        self.assertEqual(
+            name,
+            f"images/{hashlib.sha256(content).hexdigest()[:2]}/"
+            f"{hashlib.sha256(content).hexdigest()}.jpg"
+        )
+        self.assertEqual(gallery_image.image.name, name)
+        self.assertEqual(gallery_image.renditions, vehicle_image.renditions)
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(default_storage.path(name)))), 1)
+
+    def test_shared_files_are_deleted_with_the_last_reference(self):
+        content = jpeg(900, 600).read()
+        images = [
+            VehicleImages.objects.create(
+                vehicle=self.vehicle,
+                image=SimpleUploadedFile("front.jpg", content)
+            ),
+            GalleryImage.objects.create(
+                item=self.gallery_item,
+                image=SimpleUploadedFile("front.jpg", content)
+            ),
+        ]
+        names = [images[0].image.name] + [
+            rendition[key] for rendition in images[0].renditions.values()
+            for key in ("jpeg", "webp")
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            images[0].delete()
+        for name in names:
+            self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            images[1].delete()
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestContentAddressedStorageRace(TransactionTestCase):
+
+    def test_delete_waits_for_a_save_of_the_same_content(self):
+        vehicle = create_vehicle()
+        content = jpeg(900, 600).read()
+        old_image = VehicleImages.objects.create(
+            vehicle=vehicle, image=SimpleUploadedFile("front.jpg", content))
+        name = old_image.image.name
+        saved = threading.Event()
+        proceed = threading.Event()
+
+        def upload():
+            try:
+                with transaction.atomic():
+                    self.assertEqual(image_storage.save(
+                        "front.jpg", SimpleUploadedFile("front.jpg", content)
+                    ), name)
+                    saved.set()
+                    proceed.wait(5)
+                    VehicleImages.objects.create(vehicle=vehicle, image=name)
+            finally:
+                connection.close()
+
+        def delete():
+            try:
+                VehicleImages.objects.get(pk=old_image.pk).delete()
+            finally:
+                connection.close()
+
+        uploader = threading.Thread(target=upload)
+        uploader.start()
+        saved.wait(5)
+        deleter = threading.Thread(target=delete)
+        deleter.start()
+        # The delete cannot tell the upload needs the file until it commits.
+        deleter.join(0.5)
+        self.assertTrue(deleter.is_alive())
+        proceed.set()
+        uploader.join()
+        deleter.join()
+        self.assertFalse(VehicleImages.objects.filter(pk=old_image.pk).exists())
+        self.assertTrue(default_storage.exists(name))
+        image = VehicleImages.objects.get()
+        for rendition in image.renditions.values():
+            self.assertTrue(default_storage.exists(rendition["jpeg"]))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
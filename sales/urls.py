@@ -2,15 +2,25 @@ from django.urls import path
 
 from .views import (
     ListVehicles,
+    VehicleFacets,
+    VehicleHistograms,
     VehicleDetail,
+    SimilarVehicles,
     VehicleState,
+    VehicleStates,
     StripePaymentIntentReserveVehicle,
     stripe_webhook
 )
 
 urlpatterns = [
     path('', ListVehicles.as_view(), name="list_of_vehicles"),
+    path('facets/', VehicleFacets.as_view(), name="vehicle_facets"),
+    path('histograms/', VehicleHistograms.as_view(),
+         name="vehicle_histograms"),
+    path('state/', VehicleStates.as_view(), name="vehicle_states"),
     path('<str:slug>/', VehicleDetail.as_view(), name="vehicle_detail"),
+    path('<str:slug>/similar/', SimilarVehicles.as_view(),
+         name="similar_vehicles"),
     path('state/<str:slug>/', VehicleState.as_view(), name="vehicle_state"),
     path(
         'reserve/<int:vehicle_id>/',
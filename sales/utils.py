@@ -2,14 +2,38 @@ import os
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
+
+from backend.cache import GenerationCache
+
 from .models import ReservationAmount
 
 
+class ReservationAmountCache(GenerationCache):
+    """Per-process copy of the active reservation amount, in pence.
+
+    It is read with one query and kept until the ``reservations:amount``
+    generation moves, which saving or deleting a ReservationAmount does,
+    so every process sharing the cache sees the change on its next use.
+    """
+    generation_name = 'reservations:amount'
+    default_amount = 10000
+
+    def load(self):
+        # Of several active amounts, the one added last applies.
+        amount = ReservationAmount.objects.filter(
+            active=True
+        ).order_by('-id').values_list('amount', flat=True).first()
+        return self.default_amount if amount is None else amount
+
+    def get(self):
+        return self.refresh()
+
+
+reservation_amount = ReservationAmountCache()
+
+
 def get_reservation_amount():
-    try:
-        return ReservationAmount.objects.get(active=True).amount
-    except ReservationAmount.DoesNotExist:
-        return 10000
+    return reservation_amount.get()
 
 
 def send_reservation_email(reservation, res_amount, tradein=None):
@@ -1,25 +1,53 @@
 import os
 import stripe
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Case, Q, When
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
 
-from .models import Vehicle, Reservation, TradeIn
+from backend.cache import CachedResponseMixin
+from backend.serializers import SparseFieldsetViewMixin, ValuesListMixin
+
+from .filters import VehicleFilter
+from .models import Vehicle
+from .pagination import VehiclePagination
 from .serializers import (VehicleSerializer, VehicleStateSerializer,
                           ReserveVehicleSerializer, TradeInSerializer)
-from .utils import get_reservation_amount, send_reservation_email, send_new_reservation_email
+from .similarity import similarity_index
+from .state import vehicle_status_map
+from .utils import get_reservation_amount
+from .webhooks import record_event
 
 stripe.api_key = os.environ.get('STRIPE_SECRET')
 
 
-class ListVehicles(ListAPIView):
+class ListVehicles(CachedResponseMixin, SparseFieldsetViewMixin,
+                   ValuesListMixin, ListAPIView):
+    cache_namespace = 'vehicles'
     serializer_class = VehicleSerializer
+    pagination_class = VehiclePagination
+    filterset_class = VehicleFilter
     paginate_by = 10
 
+    def get_queryset(self):
+        queryset = Vehicle.objects.filter(
+            Q(reserved='1') | Q(reserved='2'),
+            published=True
+        ).prefetch_related('images')
+        return queryset
+
+
+class VehicleFacets(CachedResponseMixin, ListAPIView):
+    cache_namespace = 'vehicles'
+    filterset_class = VehicleFilter
+    pagination_class = None
+
     def get_queryset(self):
         queryset = Vehicle.objects.filter(
             Q(reserved='1') | Q(reserved='2'),
@@ -27,17 +55,100 @@ class ListVehicles(ListAPIView):
         )
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        filterset = self.filterset_class(
+            request.query_params,
+            queryset=self.get_queryset(),
+            request=request
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return Response(filterset.facet_counts())
+
+
+class VehicleHistograms(VehicleFacets):
+    """Price and mileage histograms of the vehicles matching the listing
+    filters. Takes an optional number of ``buckets``."""
+    default_buckets = 20
+    max_buckets = 50
+
+    def get_buckets(self):
+        buckets = self.request.query_params.get(
+            'buckets', self.default_buckets)
+        try:
+            buckets = int(buckets)
+        except ValueError as error:
+            raise ValidationError(
+                {'buckets': 'The number of buckets must be an integer.'}
+            ) from error
+        if not 1 <= buckets <= self.max_buckets:
+            raise ValidationError(
+                {'buckets': 'The number of buckets must be between 1 and '
+                            f'{self.max_buckets}.'}
+            )
+        return buckets
+
+    def list(self, request, *args, **kwargs):
+        filterset = self.filterset_class(
+            request.query_params,
+            queryset=self.get_queryset(),
+            request=request
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return Response(filterset.histograms(self.get_buckets()))
+
 
-class VehicleDetail(RetrieveAPIView):
+class VehicleDetail(CachedResponseMixin, SparseFieldsetViewMixin,
+                    RetrieveAPIView):
+    cache_namespace = 'vehicles'
     serializer_class = VehicleSerializer
     lookup_field = 'slug'
     lookup_url_kwarg = 'slug'
 
     def get_queryset(self):
-        queryset = Vehicle.objects.filter(published=True)
+        queryset = Vehicle.objects.filter(
+            published=True
+        ).prefetch_related('images')
         return queryset
 
 
+class SimilarVehicles(SparseFieldsetViewMixin, ValuesListMixin, ListAPIView):
+    """Vehicles for sale most like a published vehicle, closest first.
+
+    They are found in the per-process similarity index, so serializing
+    them is the only database work. Takes an optional ``limit``.
+    """
+    serializer_class = VehicleSerializer
+    pagination_class = None
+    default_limit = 4
+    max_limit = 20
+
+    def get_limit(self):
+        limit = self.request.query_params.get('limit', self.default_limit)
+        try:
+            limit = int(limit)
+        except ValueError as error:
+            raise ValidationError(
+                {'limit': 'The limit must be an integer.'}) from error
+        if not 1 <= limit <= self.max_limit:
+            raise ValidationError(
+                {'limit': f'The limit must be between 1 and {self.max_limit}.'}
+            )
+        return limit
+
+    def get_queryset(self):
+        ids = similarity_index.lookup(self.kwargs['slug'], self.get_limit())
+        if ids is None:
+            raise NotFound()
+        if not ids:
+            return Vehicle.objects.none()
+        return Vehicle.objects.filter(pk__in=ids).order_by(Case(*[
+            When(pk=vehicle_id, then=position)
+            for position, vehicle_id in enumerate(ids)
+        ])).prefetch_related('images')
+
+
 class VehicleState(RetrieveAPIView):
     serializer_class = VehicleStateSerializer
     lookup_field = 'slug'
@@ -48,6 +159,35 @@ class VehicleState(RetrieveAPIView):
         return queryset
 
 
+class VehicleStates(APIView):
+    """Reserved state of many vehicles at once.
+
+    Takes comma separated ``ids`` and/or ``slugs`` and answers from the
+    per-process status map; unknown or unpublished vehicles are left out.
+    """
+    max_lookups = 100
+
+    def get(self, request):
+        slugs = [
+            slug for slug in request.query_params.get('slugs', '').split(',')
+            if slug
+        ]
+        try:
+            ids = [
+                int(vehicle_id) for vehicle_id
+                in request.query_params.get('ids', '').split(',')
+                if vehicle_id
+            ]
+        except ValueError as error:
+            raise ValidationError({'ids': 'Ids must be integers.'}) from error
+        if len(ids) + len(slugs) > self.max_lookups:
+            raise ValidationError(
+                {'error': f'No more than {self.max_lookups} vehicles '
+                          'can be looked up at once.'}
+            )
+        return Response(vehicle_status_map.lookup(ids=ids, slugs=slugs))
+
+
 @csrf_exempt
 def stripe_webhook(request):
     payload = request.body
@@ -60,62 +200,44 @@ def stripe_webhook(request):
         )
     except ValueError:
         # Invalid payload
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
     except stripe.error.SignatureVerificationError:
         # Invalid signature
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-
-    if event["type"] == "payment_intent.succeeded":
-        intent = event['data']['object']
-        reservation_id = intent["metadata"]["reservation_id"]
-        payment_amount = intent["amount"]
-
-        vehicle = get_object_or_404(Vehicle, id=reservation.vehicle.id)
-        vehicle.reserved = "2"
-        vehicle.save()
-        reservation = get_object_or_404(Reservation, order_id=reservation_id)
-        reservation.paid = True
-        reservation.paymentIntent_id = intent["id"]
-        reservation.save()
-
-        if TradeIn.objects.filter(reservation__order_id=reservation_id).exists():
-            tradein = TradeIn.objects.get(reservation__order_id=reservation_id)
-            send_reservation_email(
-                reservation=reservation,
-                res_amount=payment_amount,
-                tradein=tradein
-            )
-        else:
-            send_reservation_email(
-                reservation=reservation,
-                res_amount=payment_amount
-            )
-        send_new_reservation_email(reservation.vehicle)
-    return Response(status=status.HTTP_200_OK)
+        return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+
+    # Acknowledged once stored; the process_stripe_events worker handles
+    # it, so slow work never makes Stripe time out and deliver it again.
+    record_event(event)
+    return HttpResponse(status=status.HTTP_200_OK)
 
 
 class StripePaymentIntentReserveVehicle(APIView):
     def post(self, request, vehicle_id):
         try:
-            vehicle = get_object_or_404(Vehicle, id=vehicle_id)
-
-            if not vehicle.is_for_sale():
-                return Response(
-                    {'error': "Vehicle is not for sale therefore can't be reserved."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            resvervations_data = request.data.copy()
-            tradein_data = resvervations_data.pop('tradein', None)
-            reservation_serializer = ReserveVehicleSerializer(
-                data=request.data, many=False)
-            reservation_serializer.is_valid(raise_exception=True)
-            reservation = reservation_serializer.save(vehicle=vehicle)
-
-            if tradein_data:
-                tradein_serializer = TradeInSerializer(
-                    data=tradein_data, many=False)
-                tradein_serializer.is_valid(raise_exception=True)
-                tradein_serializer.save(reservation=reservation)
+            with transaction.atomic():
+                # Buyers of the same vehicle queue on its row, so only the
+                # first finds it for sale and puts it on hold.
+                vehicle = get_object_or_404(
+                    Vehicle.objects.select_for_update(), id=vehicle_id)
+
+                if not vehicle.is_for_sale():
+                    return Response(
+                        {'error': "Vehicle is not for sale therefore can't be reserved."},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                resvervations_data = request.data.copy()
+                tradein_data = resvervations_data.pop('tradein', None)
+                reservation_serializer = ReserveVehicleSerializer(
+                    data=request.data, many=False)
+                reservation_serializer.is_valid(raise_exception=True)
+                reservation = reservation_serializer.save(vehicle=vehicle)
+
+                if tradein_data:
+                    tradein_serializer = TradeInSerializer(
+                        data=tradein_data, many=False)
+                    tradein_serializer.is_valid(raise_exception=True)
+                    tradein_serializer.save(reservation=reservation)
+                vehicle.hold(reservation)
 
             intent = stripe.PaymentIntent.create(
                 currency='gbp',
@@ -133,6 +255,7 @@ class StripePaymentIntentReserveVehicle(APIView):
             )
 
         except stripe.error.StripeError as error:
+            vehicle.release_hold()
             return Response(
                 {'error': str(error)},
                 status=status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,150 @@
+import datetime
+import logging
+
+import stripe
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Reservation, StripeEvent, TradeIn, Vehicle
+from .utils import send_new_reservation_email, send_reservation_email
+
+logger = logging.getLogger(__name__)
+
+# A failing event is retried after 30 seconds, doubling up to an hour,
+# and given up on after MAX_ATTEMPTS.
+MAX_ATTEMPTS = 10
+RETRY_DELAY = datetime.timedelta(seconds=30)
+MAX_RETRY_DELAY = datetime.timedelta(hours=1)
+
+
+def payment_intent_succeeded(event):
+    intent = event['data']['object']
+    reservation_id = intent['metadata']['reservation_id']
+    payment_amount = intent['amount']
+
+    reservation = Reservation.objects.get(order_id=reservation_id)
+    vehicle = Vehicle.objects.select_for_update().filter(
+        id=reservation.vehicle_id).first()
+    reservation.paymentIntent_id = intent['id']
+    if vehicle is None or not vehicle.can_be_paid_for_by(reservation):
+        # The buyer paid after their hold expired and someone else has
+        # reserved the vehicle or is paying for it since.
+        logger.warning(
+            'Refunding the payment for reservation %s, whose vehicle is '
+            'no longer available.',
+            reservation_id
+        )
+        stripe.Refund.create(
+            payment_intent=intent['id'],
+            idempotency_key=f'refund-{intent["id"]}'
+        )
+        reservation.save()
+        return
+    vehicle.reserved = '2'
+    vehicle.hold_reservation = None
+    vehicle.hold_expires = None
+    vehicle.save()
+    reservation.paid = True
+    reservation.save()
+
+    tradein = TradeIn.objects.filter(reservation=reservation).first()
+    send_reservation_email(
+        reservation=reservation,
+        res_amount=payment_amount,
+        tradein=tradein
+    )
+    send_new_reservation_email(reservation.vehicle)
+
+
+HANDLERS = {
+    'payment_intent.succeeded': payment_intent_succeeded,
+}
+
+
+def record_event(event):
+    """Store a verified webhook ``event``. A delivery of an event that has
+    already been received is ignored."""
+    data_object = event.get('data', {}).get('object', {})
+    StripeEvent.objects.bulk_create([
+        StripeEvent(
+            event_id=event['id'],
+            type=event['type'],
+            object_id=data_object.get('id', ''),
+            payload=event,
+            created=datetime.datetime.fromtimestamp(
+                event['created'], tz=datetime.timezone.utc)
+        )
+    ], ignore_conflicts=True)
+
+
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def process_next_event():
+    """Handle the oldest event that is due, returning False if there is
+    none.
+
+    Events about the same Stripe object are handled in the order Stripe
+    created them: while one waits to be retried, the later ones wait with
+    it. Events about different objects do not hold each other up, and
+    once an event is given up on, the later ones are handled.
+
+    The event row stays locked while it is handled and is marked processed
+    in the same transaction as the handler's changes, so each event takes
+    effect once. Events locked by another worker are skipped. A handler
+    that raises has its changes rolled back and the event is tried again
+    later.
+    """
+    earlier_pending = StripeEvent.objects.filter(
+        Q(created__lt=OuterRef('created')) |
+        Q(created=OuterRef('created'), id__lt=OuterRef('id')),
+        object_id=OuterRef('object_id'),
+        processed_at__isnull=True,
+        next_attempt_at__isnull=False
+    ).exclude(object_id='')
+    with transaction.atomic():
+        event = StripeEvent.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            next_attempt_at__lte=timezone.now()
+        ).exclude(
+            Exists(earlier_pending)
+        ).order_by('created', 'id').first()
+        if event is None:
+            return False
+
+        event.attempts += 1
+        try:
+            with transaction.atomic():
+                handler = HANDLERS.get(event.type)
+                if handler is not None:
+                    handler(event.payload)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception(
+                'Could not handle Stripe event %s, attempt %s.',
+                event.event_id,
+                event.attempts
+            )
+            event.last_error = f'{type(error).__name__}: {error}'
+            event.next_attempt_at = None
+            if event.attempts < MAX_ATTEMPTS:
+                event.next_attempt_at = timezone.now() + \
+                    retry_delay(event.attempts)
+        else:
+            event.processed_at = timezone.now()
+            event.next_attempt_at = None
+            event.last_error = ''
+        event.save()
+    return True
+
+
+def process_events():
+    """Handle every event that is due, oldest first, and return how many
+    were attempted."""
+    count = 0
+    while process_next_event():
+        count += 1
+    return count